@@ -0,0 +1,506 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Engine Context - Long-lived shared state for the MCP server
+
+Every tool call used to build its world from scratch: a new ElementDB (with
+DDL), a new IntelligentGenerator (new connection, knowledge rebuilt), another
+connection for stats. The server now builds one EngineContext at startup:
+
+- a small SQLite connection pool
+- an in-memory element index grouped by (domain, category), score-ordered
+- the compiled framework plan, knowledge and rule engine (hot-reloaded)
+- a shared prompt composer
+- session-scoped element handles (query results referenced by short IDs)
+- framework-driven generators (one per DB worker thread) for in-process pipelines
+- a tool scheduler (DB / remote thread pools, per-tool concurrency limits)
+- the library version (change counter, else the database file stamp):
+  invalidates the element index and cached stats, versions stats ETags
+- a metrics registry (tool latencies, DB statement counts, cache hit ratios)
+- a background job queue for long-running generation (SQLite job table)
+- the library writer (saved prompts, usage stats); in the pre-forked HTTP
+  mode writer and job queue are proxies to a single writer process
+
+Tools obtain it through get_engine(); set_engine() swaps it (tests, embedding).
+warm_up() loads everything before the server accepts requests; preload() loads
+the read-only part (element index, compiled plan) in a parent process before
+it forks workers.
+"""
+
+import json
+import logging
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+# Add project root to path for imports
+_PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, _PROJECT_ROOT)
+
+from skill_library.constants import DEFAULT_DB_PATH, DEFAULT_FRAMEWORK_PATH, DEFAULT_KNOWLEDGE_PATH
+from skill_library.element_db import ensure_change_counter, library_stamp
+from skill_library.reload_manager import ReloadManager
+from mcp_server.scheduler import DEFAULT_REMOTE_WORKERS, ToolScheduler
+from mcp_server.handles import HandleRegistry
+from mcp_server.metrics import MetricsRegistry
+from mcp_server.jobs import DEFAULT_JOB_WORKERS, DEFAULT_JOBS_DB_PATH, JobManager, JobStore
+from mcp_server.writer import LibraryWriter
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_POOL_SIZE = 4
+
+
+class ConnectionPool:
+    """Fixed-size pool of SQLite connections shareable across threads."""
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH, size: int = DEFAULT_POOL_SIZE):
+        """
+        Args:
+            db_path: Database path
+            size: Number of connections
+        """
+        self.db_path = db_path
+        self.size = max(1, size)
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._all: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+
+        # Statements executed on pooled connections
+        self.queries = 0
+        self._queries_lock = threading.Lock()
+
+    def _count_query(self, statement: str):
+        with self._queries_lock:
+            self.queries += 1
+
+    def _connect(self) -> Optional[sqlite3.Connection]:
+        """Open a new connection if the pool is not full yet."""
+        with self._lock:
+            if len(self._all) >= self.size:
+                return None
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.set_trace_callback(self._count_query)
+            self._all.append(conn)
+            return conn
+
+    def open(self):
+        """Open all connections up front."""
+        while True:
+            conn = self._connect()
+            if conn is None:
+                return
+            self._idle.put(conn)
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Borrow a connection (blocks while all connections are in use)."""
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = self._connect() or self._idle.get()
+        try:
+            yield conn
+        finally:
+            self._idle.put(conn)
+
+    def close(self):
+        """Close every connection."""
+        with self._lock:
+            conns, self._all = self._all, []
+        for conn in conns:
+            conn.close()
+        self._idle = queue.LifoQueue()
+
+
+class ElementIndex:
+    """
+    In-memory view of the elements table grouped by (domain, category).
+
+    Each group is ordered like `ORDER BY reusability_score DESC` (NULL scores
+    last, ties by rowid). Element dicts are shared and must be treated as
+    read-only.
+    """
+
+    COLUMNS = ('element_id', 'name', 'chinese_name', 'ai_prompt_template',
+               'keywords', 'reusability_score', 'category_id', 'domain_id')
+
+    def __init__(self, groups: Dict[Tuple[str, str], Tuple[Dict, ...]]):
+        self.groups = groups
+        self.by_id = {e['element_id']: e for elements in groups.values() for e in elements}
+        self.loaded_at = time.time()
+
+    @classmethod
+    def load(cls, conn: sqlite3.Connection) -> 'ElementIndex':
+        """Read the whole elements table in one query."""
+        rows = conn.execute(f"""
+            SELECT {', '.join(cls.COLUMNS)}
+            FROM elements
+            ORDER BY domain_id, category_id,
+                     reusability_score IS NULL, reusability_score DESC, rowid
+        """).fetchall()
+
+        groups: Dict[Tuple[str, str], List[Dict]] = {}
+        for row in rows:
+            element = dict(zip(cls.COLUMNS, row))
+            try:
+                element['keywords'] = json.loads(element['keywords']) if element['keywords'] else []
+            except (ValueError, TypeError):
+                element['keywords'] = []
+            groups.setdefault((element['domain_id'], element['category_id']), []).append(element)
+
+        return cls({key: tuple(elements) for key, elements in groups.items()})
+
+    def __len__(self) -> int:
+        return sum(len(elements) for elements in self.groups.values())
+
+    def get(self, element_id: str) -> Optional[Dict]:
+        """Element by element_id (None when unknown)."""
+        return self.by_id.get(element_id)
+
+    def top(self, domain: str, category: str, limit: Optional[int] = None) -> Tuple[Dict, ...]:
+        """Highest-scored elements of a (domain, category); falsy limit returns all."""
+        elements = self.groups.get((domain, category), ())
+        return elements[:limit] if limit else elements
+
+
+class EngineContext:
+    """Connection pool, element index, framework plan, knowledge, composer and scheduler."""
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH,
+                 framework_path: str = DEFAULT_FRAMEWORK_PATH,
+                 knowledge_path: Optional[str] = DEFAULT_KNOWLEDGE_PATH,
+                 pool_size: int = DEFAULT_POOL_SIZE,
+                 remote_workers: int = DEFAULT_REMOTE_WORKERS,
+                 tool_limits: Optional[Dict[str, int]] = None,
+                 stats_ttl: Optional[float] = None,
+                 jobs_db_path: str = DEFAULT_JOBS_DB_PATH,
+                 job_workers: int = DEFAULT_JOB_WORKERS,
+                 job_runners: Optional[Dict] = None):
+        """
+        Args:
+            db_path: Database path
+            framework_path: Framework file (portrait domain)
+            knowledge_path: Optional knowledge override file
+            pool_size: Number of pooled SQLite connections (and DB worker threads)
+            remote_workers: Threads for remote generation
+            tool_limits: Max concurrent calls per tool (None uses the defaults)
+            stats_ttl: Seconds cached library stats stay valid even when the
+                library did not change (None: until the next change)
+            jobs_db_path: Background job table file
+            job_workers: Background jobs run concurrently
+            job_runners: Job kind → callable (None: real image/PPT generators)
+        """
+        self.db_path = db_path
+        self.pool = ConnectionPool(db_path, pool_size)
+        self.reload_manager = ReloadManager(framework_path, knowledge_path)
+        self.scheduler = ToolScheduler(self.pool.size, remote_workers, tool_limits)
+        self.handles = HandleRegistry()
+        self.stats_ttl = stats_ttl
+        self.metrics = MetricsRegistry()
+        self.metrics.register_gauge('db', lambda: {'queries': self.pool.queries, 'pool_size': self.pool.size})
+        self.metrics.register_cache('element_handles', self.handles.cache_info)
+        self.metrics.register_cache('library_stats', _library_stats_cache_info)
+
+        self._index: Optional[ElementIndex] = None
+        # Library version the index was loaded at (reloaded when it changes)
+        self._index_version = None
+        self._index_lock = threading.Lock()
+        self._composer = None
+        self._composer_version = None
+        self._generators = None
+        self._jobs: Optional[JobManager] = None
+        self.jobs_db_path = jobs_db_path
+        self.job_workers = job_workers
+        self.job_runners = job_runners
+        self._writer: Optional[LibraryWriter] = None
+        self._remote_writer = False
+        self._lock = threading.Lock()
+
+        self.warm_up_timings: Dict[str, float] = {}
+
+    # ========== Shared state ==========
+
+    @property
+    def snapshot(self):
+        """Current framework plan + knowledge + rule engine snapshot."""
+        return self.reload_manager.snapshot
+
+    @property
+    def plan(self):
+        return self.snapshot.framework_plan
+
+    @property
+    def knowledge(self) -> Dict:
+        return self.snapshot.knowledge
+
+    @property
+    def rule_engine(self):
+        return self.snapshot.rule_engine
+
+    @property
+    def index(self) -> ElementIndex:
+        """
+        Element index (loaded on first use if warm_up() was skipped).
+
+        Reloaded when library_version() moves on from the version it was
+        loaded at, so elements added after warm-up or preload show up.
+        """
+        version = self.library_version()
+        if self._index is None or self._index_version != version:
+            with self._index_lock:
+                if self._index is None or self._index_version != version:
+                    self.refresh_index(version)
+        return self._index
+
+    def refresh_index(self, version: Optional[Union[int, str]] = None) -> ElementIndex:
+        """
+        Reload the element index from the database and swap it in.
+
+        Args:
+            version: Library version read before loading (read here if None)
+        """
+        if version is None:
+            version = self.library_version()
+        with self.pool.connection() as conn:
+            index = ElementIndex.load(conn)
+        # Index first: a reader that sees the new version never gets the old index
+        self._index = index
+        self._index_version = version
+        return index
+
+    # ========== Library version ==========
+
+    def install_change_counter(self) -> bool:
+        """
+        Make sure the database maintains its change counter (table + triggers).
+
+        A one-time schema migration of the database file, run only on request
+        (server --install-change-counter); warm-up and preload never change
+        the schema.
+
+        Returns:
+            False when it cannot be installed (e.g. read-only database); the
+            library version then falls back to the database file stamp
+        """
+        try:
+            with self.pool.connection() as conn:
+                ensure_change_counter(conn)
+        except sqlite3.Error as e:
+            logger.warning("⚠️ 无法安装库变更计数（改用数据库文件时间戳）: %s", e)
+            return False
+        return True
+
+    def library_version(self) -> Union[int, str]:
+        """
+        Opaque token that changes whenever the element library changes.
+
+        The change counter when installed (one indexed SELECT), otherwise the
+        mtime and size of the database file and its WAL; the file stamp also
+        moves on writes that leave elements alone (e.g. saved prompts).
+        """
+        with self.pool.connection() as conn:
+            return library_stamp(conn, self.db_path)
+
+    @property
+    def composer(self):
+        """Shared IntelligentGenerator used for prompt composition (follows hot reloads)."""
+        snapshot = self.snapshot
+        if self._composer is None or self._composer_version != snapshot.version:
+            with self._lock:
+                if self._composer is None:
+                    from skill_library.intelligent_generator import IntelligentGenerator
+                    self._composer = IntelligentGenerator(self.db_path, check_same_thread=False,
+                                                          knowledge=snapshot.knowledge)
+                elif self._composer_version != snapshot.version:
+                    self._composer.set_knowledge(snapshot.knowledge)
+                self._composer_version = snapshot.version
+        return self._composer
+
+    @property
+    def generators(self):
+        """
+        AsyncIntelligentGenerator for full framework-driven pipelines.
+
+        Each of its pool_size worker threads owns a connection and a
+        per-domain framework router; workers follow hot reloads.
+        """
+        if self._generators is None:
+            with self._lock:
+                if self._generators is None:
+                    from skill_library.async_generator import AsyncIntelligentGenerator
+                    self._generators = AsyncIntelligentGenerator(
+                        self.db_path, self.reload_manager.framework_path,
+                        max_workers=self.pool.size, reload_manager=self.reload_manager
+                    )
+        return self._generators
+
+    @property
+    def jobs(self) -> JobManager:
+        """Background job queue (job table opened on first use)."""
+        if self._jobs is None:
+            with self._lock:
+                if self._jobs is None:
+                    self._jobs = JobManager(JobStore(self.jobs_db_path), self.job_workers,
+                                            self.job_runners)
+        return self._jobs
+
+    @property
+    def writer(self) -> LibraryWriter:
+        """Write-side operations (saved prompts, usage stats)."""
+        if self._writer is None:
+            with self._lock:
+                if self._writer is None:
+                    self._writer = LibraryWriter(self.db_path)
+        return self._writer
+
+    def use_writer(self, writer, jobs):
+        """
+        Route writes and background jobs to another process.
+
+        Args:
+            writer: LibraryWriter proxy
+            jobs: JobManager proxy (owned, resumed and shut down by the writer process)
+        """
+        self._writer = writer
+        self._jobs = jobs
+        self._remote_writer = True
+
+    # ========== Lifecycle ==========
+
+    def warm_up(self) -> Dict[str, float]:
+        """
+        Load everything a tool call may need before serving requests.
+
+        Returns:
+            Per-phase timings in milliseconds
+        """
+        timings = {}
+
+        def phase(name, fn):
+            start = time.perf_counter()
+            fn()
+            timings[name] = (time.perf_counter() - start) * 1000
+
+        phase('pool', self.pool.open)
+        # Already loaded when the index was preloaded before fork
+        phase('element_index', lambda: self.index)
+        phase('plan', lambda: self.snapshot.rule_engine)
+        phase('composer', lambda: self.composer)
+
+        self.warm_up_timings = timings
+        return timings
+
+    def preload(self) -> Dict[str, float]:
+        """
+        Load the read-only state in a parent process that is about to fork.
+
+        The element index and compiled plan are plain Python objects the
+        children share copy-on-write; connections are closed again (SQLite
+        handles must not cross fork) and no threads are started. Children call
+        start(), which reopens connections and skips what is already loaded.
+
+        Returns:
+            Per-phase timings in milliseconds
+        """
+        timings = {}
+        for name, fn in (('element_index', self.refresh_index),
+                         ('plan', lambda: self.snapshot.rule_engine)):
+            start = time.perf_counter()
+            fn()
+            timings[name] = (time.perf_counter() - start) * 1000
+        self.pool.close()
+        return timings
+
+    def start(self):
+        """Warm up, start background reload polling and requeue unfinished jobs."""
+        self.warm_up()
+        self.reload_manager.start()
+        if not self._remote_writer:
+            requeued = self.jobs.resume()
+            if requeued:
+                logger.info("Requeued %d background job(s)", requeued)
+
+    def close(self):
+        """Stop polling and worker threads, release connections."""
+        self.reload_manager.stop()
+        self.metrics.stop_dump()
+        self.scheduler.shutdown()
+        if self._jobs is not None and not self._remote_writer:
+            # Do not wait for running generations; the next start marks them failed
+            self._jobs.shutdown(wait=False)
+        self._jobs = None
+        self._writer = None
+        if self._generators is not None:
+            self._generators.close()
+            self._generators = None
+        if self._composer is not None:
+            self._composer.close()
+            self._composer = None
+        self.pool.close()
+
+    def stats(self) -> Dict:
+        """Engine state summary (plan version, index size, warm-up timings)."""
+        return {
+            'plan': self.reload_manager.stats(),
+            'element_index': {
+                'version': self._index_version,
+                'elements': len(self._index) if self._index is not None else None,
+                'groups': len(self._index.groups) if self._index is not None else None,
+                'loaded_at': self._index.loaded_at if self._index is not None else None,
+            },
+            'pool_size': self.pool.size,
+            # Whether the library version comes from the change counter (not the file stamp)
+            'change_counter': isinstance(self._index_version, int) if self._index is not None else None,
+            'scheduler': self.scheduler.stats(),
+            'handles': self.handles.stats(),
+            'jobs': self._jobs.stats() if self._jobs is not None else None,
+            'writer': self._writer.stats() if self._writer is not None else None,
+            'warm_up_ms': dict(self.warm_up_timings),
+        }
+
+
+def _library_stats_cache_info() -> Dict:
+    from mcp_server.tools.element_query import stats_cache_info
+    return stats_cache_info()
+
+
+# ============================================================
+# Dependency-injection hook
+# ============================================================
+
+_engine: Optional[EngineContext] = None
+_engine_lock = threading.Lock()
+
+
+def get_engine() -> EngineContext:
+    """Return the shared engine context (created with defaults on first use)."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = EngineContext()
+    return _engine
+
+
+def set_engine(engine: Optional[EngineContext]) -> Optional[EngineContext]:
+    """
+    Replace the shared engine context.
+
+    Args:
+        engine: New context (None resets to lazy default creation)
+
+    Returns:
+        The previous context (not closed)
+    """
+    global _engine
+    with _engine_lock:
+        previous, _engine = _engine, engine
+    return previous
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Element Handles - Session-scoped references to elements the server returned
+
+check_element_consistency and compose_final_prompt used to require the client
+to echo back full element dicts (templates, keywords, ...) that the server had
+just produced. query_prompt_elements now registers its results in a per-session
+cache and tags each element with a short handle ("e1", "e2", ...); downstream
+tools accept handles or element_ids and resolve them server-side (session cache
+first, then the engine's element index).
+
+Short handles only mean something to the process and session that issued
+them. With stateless streamable HTTP (pre-forked workers, no session kept
+between requests) the registry hands out element_ids as handles instead; they
+resolve through the element index in any worker.
+"""
+
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+
+DEFAULT_HANDLE_CAPACITY = 512
+
+
+class ElementHandleCache:
+    """LRU map of short handles (and element_ids) to elements for one session."""
+
+    def __init__(self, capacity: int = DEFAULT_HANDLE_CAPACITY, element_id_handles: bool = False):
+        """
+        Args:
+            capacity: Maximum number of elements kept (least recently used dropped)
+            element_id_handles: Use the element_id as the handle (stateless
+                transports); elements without one still get a short handle
+        """
+        self.capacity = max(1, capacity)
+        self.element_id_handles = element_id_handles
+        self._elements: "OrderedDict[str, Dict]" = OrderedDict()
+        self._handle_of: Dict[str, str] = {}
+        self._counter = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._elements)
+
+    def register(self, element: Dict) -> str:
+        """Store an element and return its handle (re-registering keeps the handle)."""
+        element_id = element.get('element_id')
+        with self._lock:
+            handle = self._handle_of.get(element_id) if element_id else None
+            if handle is None:
+                if self.element_id_handles and element_id:
+                    handle = element_id
+                else:
+                    self._counter += 1
+                    handle = f"e{self._counter:x}"
+                if element_id:
+                    self._handle_of[element_id] = handle
+            self._elements[handle] = element
+            self._elements.move_to_end(handle)
+
+            while len(self._elements) > self.capacity:
+                _, dropped = self._elements.popitem(last=False)
+                self._handle_of.pop(dropped.get('element_id'), None)
+        return handle
+
+    def get(self, ref: str) -> Optional[Dict]:
+        """Element for a handle or element_id (None when not cached)."""
+        with self._lock:
+            handle = ref if ref in self._elements else self._handle_of.get(ref)
+            if handle is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._elements.move_to_end(handle)
+            return self._elements[handle]
+
+
+class HandleRegistry:
+    """One ElementHandleCache per client session (dropped with the session)."""
+
+    def __init__(self, capacity: int = DEFAULT_HANDLE_CAPACITY, element_id_handles: bool = False):
+        """
+        Args:
+            capacity: Per-session cache capacity
+            element_id_handles: Hand out element_ids as handles (see use_element_id_handles)
+        """
+        self.capacity = capacity
+        self.element_id_handles = element_id_handles
+        self._sessions: "weakref.WeakKeyDictionary[object, ElementHandleCache]" = weakref.WeakKeyDictionary()
+        self._default = ElementHandleCache(capacity, element_id_handles)
+        self._lock = threading.Lock()
+
+    def use_element_id_handles(self, enabled: bool = True):
+        """
+        Switch between short per-session handles and element_id handles.
+
+        Stateless transports need element_ids: a later request may reach
+        another worker process or arrive without the session that issued a
+        short handle. Existing caches are dropped.
+        """
+        with self._lock:
+            self.element_id_handles = enabled
+            self._sessions = weakref.WeakKeyDictionary()
+            self._default = ElementHandleCache(self.capacity, enabled)
+
+    def for_session(self, session: Optional[object] = None) -> ElementHandleCache:
+        """
+        Cache for a session object (None → shared cache for calls without a session).
+        """
+        if session is None:
+            return self._default
+        with self._lock:
+            cache = self._sessions.get(session)
+            if cache is None:
+                cache = self._sessions[session] = ElementHandleCache(self.capacity,
+                                                                     self.element_id_handles)
+            return cache
+
+    def stats(self) -> Dict:
+        return {
+            'sessions': len(self._sessions),
+            'capacity': self.capacity,
+            'element_id_handles': self.element_id_handles,
+            'default_cached': len(self._default),
+        }
+
+    def cache_info(self) -> Dict:
+        """Lookup hits/misses summed over the default and live session caches."""
+        with self._lock:
+            caches = [self._default, *self._sessions.values()]
+        return {
+            'hits': sum(cache.hits for cache in caches),
+            'misses': sum(cache.misses for cache in caches),
+            'entries': sum(len(cache) for cache in caches),
+        }
+
+
+def resolve_refs(refs: List, cache: ElementHandleCache, engine=None,
+                 format_element=None) -> Tuple[List[Dict], List[str]]:
+    """
+    Resolve a mixed list of element dicts and string references.
+
+    Args:
+        refs: Element dicts (kept as-is) and handles / element_ids
+        cache: Session cache consulted first
+        engine: Optional EngineContext whose element index resolves element_ids
+            not in the cache
+        format_element: Turns an index element into tool output format
+
+    Returns:
+        (elements in input order, unresolved references)
+    """
+    elements, missing = [], []
+    index = None
+    for ref in refs:
+        if isinstance(ref, dict):
+            elements.append(ref)
+            continue
+        ref = str(ref).strip()
+        element = cache.get(ref)
+        if element is None and engine is not None:
+            # One version check per call, not per reference
+            if index is None:
+                index = engine.index
+            indexed = index.get(ref)
+            if indexed is not None:
+                element = format_element(indexed) if format_element else indexed
+        if element is None:
+            missing.append(ref)
+        else:
+            elements.append(element)
+    return elements, missing
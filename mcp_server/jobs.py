@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Background Jobs - SQLite-backed job queue for long-running generation
+
+generate_ai_image and nanobanana_ppt_generator hold the tool call open until
+every image is rendered (minutes for a 4K deck). Submitting a job instead
+returns a job id immediately; a small worker pool runs the generation and the
+job table records status and result, so clients can disconnect and poll (or
+cancel) later.
+
+Job states: queued → running → succeeded / failed / cancelled.
+
+- A queued job is cancelled immediately; a running remote call cannot be
+  interrupted, so the cancel is recorded and its result discarded.
+- On startup (resume) jobs left queued by a previous process are requeued,
+  jobs left running are marked failed, and finished jobs past the retention
+  period are deleted.
+
+Runners are plain callables keyed by job kind. The defaults wrap the image and
+PPT tools; stand_in_runners() provides local generators for testing.
+"""
+
+import inspect
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from skill_library.constants import DEFAULT_CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_JOBS_DB_PATH = os.path.join(DEFAULT_CACHE_DIR, "jobs.db")
+DEFAULT_JOB_WORKERS = 2
+# Finished jobs older than this are deleted on startup (seconds)
+DEFAULT_JOB_RETENTION = 7 * 24 * 3600
+
+JOB_STATES = ('queued', 'running', 'succeeded', 'failed', 'cancelled')
+FINISHED_STATES = ('succeeded', 'failed', 'cancelled')
+
+
+# ============================================================
+# Runners
+# ============================================================
+
+def _run_image(prompt: str, output_path: Optional[str] = None,
+               aspect_ratio: str = "1:1", resolution: str = "2K") -> Dict:
+    from mcp_server.tools.image_generator import generate_image
+    return generate_image(prompt=prompt, output_path=output_path,
+                          aspect_ratio=aspect_ratio, resolution=resolution)
+
+
+def _run_ppt(description: str, pages: int = 5, style: str = "gradient-glass",
+             resolution: str = "2K") -> Any:
+    from mcp_server.tools.ppt_skill import generate_ppt
+    from mcp_server.tools.pipeline import stdout_to_stderr
+    # The NanoBanana scripts print progress; keep it off the stdio transport
+    with stdout_to_stderr():
+        output = generate_ppt(description, pages, style, resolution)
+    try:
+        return json.loads(output)
+    except (TypeError, ValueError):
+        return output
+
+
+def default_runners() -> Dict[str, Callable]:
+    """Job kinds backed by the real generators."""
+    return {'image': _run_image, 'ppt': _run_ppt}
+
+
+def stand_in_runners(delay: float = 0.5) -> Dict[str, Callable]:
+    """
+    Local generators with the real runners' parameters (no API calls).
+
+    Args:
+        delay: Seconds each stand-in job takes (per slide for ppt)
+    """
+    def image(prompt: str, output_path: Optional[str] = None,
+              aspect_ratio: str = "1:1", resolution: str = "2K") -> Dict:
+        time.sleep(delay)
+        return {"status": "success", "stand_in": True, "path": output_path,
+                "prompt": prompt, "aspect_ratio": aspect_ratio, "resolution": resolution}
+
+    def ppt(description: str, pages: int = 5, style: str = "gradient-glass",
+            resolution: str = "2K") -> Dict:
+        slides = []
+        for n in range(1, pages + 1):
+            time.sleep(delay)
+            slides.append({"slide_number": n, "status": "success"})
+        return {"status": "success", "stand_in": True, "description": description,
+                "style": style, "resolution": resolution, "slides": slides}
+
+    return {'image': image, 'ppt': ppt}
+
+
+# ============================================================
+# Job table
+# ============================================================
+
+class JobStore:
+    """Job table in its own SQLite file (one connection, serialized by a lock)."""
+
+    def __init__(self, db_path: str = DEFAULT_JOBS_DB_PATH):
+        self.db_path = db_path
+        if db_path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                params TEXT NOT NULL,
+                status TEXT NOT NULL,
+                result TEXT,
+                error TEXT,
+                cancel_requested INTEGER DEFAULT 0,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL
+            )
+            """)
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, created_at)")
+            self.conn.commit()
+
+    def _execute(self, sql: str, args: tuple = ()) -> int:
+        with self._lock:
+            cursor = self.conn.execute(sql, args)
+            self.conn.commit()
+            return cursor.rowcount
+
+    def insert(self, job_id: str, kind: str, params: Dict):
+        self._execute(
+            "INSERT INTO jobs (job_id, kind, params, status, created_at) VALUES (?, ?, ?, 'queued', ?)",
+            (job_id, kind, json.dumps(params, ensure_ascii=False), time.time())
+        )
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self.conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def list(self, status: Optional[str] = None, limit: int = 20) -> List[Dict]:
+        sql = "SELECT * FROM jobs"
+        args: tuple = ()
+        if status:
+            sql += " WHERE status = ?"
+            args = (status,)
+        sql += " ORDER BY created_at DESC LIMIT ?"
+        with self._lock:
+            return [dict(row) for row in self.conn.execute(sql, args + (limit,))]
+
+    def mark_running(self, job_id: str) -> bool:
+        """queued → running (False if the job was cancelled meanwhile)."""
+        return self._execute(
+            "UPDATE jobs SET status = 'running', started_at = ? WHERE job_id = ? AND status = 'queued'",
+            (time.time(), job_id)
+        ) == 1
+
+    def finish(self, job_id: str, status: str, result: Any = None, error: Optional[str] = None):
+        """running → succeeded / failed (→ cancelled if a cancel was requested)."""
+        self._execute(
+            """UPDATE jobs SET
+                   status = CASE WHEN cancel_requested THEN 'cancelled' ELSE ? END,
+                   result = CASE WHEN cancel_requested THEN NULL ELSE ? END,
+                   error = ?, finished_at = ?
+               WHERE job_id = ? AND status = 'running'""",
+            (status, json.dumps(result, ensure_ascii=False) if result is not None else None,
+             error, time.time(), job_id)
+        )
+
+    def cancel(self, job_id: str) -> Optional[str]:
+        """Cancel a queued job or flag a running one; returns the resulting status."""
+        with self._lock:
+            self.conn.execute(
+                "UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE job_id = ? AND status = 'queued'",
+                (time.time(), job_id)
+            )
+            self.conn.execute(
+                "UPDATE jobs SET cancel_requested = 1 WHERE job_id = ? AND status = 'running'",
+                (job_id,)
+            )
+            self.conn.commit()
+            row = self.conn.execute("SELECT status FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return row[0] if row else None
+
+    def recover(self, retention: float) -> List[str]:
+        """
+        Clean up after a previous process.
+
+        Returns:
+            Ids of queued jobs to requeue
+        """
+        now = time.time()
+        with self._lock:
+            self.conn.execute(
+                """UPDATE jobs SET status = 'failed', error = '服务器重启时任务中断', finished_at = ?
+                   WHERE status = 'running'""",
+                (now,)
+            )
+            self.conn.execute(
+                f"DELETE FROM jobs WHERE status IN ({','.join('?' * len(FINISHED_STATES))}) AND finished_at < ?",
+                FINISHED_STATES + (now - retention,)
+            )
+            self.conn.commit()
+            rows = self.conn.execute(
+                "SELECT job_id FROM jobs WHERE status = 'queued' ORDER BY created_at"
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self.conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+# ============================================================
+# Job manager
+# ============================================================
+
+class JobManager:
+    """Submits jobs to the table and runs them on a worker pool."""
+
+    def __init__(self, store: JobStore, workers: int = DEFAULT_JOB_WORKERS,
+                 runners: Optional[Dict[str, Callable]] = None,
+                 retention: float = DEFAULT_JOB_RETENTION):
+        """
+        Args:
+            store: Job table
+            workers: Jobs run concurrently
+            runners: Job kind → callable(**params) (None uses default_runners())
+            retention: Seconds finished jobs are kept (applied by resume())
+        """
+        self.store = store
+        self.workers = max(1, workers)
+        self.runners = dict(default_runners() if runners is None else runners)
+        self.retention = retention
+
+        self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='engine-jobs')
+        self._futures: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, kind: str, params: Optional[Dict] = None) -> Dict:
+        """
+        Queue a job.
+
+        Raises:
+            ValueError: Unknown kind or parameters the runner does not accept
+        """
+        runner = self.runners.get(kind)
+        if runner is None:
+            raise ValueError(f"未知的任务类型: {kind}（可用: {', '.join(sorted(self.runners))}）")
+        params = dict(params or {})
+        try:
+            inspect.signature(runner).bind(**params)
+        except TypeError as e:
+            raise ValueError(f"任务参数无效: {e}") from None
+
+        job_id = uuid.uuid4().hex[:12]
+        self.store.insert(job_id, kind, params)
+        self._schedule(job_id)
+        return self.status(job_id)
+
+    def _schedule(self, job_id: str):
+        with self._lock:
+            self._futures[job_id] = self._executor.submit(self._run, job_id)
+
+    def _run(self, job_id: str):
+        try:
+            if not self.store.mark_running(job_id):
+                return
+            job = self.store.get(job_id)
+            try:
+                result = self.runners[job['kind']](**json.loads(job['params']))
+            except Exception as e:
+                logger.warning("Job %s (%s) failed: %s", job_id, job['kind'], e)
+                self.store.finish(job_id, 'failed', error=f"{type(e).__name__}: {e}")
+            else:
+                self.store.finish(job_id, 'succeeded', result=result)
+        finally:
+            with self._lock:
+                self._futures.pop(job_id, None)
+
+    def status(self, job_id: str) -> Optional[Dict]:
+        """Job state without the result (None for unknown ids)."""
+        job = self.store.get(job_id)
+        if job is None:
+            return None
+        status = {
+            'job_id': job['job_id'],
+            'kind': job['kind'],
+            'status': job['status'],
+            'created_at': job['created_at'],
+            'started_at': job['started_at'],
+            'finished_at': job['finished_at'],
+        }
+        if job['started_at']:
+            status['elapsed_s'] = round((job['finished_at'] or time.time()) - job['started_at'], 3)
+        if job['cancel_requested'] and job['status'] == 'running':
+            status['cancel_requested'] = True
+        if job['error']:
+            status['error'] = job['error']
+        return status
+
+    def result(self, job_id: str) -> Optional[Dict]:
+        """Job state plus its result once succeeded."""
+        job = self.store.get(job_id)
+        if job is None:
+            return None
+        output = self.status(job_id)
+        if job['result'] is not None:
+            output['result'] = json.loads(job['result'])
+        return output
+
+    def cancel(self, job_id: str) -> Optional[Dict]:
+        """Cancel a queued job, or request cancellation of a running one."""
+        if self.store.cancel(job_id) is None:
+            return None
+        with self._lock:
+            future = self._futures.get(job_id)
+            if future is not None and future.cancel():
+                del self._futures[job_id]
+        return self.status(job_id)
+
+    def list(self, status: Optional[str] = None, limit: int = 20) -> List[Dict]:
+        return [self.status(job['job_id']) for job in self.store.list(status, limit)]
+
+    def resume(self) -> int:
+        """Requeue jobs left queued by a previous process; returns how many."""
+        job_ids = self.store.recover(self.retention)
+        for job_id in job_ids:
+            self._schedule(job_id)
+        return len(job_ids)
+
+    def shutdown(self, wait: bool = True):
+        """
+        Stop the workers; queued jobs stay queued for the next resume().
+
+        Without wait, running jobs are abandoned (the next resume() marks
+        them failed) and the table stays open for them.
+        """
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+        if wait:
+            self.store.close()
+
+    def stats(self) -> Dict:
+        return {
+            'workers': self.workers,
+            'kinds': sorted(self.runners),
+            'active': len(self._futures),
+            'jobs': self.store.counts(),
+        }
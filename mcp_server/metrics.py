@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Metrics - In-process latency / throughput registry for the MCP server
+
+Every tool and resource call is timed (see `timed` in server.py): call and
+error counts, a window of recent latencies for p50/p95/p99, and call rates.
+Other components register sources that are read when a snapshot is taken:
+gauges (e.g. pooled DB statement counts) and caches (hits / misses, reported
+with a hit ratio).
+
+The snapshot is served as the `elements://metrics` resource and can be
+written to a local JSON file periodically (start_dump).
+"""
+
+import json
+import logging
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+# Latency samples kept per tool (most recent calls)
+DEFAULT_SAMPLE_SIZE = 2048
+PERCENTILES = (50, 95, 99)
+DEFAULT_DUMP_INTERVAL = 60.0
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    """Nearest-rank percentile of an ascending list (0.0 when empty)."""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, math.ceil(p / 100 * len(sorted_values)) - 1)
+    return sorted_values[rank]
+
+
+class ToolMetrics:
+    """Counters and recent latency samples of one tool."""
+
+    __slots__ = ('calls', 'errors', 'total_seconds', 'max_seconds', 'samples', 'last_error')
+
+    def __init__(self, sample_size: int):
+        self.calls = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        # (finished_at, seconds)
+        self.samples: deque = deque(maxlen=sample_size)
+        self.last_error: Optional[str] = None
+
+    def summary(self, uptime: float, now: float) -> Dict:
+        latencies = sorted(seconds for _, seconds in self.samples)
+        result = {
+            'calls': self.calls,
+            'errors': self.errors,
+            'error_rate': round(self.errors / self.calls, 4) if self.calls else 0.0,
+            'calls_per_second': round(self.calls / uptime, 4) if uptime else None,
+            'calls_last_minute': sum(1 for finished, _ in self.samples if now - finished <= 60),
+            'latency_ms': {
+                'avg': round(self.total_seconds / self.calls * 1000, 3) if self.calls else 0.0,
+                **{f'p{p}': round(percentile(latencies, p) * 1000, 3) for p in PERCENTILES},
+                'max': round(self.max_seconds * 1000, 3),
+                'samples': len(latencies),
+            },
+        }
+        if self.last_error:
+            result['last_error'] = self.last_error
+        return result
+
+
+class MetricsRegistry:
+    """Per-tool call metrics plus registered gauge and cache sources."""
+
+    def __init__(self, sample_size: int = DEFAULT_SAMPLE_SIZE):
+        """
+        Args:
+            sample_size: Latency samples kept per tool for percentiles
+        """
+        self.sample_size = max(1, sample_size)
+        self.started_at = time.time()
+
+        self._tools: Dict[str, ToolMetrics] = {}
+        self._gauges: Dict[str, Callable[[], object]] = {}
+        self._caches: Dict[str, Callable[[], Dict]] = {}
+        self._lock = threading.Lock()
+
+        self._dump_thread: Optional[threading.Thread] = None
+        self._dump_stop = threading.Event()
+        self.dump_path: Optional[str] = None
+
+    # ========== Recording ==========
+
+    def record(self, tool: str, seconds: float, error: Optional[str] = None):
+        """Record one finished call."""
+        now = time.time()
+        with self._lock:
+            metrics = self._tools.get(tool)
+            if metrics is None:
+                metrics = self._tools[tool] = ToolMetrics(self.sample_size)
+            metrics.calls += 1
+            metrics.total_seconds += seconds
+            if seconds > metrics.max_seconds:
+                metrics.max_seconds = seconds
+            metrics.samples.append((now, seconds))
+            if error is not None:
+                metrics.errors += 1
+                metrics.last_error = error
+
+    @contextmanager
+    def time_call(self, tool: str) -> Iterator[None]:
+        """Time the enclosed call; an exception counts as an error (and propagates)."""
+        start = time.perf_counter()
+        error = None
+        try:
+            yield
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            self.record(tool, time.perf_counter() - start, error)
+
+    # ========== Sources ==========
+
+    def register_gauge(self, name: str, source: Callable[[], object]):
+        """Value (number or dict) read on every snapshot."""
+        self._gauges[name] = source
+
+    def register_cache(self, name: str, source: Callable[[], Dict]):
+        """Cache whose source returns at least {'hits', 'misses'}."""
+        self._caches[name] = source
+
+    # ========== Snapshot ==========
+
+    def snapshot(self) -> Dict:
+        """All metrics as a JSON-serializable dict."""
+        now = time.time()
+        uptime = now - self.started_at
+        with self._lock:
+            tools = {name: metrics.summary(uptime, now) for name, metrics in sorted(self._tools.items())}
+
+        caches = {}
+        for name, source in self._caches.items():
+            info = dict(source())
+            lookups = info.get('hits', 0) + info.get('misses', 0)
+            info['hit_ratio'] = round(info.get('hits', 0) / lookups, 4) if lookups else None
+            caches[name] = info
+
+        return {
+            'started_at': self.started_at,
+            'uptime_s': round(uptime, 3),
+            'tools': tools,
+            'gauges': {name: source() for name, source in self._gauges.items()},
+            'caches': caches,
+        }
+
+    # ========== Periodic dump ==========
+
+    def dump(self, path: str):
+        """Write the current snapshot to a JSON file (atomically replaced)."""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.snapshot(), f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+    def start_dump(self, path: str, interval: float = DEFAULT_DUMP_INTERVAL):
+        """Write a snapshot to path every interval seconds (and once more on stop)."""
+        self.stop_dump()
+        self.dump_path = path
+        self._dump_stop.clear()
+
+        def run():
+            while not self._dump_stop.wait(interval):
+                try:
+                    self.dump(path)
+                except OSError as e:
+                    logger.warning("Failed to write metrics to %s: %s", path, e)
+
+        self._dump_thread = threading.Thread(target=run, name='metrics-dump', daemon=True)
+        self._dump_thread.start()
+
+    def stop_dump(self):
+        """Stop the periodic dump, writing a final snapshot."""
+        if self._dump_thread is None:
+            return
+        self._dump_stop.set()
+        self._dump_thread.join()
+        self._dump_thread = None
+        try:
+            self.dump(self.dump_path)
+        except OSError as e:
+            logger.warning("Failed to write metrics to %s: %s", self.dump_path, e)
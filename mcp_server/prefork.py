@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Pre-forked HTTP Serving - N worker processes sharing one listening socket
+
+Over stdio one process serves one client. For a team deployment the server
+can listen over HTTP instead:
+
+1. start the writer process (saved prompts, usage stats, background jobs)
+2. preload the read-only state (element index, compiled framework plan) and
+   freeze it out of the garbage collector, so the forked workers share those
+   pages copy-on-write instead of each loading (and dirtying) a copy
+3. bind the socket, fork N workers; each opens its own SQLite connections,
+   connects to the writer and runs uvicorn on the inherited socket
+
+The kernel spreads connections across workers, so throughput scales with
+cores. A worker that dies after running for a while is restarted; SIGINT /
+SIGTERM stop the workers, then the writer.
+
+Requests of one MCP session may land on different workers, so multi-worker
+mode needs a stateless transport (streamable HTTP with stateless_http); SSE
+sessions live in one process. Nothing session-scoped survives between
+stateless requests, so element handles are element_ids in that mode.
+"""
+
+import gc
+import logging
+import os
+import signal
+import socket
+import time
+from typing import Callable, Dict, Optional
+
+from mcp_server.writer import connect_writer, start_writer
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8000
+# Workers that die sooner than this after starting are not restarted (crash loop)
+MIN_WORKER_LIFETIME = 5.0
+
+
+def bind_socket(host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, backlog: int = 2048) -> socket.socket:
+    """Listening socket inherited by every worker."""
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _run_worker(number: int, sock: socket.socket, engine, app_factory: Callable,
+                writer_address: str, writer_authkey: bytes, log_level: str,
+                worker_init: Optional[Callable[[int], None]]):
+    import uvicorn
+
+    # uvicorn installs its own handlers for a graceful shutdown
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+    writer, jobs = connect_writer(writer_address, writer_authkey)
+    engine.use_writer(writer, jobs)
+    engine.start()
+    if worker_init is not None:
+        worker_init(number)
+    logger.info("Worker %d (pid %d) ready", number, os.getpid())
+
+    try:
+        server = uvicorn.Server(uvicorn.Config(app_factory(), log_level=log_level))
+        server.run(sockets=[sock])
+    finally:
+        engine.close()
+
+
+def serve(app_factory: Callable, engine, workers: int = 1,
+          host: str = DEFAULT_HOST, port: int = DEFAULT_PORT,
+          stand_in_jobs: bool = False, log_level: str = "info",
+          worker_init: Optional[Callable[[int], None]] = None):
+    """
+    Serve an ASGI app from pre-forked worker processes.
+
+    Args:
+        app_factory: Builds the ASGI app; called in each worker after fork
+        engine: EngineContext used by the app's tools (preloaded here, started
+            in each worker)
+        workers: Number of worker processes
+        host: Bind address
+        port: Bind port
+        stand_in_jobs: Run background jobs with local stand-in generators
+        log_level: uvicorn log level
+        worker_init: Optional callback(worker_number) run in each worker
+            after its engine started
+    """
+    import uvicorn  # noqa: F401  (fail before forking when it is missing)
+
+    workers = max(1, workers)
+    manager, address, authkey = start_writer(engine.db_path, engine.jobs_db_path,
+                                             engine.job_workers, stand_in_jobs)
+
+    timings = engine.preload()
+    logger.info("Preloaded before fork: %s",
+                ', '.join(f'{k} {v:.1f}ms' for k, v in timings.items()))
+    # Keep preloaded objects out of GC passes so workers do not touch their pages
+    gc.freeze()
+
+    sock = bind_socket(host, port)
+    logger.info("Listening on %s:%d with %d worker(s)", host, port, workers)
+
+    children: Dict[int, tuple] = {}
+
+    def spawn(number: int):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                _run_worker(number, sock, engine, app_factory, address, authkey,
+                            log_level, worker_init)
+            except BaseException:
+                logger.exception("Worker %d failed", number)
+                code = 1
+            finally:
+                os._exit(code)
+        children[pid] = (number, time.monotonic())
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    try:
+        for number in range(workers):
+            spawn(number)
+
+        # Poll our own children only (the writer process is a child too)
+        while children:
+            for pid in list(children):
+                done, status = os.waitpid(pid, os.WNOHANG)
+                if not done:
+                    continue
+                number, started = children.pop(pid)
+                if stopping:
+                    continue
+                if time.monotonic() - started < MIN_WORKER_LIFETIME:
+                    logger.error("Worker %d exited right after starting (status %d); not restarting",
+                                 number, status)
+                    continue
+                logger.warning("Worker %d exited (status %d); restarting", number, status)
+                spawn(number)
+            time.sleep(0.2)
+    finally:
+        sock.close()
+        manager.shutdown()
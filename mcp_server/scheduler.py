@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tool Scheduler - Thread pools and concurrency limits for async MCP tools
+
+The MCP tools are `async def`; blocking work must not run on the event loop,
+otherwise one slow call (a Gemini image, a multi-slide PPT) stalls every other
+request. The scheduler offers two bounded executors:
+
+- db: SQLite reads/writes (sized to the connection pool, so a worker never
+  waits for a connection)
+- remote: long-running remote generation (Gemini image, PPT rendering)
+
+plus a per-tool asyncio.Semaphore so a burst of expensive calls queues up
+instead of saturating the remote pool. Cheap in-memory tools run inline.
+"""
+
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, Optional
+
+
+DEFAULT_REMOTE_WORKERS = 4
+
+# Maximum concurrent calls per tool (tools not listed are unlimited)
+DEFAULT_TOOL_LIMITS = {
+    'generate_ai_image': 2,
+    'nanobanana_ppt_generator': 1,
+    'batch_generate_prompts': 2,
+    'get_library_stats': 4,
+}
+
+
+class ToolScheduler:
+    """DB / remote executors plus per-tool concurrency limits."""
+
+    def __init__(self, db_workers: int, remote_workers: int = DEFAULT_REMOTE_WORKERS,
+                 tool_limits: Optional[Dict[str, int]] = None):
+        """
+        Args:
+            db_workers: Threads for SQLite work
+            remote_workers: Threads for remote generation
+            tool_limits: Max concurrent calls per tool name
+        """
+        self.db_workers = max(1, db_workers)
+        self.remote_workers = max(1, remote_workers)
+        self.tool_limits = dict(DEFAULT_TOOL_LIMITS if tool_limits is None else tool_limits)
+
+        self._db: Optional[ThreadPoolExecutor] = None
+        self._remote: Optional[ThreadPoolExecutor] = None
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._waiting: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    # ========== Executors ==========
+
+    @property
+    def db_executor(self) -> ThreadPoolExecutor:
+        if self._db is None:
+            with self._lock:
+                if self._db is None:
+                    self._db = ThreadPoolExecutor(self.db_workers, thread_name_prefix='engine-db')
+        return self._db
+
+    @property
+    def remote_executor(self) -> ThreadPoolExecutor:
+        if self._remote is None:
+            with self._lock:
+                if self._remote is None:
+                    self._remote = ThreadPoolExecutor(self.remote_workers,
+                                                      thread_name_prefix='engine-remote')
+        return self._remote
+
+    async def run_db(self, fn: Callable, *args, **kwargs) -> Any:
+        """Run blocking SQLite work on the DB pool."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.db_executor, functools.partial(fn, *args, **kwargs))
+
+    async def run_remote(self, fn: Callable, *args, **kwargs) -> Any:
+        """Run blocking remote generation on the remote pool."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.remote_executor, functools.partial(fn, *args, **kwargs))
+
+    # ========== Concurrency limits ==========
+
+    def semaphore(self, tool: str) -> Optional[asyncio.Semaphore]:
+        """Semaphore enforcing the tool's limit (None when unlimited)."""
+        limit = self.tool_limits.get(tool)
+        if not limit:
+            return None
+        sem = self._semaphores.get(tool)
+        if sem is None:
+            sem = self._semaphores.setdefault(tool, asyncio.Semaphore(limit))
+        return sem
+
+    @asynccontextmanager
+    async def slot(self, tool: str) -> AsyncIterator[None]:
+        """Hold one of the tool's concurrency slots (waits while the tool is at its limit)."""
+        sem = self.semaphore(tool)
+        if sem is None:
+            yield
+            return
+        self._waiting[tool] = self._waiting.get(tool, 0) + 1
+        try:
+            await sem.acquire()
+        finally:
+            self._waiting[tool] -= 1
+        try:
+            yield
+        finally:
+            sem.release()
+
+    # ========== Lifecycle ==========
+
+    def shutdown(self, wait: bool = True):
+        """Stop both executors (new calls recreate them)."""
+        with self._lock:
+            executors, self._db, self._remote = (self._db, self._remote), None, None
+        for executor in executors:
+            if executor is not None:
+                executor.shutdown(wait=wait, cancel_futures=True)
+
+    def stats(self) -> Dict:
+        """Pool sizes, tool limits and calls currently waiting for a slot."""
+        return {
+            'db_workers': self.db_workers,
+            'remote_workers': self.remote_workers,
+            'tool_limits': dict(self.tool_limits),
+            'waiting': {name: n for name, n in self._waiting.items() if n},
+        }
@@ -11,18 +11,25 @@ Usage:
     
     Or with uvx:
     uvx mcp run python -m mcp_server.server
+
+    HTTP for a team (pre-forked workers sharing the preloaded library):
+    python -m mcp_server.server --transport http --workers 4 --port 8000
 """
 
 import sys
 import os
+import argparse
 import json
-from typing import Optional
+import functools
+import logging
+from typing import List, Optional
 
 # Add project root to path
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-sys.path.insert(0, PROJECT_ROOT)
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
 
-from mcp.server.fastmcp import FastMCP
+from mcp.server.fastmcp import Context, FastMCP
 
 # Import tools
 from mcp_server.tools.intent_parser import parse_intent, format_intent_json
@@ -30,13 +37,27 @@ from mcp_server.tools.element_query import (
     query_elements, 
     query_by_field, 
     get_domain_stats,
+    register_elements,
+    load_element_refs,
     format_elements_json,
-    format_stats_json
+    format_stats_json,
+    parse_fields
 )
 from mcp_server.tools.consistency_checker import check_consistency, format_report, format_report_json
 from mcp_server.tools.prompt_composer import compose_prompt, format_prompt_output
 from mcp_server.tools.ppt_skill import generate_ppt
 from mcp_server.tools.image_generator import generate_image, format_result_json
+from mcp_server.tools.json_output import dumps
+from mcp_server.tools.pipeline import (
+    stdout_to_stderr,
+    generate_prompt as run_pipeline,
+    batch_generate_prompts as run_batch_pipeline,
+    format_pipeline_json
+)
+from mcp_server.engine import EngineContext, get_engine, set_engine
+from mcp_server.jobs import stand_in_runners
+from mcp_server.metrics import DEFAULT_DUMP_INTERVAL
+from mcp_server.prefork import DEFAULT_HOST, DEFAULT_PORT
 
 # Import prompts
 from mcp_server.prompts.portrait import generate_portrait_prompt_sop, generate_cinematic_portrait_sop
@@ -50,13 +71,94 @@ mcp = FastMCP(
     instructions="智能AI图像提示词生成器 - 基于1140+元素的专业提示词生成系统"
 )
 
+# Shared engine context (connection pool, element index, framework plan,
+# knowledge, composer, scheduler). Tools obtain it through get_engine(); main()
+# warms it up before serving and starts hot-reload polling.
+#
+# Tools are async: in-memory work (intent parsing, index lookups, consistency
+# checks, composition) runs inline; SQLite work goes to the scheduler's DB pool
+# and remote generation to its remote pool, so a long Gemini/PPT job never
+# blocks cheap calls.
+#
+# Every tool and resource is @timed into the engine's metrics registry
+# (elements://metrics). Logging goes to stderr; stdout belongs to the stdio
+# transport.
+
+logger = logging.getLogger("mcp_server")
+
+
+def timed(fn):
+    """Record the call's latency and outcome in the engine's metrics (keyed by function name)."""
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        with get_engine().metrics.time_call(fn.__name__):
+            return await fn(*args, **kwargs)
+    return wrapper
+
+
+def limited(fn):
+    """Apply the scheduler's per-tool concurrency limit (keyed by function name)."""
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        async with get_engine().scheduler.slot(fn.__name__):
+            return await fn(*args, **kwargs)
+    return wrapper
+
+
+def _stats_with_plan(domain: Optional[str] = None, compact: bool = False,
+                     if_none_match: str = "") -> str:
+    """
+    Library stats plus the currently loaded framework/knowledge plan version.
+
+    The ETag combines the library version and the plan version; when it
+    equals if_none_match only {"not_modified": true, "etag": ...} is returned.
+    """
+    engine = get_engine()
+    version = engine.library_version()
+    etag = f"{version}-{engine.snapshot.version}"
+    if if_none_match and if_none_match == etag:
+        return format_stats_json({'not_modified': True, 'etag': etag}, compact)
+
+    stats = get_domain_stats(domain, engine=engine, ttl=engine.stats_ttl, version=version)
+    stats['plan'] = engine.reload_manager.stats()
+    stats['etag'] = etag
+    return format_stats_json(stats, compact)
+
+
+def _session_handles(ctx: Optional[Context]):
+    """Element handle cache of the calling client session."""
+    session = None
+    if ctx is not None:
+        try:
+            session = ctx.session
+        except ValueError:
+            # Called outside a request (no session)
+            pass
+    return get_engine().handles.for_session(session)
+
+
+def _load_elements(elements_json: str, ctx: Optional[Context]):
+    """Resolve an elements argument (dicts, handles or element_ids); returns (elements, error)."""
+    try:
+        return load_element_refs(elements_json, _session_handles(ctx), engine=get_engine()), None
+    except json.JSONDecodeError as e:
+        return None, f"JSON解析错误: {e}"
+    except KeyError as e:
+        return None, f"未知的元素句柄或ID: {e.args[0]}"
+
+
+async def _stats_with_plan_async(domain: Optional[str] = None, compact: bool = False,
+                                 if_none_match: str = "") -> str:
+    return await get_engine().scheduler.run_db(_stats_with_plan, domain, compact, if_none_match)
+
 
 # ============================================================
 # Atomic Tools
 # ============================================================
 
 @mcp.tool()
-def parse_user_intent(user_request: str, domain: str = "auto") -> str:
+@timed
+async def parse_user_intent(user_request: str, domain: str = "auto", compact: bool = False) -> str:
     """
     解析用户的自然语言描述，提取结构化的生成意图。
     
@@ -65,6 +167,7 @@ def parse_user_intent(user_request: str, domain: str = "auto") -> str:
     Args:
         user_request: 用户的描述，如"电影级的亚洲女性，张艺谋风格"
         domain: 领域提示 (portrait/art/design/product/video/auto)
+        compact: 紧凑JSON（无缩进）
     
     Returns:
         JSON格式的Intent结构，包含主体、风格、光影等信息
@@ -73,57 +176,77 @@ def parse_user_intent(user_request: str, domain: str = "auto") -> str:
         parse_user_intent("生成电影级的亚洲女性，张艺谋风格")
     """
     intent = parse_intent(user_request, domain)
-    return format_intent_json(intent)
+    return format_intent_json(intent, compact)
 
 
 @mcp.tool()
-def query_prompt_elements(
+@timed
+async def query_prompt_elements(
     domain: str,
     category: str,
     keywords: str = "",
-    limit: int = 10
+    limit: int = 10,
+    fields: str = "",
+    compact: bool = False,
+    short_keys: bool = False,
+    ctx: Context = None
 ) -> str:
     """
     从Universal Elements Library（1140+元素）查询匹配的元素。
     
     这是工作流的第二步，用于获取候选元素。
+    每个元素带有会话内有效的短句柄（handle，如"e1"），后续工具可直接传句柄。
     
     Args:
         domain: 领域 (portrait/art/design/product/video/common)
         category: 类别 (makeup_styles/lighting_techniques/clothing_styles等)
         keywords: 搜索关键词，用逗号分隔，如"traditional,chinese"
         limit: 返回数量限制，默认10
+        fields: 只返回这些字段，逗号分隔，如"handle,chinese_name,relevance_score"
+            （可用: handle/element_id/name/chinese_name/template/keywords/reusability_score/relevance_score）
+        compact: 紧凑JSON（无缩进），适合大量调用
+        short_keys: 使用短字段名（h/id/n/cn/t/kw/rs/rel）
     
     Returns:
-        JSON格式的候选元素列表，每个元素包含ID、名称、模板、评分等
+        JSON格式的候选元素列表，每个元素包含句柄、ID、名称、模板、评分等
     
     Example:
         query_prompt_elements("portrait", "makeup_styles", "traditional,chinese", 5)
     """
+    try:
+        field_list = parse_fields(fields)
+    except ValueError as e:
+        return str(e)
+
     kw_list = [k.strip() for k in keywords.split(',')] if keywords else None
-    elements = query_elements(domain, category, kw_list, limit)
-    return format_elements_json(elements)
+    elements = query_elements(domain, category, kw_list, limit, engine=get_engine())
+    elements = register_elements(elements, _session_handles(ctx))
+    return format_elements_json(elements, compact, field_list, short_keys)
 
 
 @mcp.tool()
-def check_element_consistency(elements_json: str, intent_json: str) -> str:
+@timed
+async def check_element_consistency(elements_json: str, intent_json: str, ctx: Context = None) -> str:
     """
     检查元素组合的一致性，识别冲突并提供修正建议。
     
     这是工作流的第三步，用于验证选择的元素是否协调。
     
     Args:
-        elements_json: 已选择的元素列表，JSON格式
+        elements_json: 已选择的元素：句柄/element_id列表（如'["e1","e4"]'或"e1,e4"），
+            或完整的元素JSON列表
         intent_json: 用户意图结构，JSON格式（来自parse_user_intent）
     
     Returns:
         一致性报告，包含问题数量、严重程度、具体问题和修正建议
     
     Example:
-        check_element_consistency('[{"element_id":"..."}]', '{"subject":{"ethnicity":"East_Asian"}}')
+        check_element_consistency('["e1","e4"]', '{"subject":{"ethnicity":"East_Asian"}}')
     """
+    elements, error = _load_elements(elements_json, ctx)
+    if error:
+        return error
     try:
-        elements = json.loads(elements_json)
         intent = json.loads(intent_json)
     except json.JSONDecodeError as e:
         return f"JSON解析错误: {e}"
@@ -133,10 +256,12 @@ def check_element_consistency(elements_json: str, intent_json: str) -> str:
 
 
 @mcp.tool()
-def compose_final_prompt(
+@timed
+async def compose_final_prompt(
     elements_json: str,
     mode: str = "auto",
-    subject_desc: str = ""
+    subject_desc: str = "",
+    ctx: Context = None
 ) -> str:
     """
     将选中的元素组合成完整的AI图像提示词。
@@ -144,7 +269,7 @@ def compose_final_prompt(
     这是工作流的最后一步，生成可直接使用的提示词。
     
     Args:
-        elements_json: 元素列表，JSON格式
+        elements_json: 句柄/element_id列表（如'["e1","e4"]'或"e1,e4"），或完整的元素JSON列表
         mode: 组合模式 (simple/auto/detailed)，默认auto
         subject_desc: 可选的主体描述覆盖，如"A young woman"
     
@@ -152,19 +277,99 @@ def compose_final_prompt(
         完整的英文AI图像提示词
     
     Example:
-        compose_final_prompt('[{"template":"cinematic lighting..."}]', "auto")
+        compose_final_prompt("e1,e4,e7", "auto")
     """
-    try:
-        elements = json.loads(elements_json)
-    except json.JSONDecodeError as e:
-        return f"JSON解析错误: {e}"
+    elements, error = _load_elements(elements_json, ctx)
+    if error:
+        return error
     
-    prompt = compose_prompt(elements, mode=mode, subject_desc=subject_desc)
+    prompt = compose_prompt(elements, mode=mode, subject_desc=subject_desc,
+                            generator=get_engine().composer)
     return format_prompt_output(prompt, len(elements))
 
 
 @mcp.tool()
-def get_library_stats(domain: str = "") -> str:
+@timed
+async def generate_prompt(
+    user_request: str,
+    domain: str = "auto",
+    mode: str = "auto",
+    trace: bool = False
+) -> str:
+    """
+    一步生成完整提示词（解析 → 选择元素 → 一致性检查 → 修正 → 组合）。
+    
+    在服务器内部完成整个工作流，替代依次调用 parse_user_intent、
+    query_prompt_elements、check_element_consistency、compose_final_prompt，
+    元素数据不需要在客户端和服务器之间来回传递。
+    
+    Args:
+        user_request: 用户的描述，如"电影级的亚洲女性，张艺谋风格"
+        domain: 领域提示 (portrait/art/design/product/video/auto)
+        mode: 组合模式 (simple/auto/detailed)，默认auto
+        trace: 是否返回各步骤的简要记录（intent、所选元素ID、问题、修正、耗时）
+    
+    Returns:
+        JSON格式的结果：prompt、domain、elements_used（trace=True 时附带 trace）
+    
+    Example:
+        generate_prompt("生成电影级的亚洲女性，张艺谋风格", trace=True)
+    """
+    output = await run_pipeline(user_request, domain, mode, trace, engine=get_engine())
+    return format_pipeline_json(output)
+
+
+@mcp.tool()
+@timed
+@limited
+async def batch_generate_prompts(
+    descriptions: List[str],
+    domain: str = "auto",
+    mode: str = "auto",
+    ctx: Context = None
+) -> str:
+    """
+    批量生成提示词（每条描述执行一次 generate_prompt 的完整流程）。
+    
+    相同（规范化后一致）的描述只生成一次，整批共享一次候选元素预取，
+    在工作线程池中并行执行；每完成一条就通过进度通知和日志消息推送结果。
+    
+    Args:
+        descriptions: 描述列表，如["电影级的亚洲女性", "中国水墨画山水"]
+        domain: 领域提示，应用于所有描述 (portrait/art/design/product/video/auto)
+        mode: 组合模式 (simple/auto/detailed)，默认auto
+    
+    Returns:
+        JSON格式的结果：results（按输入顺序）和 stats（去重数量、预取耗时、总耗时、吞吐量）
+    
+    Example:
+        batch_generate_prompts(["古装汉服少女", "Bento Grid玻璃态海报"])
+    """
+    total = len(descriptions)
+    done = 0
+    notify = ctx is not None
+
+    async def stream(indices, output):
+        nonlocal done, notify
+        done += len(indices)
+        if not notify:
+            return
+        try:
+            await ctx.report_progress(done, total)
+            await ctx.info(format_pipeline_json({'indices': indices, **output}))
+        except Exception as e:
+            # Outside a request or the client went away: finish the batch without notifications
+            notify = False
+            logger.warning("batch_generate_prompts: progress notifications stopped: %s", e)
+
+    output = await run_batch_pipeline(descriptions, domain, mode, engine=get_engine(), on_result=stream)
+    return format_pipeline_json(output)
+
+
+@mcp.tool()
+@timed
+@limited
+async def get_library_stats(domain: str = "", compact: bool = False, if_none_match: str = "") -> str:
     """
     获取元素库的统计信息，帮助了解可用资源。
     
@@ -172,23 +377,27 @@ def get_library_stats(domain: str = "") -> str:
     
     Args:
         domain: 特定领域（留空返回全部统计）
+        compact: 紧凑JSON（无缩进）
+        if_none_match: 上次返回的 etag；元素库和框架都未变化时只返回 {"not_modified": true, "etag": ...}
     
     Returns:
-        JSON格式的统计信息，包含总元素数和各领域分布
+        JSON格式的统计信息，包含总元素数、各领域分布和 etag
     
     Example:
         get_library_stats("portrait")
     """
-    stats = get_domain_stats(domain if domain else None)
-    return format_stats_json(stats)
+    return await _stats_with_plan_async(domain if domain else None, compact, if_none_match)
 
 
 @mcp.tool()
-def nanobanana_ppt_generator(
+@timed
+@limited
+async def nanobanana_ppt_generator(
     description: str, 
     pages: int = 5, 
     style: str = "gradient-glass", 
-    resolution: str = "2K"
+    resolution: str = "2K",
+    background: bool = False
 ) -> str:
     """
     Generate professional PPT images using Nano Banana Pro.
@@ -201,19 +410,30 @@ def nanobanana_ppt_generator(
         pages: Number of slides (default: 5).
         style: Visual style ('gradient-glass' or 'vector-illustration').
         resolution: Image resolution ('2K' or '4K').
+        background: Return a job id immediately and render in the background
+            (poll with get_job_status / get_job_result).
         
     Returns:
-        JSON string containing the output directory and slide details.
+        JSON string containing the output directory and slide details
+        (or the queued job).
     """
-    return generate_ppt(description, pages, style, resolution)
+    if background:
+        return await _submit_job('ppt', {'description': description, 'pages': pages,
+                                         'style': style, 'resolution': resolution})
+    # The NanoBanana scripts print progress; keep it off the stdio transport
+    with stdout_to_stderr():
+        return await get_engine().scheduler.run_remote(generate_ppt, description, pages, style, resolution)
 
 
 @mcp.tool()
-def generate_ai_image(
+@timed
+@limited
+async def generate_ai_image(
     prompt: str,
     output_dir: str = "",
     aspect_ratio: str = "1:1",
-    resolution: str = "2K"
+    resolution: str = "2K",
+    background: bool = False
 ) -> str:
     """
     使用 Gemini 3 Pro 生成 AI 图片。
@@ -225,9 +445,10 @@ def generate_ai_image(
         output_dir: 输出目录路径（可选，默认为 outputs/）
         aspect_ratio: 宽高比 - "1:1", "16:9", "9:16", "4:3", "3:4"
         resolution: 分辨率 - "2K" 或 "4K"
+        background: 立即返回任务ID，在后台生成（用 get_job_status / get_job_result 查询）
     
     Returns:
-        JSON 格式的生成结果，包含图片路径或错误信息
+        JSON 格式的生成结果，包含图片路径或错误信息（后台模式返回任务信息）
     
     Example:
         generate_ai_image("A beautiful sunset, cinematic lighting", aspect_ratio="16:9")
@@ -243,7 +464,12 @@ def generate_ai_image(
     else:
         output_path = None  # Let generate_image auto-generate
     
-    result = generate_image(
+    if background:
+        return await _submit_job('image', {'prompt': prompt, 'output_path': output_path,
+                                           'aspect_ratio': aspect_ratio, 'resolution': resolution})
+    
+    result = await get_engine().scheduler.run_remote(
+        generate_image,
         prompt=prompt,
         output_path=output_path,
         aspect_ratio=aspect_ratio,
@@ -252,6 +478,147 @@ def generate_ai_image(
     
     return format_result_json(result)
 
+
+@mcp.tool()
+@timed
+async def save_prompt(
+    prompt: str,
+    user_request: str,
+    elements_json: str = "[]",
+    style_tag: str = "",
+    quality_score: float = 9.0,
+    ctx: Context = None
+) -> str:
+    """
+    保存生成的提示词，并更新所用元素的使用统计（prompt-analyzer 的数据来源）。
+    
+    Args:
+        prompt: 最终提示词
+        user_request: 用户的原始需求
+        elements_json: 使用的元素（句柄、element_id 或完整元素JSON）
+        style_tag: 风格标签（可选）
+        quality_score: 质量评分（默认9.0）
+    
+    Returns:
+        JSON格式的结果，包含 prompt_id
+    """
+    elements, error = _load_elements(elements_json, ctx)
+    if error:
+        return error
+
+    engine = get_engine()
+    index = engine.index
+    elements_used = []
+    for elem in elements:
+        indexed = index.get(elem.get('element_id')) or {}
+        elements_used.append({
+            'element_id': elem.get('element_id'),
+            'category': elem.get('category') or indexed.get('category_id'),
+            'field_name': elem.get('field_name', ''),
+        })
+
+    prompt_id = await engine.scheduler.run_db(
+        engine.writer.save_prompt, prompt, user_request, elements_used,
+        style_tag or None, quality_score
+    )
+    return dumps({"prompt_id": prompt_id, "elements": len(elements_used)})
+
+
+# ============================================================
+# Background Jobs
+# ============================================================
+
+async def _submit_job(kind: str, params: dict) -> str:
+    try:
+        job = await get_engine().scheduler.run_db(get_engine().jobs.submit, kind, params)
+    except ValueError as e:
+        return dumps({"error": str(e)})
+    return dumps(job)
+
+
+async def _job_call(method: str, job_id: str) -> str:
+    job = await get_engine().scheduler.run_db(getattr(get_engine().jobs, method), job_id)
+    if job is None:
+        return dumps({"error": f"未知的任务ID: {job_id}"})
+    return dumps(job)
+
+
+@mcp.tool()
+@timed
+async def submit_job(kind: str, params_json: str = "{}") -> str:
+    """
+    提交后台生成任务，立即返回任务ID（客户端断开后任务继续执行）。
+    
+    Args:
+        kind: 任务类型 - "image"（参数同 generate_ai_image：prompt, output_path, aspect_ratio, resolution）
+              或 "ppt"（参数同 nanobanana_ppt_generator：description, pages, style, resolution）
+        params_json: JSON格式的任务参数
+    
+    Returns:
+        JSON格式的任务信息（job_id, status）
+    
+    Example:
+        submit_job("image", '{"prompt": "A beautiful sunset", "aspect_ratio": "16:9"}')
+    """
+    try:
+        params = json.loads(params_json) if params_json else {}
+    except json.JSONDecodeError as e:
+        return dumps({"error": f"JSON解析错误: {e}"})
+    if not isinstance(params, dict):
+        return dumps({"error": "params_json 必须是JSON对象"})
+    return await _submit_job(kind, params)
+
+
+@mcp.tool()
+@timed
+async def get_job_status(job_id: str = "", status: str = "", limit: int = 20) -> str:
+    """
+    查询后台任务状态（queued / running / succeeded / failed / cancelled）。
+    
+    Args:
+        job_id: 任务ID（留空列出最近的任务）
+        status: 列出任务时按状态过滤
+        limit: 列出任务的最大数量
+    
+    Returns:
+        JSON格式的任务状态（不含结果）
+    """
+    if job_id:
+        return await _job_call('status', job_id)
+    jobs = await get_engine().scheduler.run_db(get_engine().jobs.list, status or None, limit)
+    return dumps({"jobs": jobs})
+
+
+@mcp.tool()
+@timed
+async def get_job_result(job_id: str) -> str:
+    """
+    获取后台任务的结果（任务成功后包含 result 字段）。
+    
+    Args:
+        job_id: 任务ID
+    
+    Returns:
+        JSON格式的任务状态和结果
+    """
+    return await _job_call('result', job_id)
+
+
+@mcp.tool()
+@timed
+async def cancel_job(job_id: str) -> str:
+    """
+    取消后台任务：排队中的任务立即取消；正在执行的远程调用无法中断，完成后丢弃结果并标记为 cancelled。
+    
+    Args:
+        job_id: 任务ID
+    
+    Returns:
+        JSON格式的任务状态
+    """
+    return await _job_call('cancel', job_id)
+
+
 # ============================================================
 # Orchestration Prompts
 # ============================================================
@@ -356,10 +723,24 @@ def glassmorphism_generator(description: str) -> str:
 # ============================================================
 
 @mcp.resource("elements://stats")
-def resource_stats() -> str:
-    """获取元素库统计信息"""
-    stats = get_domain_stats()
-    return format_stats_json(stats)
+@timed
+async def resource_stats() -> str:
+    """获取元素库统计信息（含当前加载的框架/知识库版本）"""
+    return await _stats_with_plan_async()
+
+
+@mcp.resource("elements://stats/{etag}")
+@timed
+async def resource_stats_if_changed(etag: str) -> str:
+    """条件获取统计信息：etag 仍是最新时只返回 {"not_modified": true, "etag": ...}"""
+    return await _stats_with_plan_async(if_none_match=etag)
+
+
+@mcp.resource("elements://metrics")
+@timed
+async def resource_metrics() -> str:
+    """服务器运行指标：各工具调用数、错误数、延迟分位数（p50/p95/p99）、数据库语句数、缓存命中率"""
+    return format_stats_json(get_engine().metrics.snapshot())
 
 
 # ============================================================
@@ -367,12 +748,100 @@ def resource_stats() -> str:
 # ============================================================
 
 def main():
-    """Run the MCP server."""
-    print("Starting Skill Prompt Generator MCP Server...")
-    print(f"Project root: {PROJECT_ROOT}")
-    print("Tools: parse_user_intent, query_prompt_elements, check_element_consistency, compose_final_prompt, get_library_stats")
-    print("Prompts: portrait_prompt_generator, art_prompt_generator, design_prompt_generator, ...")
-    mcp.run()
+    """
+    Run the MCP server (stdio by default, or HTTP/SSE with pre-forked workers).
+
+    Environment:
+        MCP_LOG_LEVEL: Logging level (default INFO)
+        MCP_METRICS_FILE: Write the metrics snapshot to this JSON file periodically
+        MCP_METRICS_INTERVAL: Seconds between metrics dumps (default 60)
+        MCP_JOBS_STAND_IN: "1" runs background jobs with local stand-in
+            generators (no API calls; for testing)
+    """
+    parser = argparse.ArgumentParser(description="Skill Prompt Generator MCP Server")
+    parser.add_argument("--transport", choices=("stdio", "sse", "http"), default="stdio",
+                        help="stdio (default), sse, or streamable http")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Worker processes for --transport http (default 1)")
+    parser.add_argument("--install-change-counter", action="store_true",
+                        help="One-time migration: add the library change counter (table + "
+                             "triggers) to the element database before serving")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        stream=sys.stderr,
+        level=os.environ.get("MCP_LOG_LEVEL", "INFO").upper(),
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s"
+    )
+    logger.info("Starting Skill Prompt Generator MCP Server...")
+    logger.info("Project root: %s", PROJECT_ROOT)
+    logger.info("Tools: generate_prompt, batch_generate_prompts, parse_user_intent, query_prompt_elements, check_element_consistency, compose_final_prompt, get_library_stats, save_prompt, submit_job, get_job_status, get_job_result, cancel_job")
+    logger.info("Prompts: portrait_prompt_generator, art_prompt_generator, design_prompt_generator, ...")
+
+    stand_in = os.environ.get("MCP_JOBS_STAND_IN") == "1"
+    if stand_in:
+        set_engine(EngineContext(job_runners=stand_in_runners()))
+        logger.info("Background jobs use stand-in generators")
+
+    if args.install_change_counter and get_engine().install_change_counter():
+        logger.info("Library change counter installed in %s", get_engine().db_path)
+
+    metrics_file = os.environ.get("MCP_METRICS_FILE")
+    metrics_interval = float(os.environ.get("MCP_METRICS_INTERVAL", DEFAULT_DUMP_INTERVAL))
+
+    if args.transport != "stdio":
+        _serve_http(args, stand_in, metrics_file, metrics_interval)
+        return
+
+    # Warm up the shared engine before accepting requests
+    engine = get_engine()
+    engine.start()
+    timings = engine.warm_up_timings
+    logger.info("Engine warm-up: %.1fms (%s)", sum(timings.values()),
+                ', '.join(f'{k} {v:.1f}ms' for k, v in timings.items()))
+
+    if metrics_file:
+        engine.metrics.start_dump(metrics_file, metrics_interval)
+        logger.info("Writing metrics to %s every %.0fs", metrics_file, metrics_interval)
+    try:
+        mcp.run()
+    finally:
+        engine.close()
+
+
+def _serve_http(args, stand_in: bool, metrics_file: Optional[str], metrics_interval: float):
+    """Serve over SSE / streamable HTTP from pre-forked workers (see prefork.py)."""
+    from mcp_server.prefork import serve
+
+    workers = max(1, args.workers)
+    if args.transport == "sse":
+        if workers > 1:
+            logger.warning("SSE sessions live in one process; using 1 worker "
+                           "(use --transport http for several)")
+            workers = 1
+        app_factory = mcp.sse_app
+    else:
+        # Any worker can answer any request, and no session outlives its
+        # request; short e1… handles would not resolve on the next call
+        mcp.settings.stateless_http = True
+        app_factory = mcp.streamable_http_app
+
+    engine = get_engine()
+    if args.transport != "sse":
+        # Handles are element_ids, resolved from the element index in every worker
+        engine.handles.use_element_id_handles()
+
+    def worker_init(number: int):
+        # One metrics file per worker (each worker sees only its own calls)
+        if metrics_file:
+            base, ext = os.path.splitext(metrics_file)
+            engine.metrics.start_dump(f"{base}.worker{number}{ext}", metrics_interval)
+
+    serve(app_factory, engine, workers, args.host, args.port,
+          stand_in_jobs=stand_in, log_level=os.environ.get("MCP_LOG_LEVEL", "info").lower(),
+          worker_init=worker_init)
 
 
 if __name__ == "__main__":
@@ -4,8 +4,18 @@
 Consistency Checker Tool - Check element combinations for consistency
 """
 
+import sys
+import os
 import json
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional
+
+
+# Add project root to path for imports
+_PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if _PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, _PROJECT_ROOT)
+
+from skill_library.consistency_rules import RuleEngine
 
 
 # Ethnicity to typical features mapping
@@ -46,117 +56,178 @@ ERA_COMPATIBILITY = {
     }
 }
 
+# Checked categories in report order: (rule, DB category, framework field name, table key)
+CHECKED_CATEGORIES = (
+    ('ethnicity_eye_mismatch', 'eye_types', 'facial.eyes', 'incompatible_eye_colors'),
+    ('ethnicity_hair_mismatch', 'hairstyles', 'styling.hairstyle', 'incompatible_hair_colors'),
+    ('era_lighting_mismatch', 'lighting_techniques', 'lighting.lighting_type', 'incompatible_lighting'),
+    ('era_clothing_mismatch', 'clothing_styles', 'styling.clothing', 'incompatible_clothing'),
+)
+
+
+def checker_rules() -> List[Dict]:
+    """The checker's rule set (the tables above) for the shared RuleEngine."""
+    def forbidden(table: Dict, key: str) -> Dict[str, List[str]]:
+        return {value: entry[key] for value, entry in table.items()}
+
+    return [
+        {'name': 'ethnicity_eye_mismatch', 'severity': 'high', 'categories': ('eye_types',),
+         'context': 'ethnicity', 'feature': 'eye_color',
+         'forbidden': forbidden(ETHNICITY_FEATURES, 'incompatible_eye_colors')},
+        {'name': 'ethnicity_hair_mismatch', 'severity': 'medium', 'categories': ('hairstyles',),
+         'context': 'ethnicity', 'feature': 'hair_color',
+         'forbidden': forbidden(ETHNICITY_FEATURES, 'incompatible_hair_colors')},
+        {'name': 'era_lighting_mismatch', 'severity': 'medium', 'categories': ('lighting_techniques',),
+         'context': 'era', 'feature': 'lighting_type',
+         'forbidden': forbidden(ERA_COMPATIBILITY, 'incompatible_lighting')},
+        {'name': 'era_clothing_mismatch', 'severity': 'high', 'categories': ('clothing_styles',),
+         'context': 'era', 'feature': 'era_marker',
+         'forbidden': forbidden(ERA_COMPATIBILITY, 'incompatible_clothing')},
+        {'name': 'duplicate_template', 'severity': 'low', 'key': 'template', 'allow_empty': True},
+    ]
+
 
-def check_consistency(elements: List[Dict], intent: Dict) -> Dict:
+_engine: Optional[RuleEngine] = None
+
+
+def default_engine() -> RuleEngine:
+    """
+    The checker's compiled rule engine.
+
+    Colour and era words are matched in element names only, as whole words.
+    """
+    global _engine
+    if _engine is None:
+        _engine = RuleEngine(rules=checker_rules(), include_template=False)
+    return _engine
+
+
+def check_consistency(elements: List[Dict], intent: Dict, engine: Optional[RuleEngine] = None) -> Dict:
     """
     Check consistency of element combinations.
     
     Args:
         elements: List of selected elements
         intent: User intent structure
+        engine: Compiled rule engine (defaults to the checker's rule set)
     
     Returns:
         Consistency report with issues and suggestions
     """
-    issues = []
-    suggestions = []
-    
+    engine = engine or default_engine()
+
     # Extract relevant info from intent
     ethnicity = intent.get('subject', {}).get('ethnicity', 'East_Asian')
     era = intent.get('scene', {}).get('era', 'modern')
-    
-    # Build element lookup
+
+    return _build_report(_violations(engine, elements, {'ethnicity': ethnicity, 'era': era}), elements)
+
+
+def check_consistency_batch(element_sets: List[List[Dict]], intents: List[Dict],
+                            engine: Optional[RuleEngine] = None) -> List[Dict]:
+    """
+    Check many element combinations against the same compiled rule set.
+
+    Args:
+        element_sets: One list of elements per combination
+        intents: One intent per combination
+        engine: Compiled rule engine (defaults to the checker's rule set)
+
+    Returns:
+        One consistency report per combination
+    """
+    engine = engine or default_engine()
+    reports = []
+    for elements, intent in zip(element_sets, intents):
+        context = {
+            'ethnicity': intent.get('subject', {}).get('ethnicity', 'East_Asian'),
+            'era': intent.get('scene', {}).get('era', 'modern'),
+        }
+        reports.append(_build_report(_violations(engine, elements, context), elements))
+    return reports
+
+
+def _violations(engine: RuleEngine, elements: List[Dict], context: Dict) -> List[Dict]:
+    """Rule violations of the last element per checked category, then duplicates."""
     elem_by_category = {}
     for elem in elements:
         category = elem.get('category', elem.get('field_name', 'unknown'))
         elem_by_category[category] = elem
-    
-    # Check 1: Ethnicity vs Eye/Hair color consistency
-    if ethnicity in ETHNICITY_FEATURES:
-        features = ETHNICITY_FEATURES[ethnicity]
-        
-        # Check eye color
-        eye_elem = elem_by_category.get('eye_types') or elem_by_category.get('facial.eyes')
-        if eye_elem:
-            eye_name = eye_elem.get('name', '').lower()
-            for incompatible in features['incompatible_eye_colors']:
-                if incompatible in eye_name:
-                    issues.append({
-                        'type': 'ethnicity_eye_mismatch',
-                        'severity': 'high',
-                        'description': f'Eye color "{eye_name}" is unusual for {ethnicity}',
-                        'element': eye_elem.get('element_id')
-                    })
-                    suggestions.append({
-                        'field': 'eye_color',
-                        'current': eye_name,
-                        'suggested': features['typical_eye_colors'][0],
-                        'reason': f'{ethnicity} typically has {", ".join(features["typical_eye_colors"])} eyes'
-                    })
-        
-        # Check hair color
-        hair_elem = elem_by_category.get('hairstyles') or elem_by_category.get('styling.hairstyle')
-        if hair_elem:
-            hair_name = hair_elem.get('name', '').lower()
-            for incompatible in features['incompatible_hair_colors']:
-                if incompatible in hair_name:
-                    issues.append({
-                        'type': 'ethnicity_hair_mismatch',
-                        'severity': 'medium',
-                        'description': f'Hair color "{hair_name}" is unusual for {ethnicity}',
-                        'element': hair_elem.get('element_id')
-                    })
-    
-    # Check 2: Era vs Lighting/Clothing consistency
-    if era in ERA_COMPATIBILITY:
-        compat = ERA_COMPATIBILITY[era]
-        
-        # Check lighting
-        lighting_elem = elem_by_category.get('lighting_techniques') or elem_by_category.get('lighting.lighting_type')
-        if lighting_elem:
-            lighting_name = lighting_elem.get('name', '').lower()
-            for incompatible in compat['incompatible_lighting']:
-                if incompatible in lighting_name:
-                    issues.append({
-                        'type': 'era_lighting_mismatch',
-                        'severity': 'medium',
-                        'description': f'Lighting "{lighting_name}" is anachronistic for {era} era',
-                        'element': lighting_elem.get('element_id')
-                    })
-                    suggestions.append({
-                        'field': 'lighting',
-                        'current': lighting_name,
-                        'suggested': compat['compatible_lighting'][0],
-                        'reason': f'{era} era works better with {", ".join(compat["compatible_lighting"][:3])} lighting'
-                    })
-        
-        # Check clothing
-        clothing_elem = elem_by_category.get('clothing_styles') or elem_by_category.get('styling.clothing')
-        if clothing_elem:
-            clothing_name = clothing_elem.get('name', '').lower()
-            for incompatible in compat['incompatible_clothing']:
-                if incompatible in clothing_name:
-                    issues.append({
-                        'type': 'era_clothing_mismatch',
-                        'severity': 'high',
-                        'description': f'Clothing "{clothing_name}" is anachronistic for {era} era',
-                        'element': clothing_elem.get('element_id')
-                    })
-    
-    # Check 3: Duplicate elements
-    seen_templates = {}
+
+    violations = []
+    for _, category, field_name, _ in CHECKED_CATEGORIES:
+        elem = elem_by_category.get(category) or elem_by_category.get(field_name)
+        if elem:
+            violations.extend(engine.element_violations(elem, context, category))
+    violations.extend(engine.unique_violations(elements))
+    return violations
+
+
+def _build_report(violations: List[Dict], elements: List[Dict]) -> Dict:
+    """Turn rule violations into the issue/suggestion report."""
+    issues = []
+    suggestions = []
+    duplicates = set()
+    table_keys = {rule: key for rule, _, _, key in CHECKED_CATEGORIES}
+
+    for v in violations:
+        rule = v['rule']
+
+        if rule == 'duplicate_template':
+            # Every repeat after the first occurrence, reported below in element order
+            duplicates.update(id(elem) for elem in v['elements'][1:])
+            continue
+
+        elem = v['element']
+        name = elem.get('name', '').lower()
+        value = v['value']
+        table = ETHNICITY_FEATURES if v['context'] == 'ethnicity' else ERA_COMPATIBILITY
+        matched = set(v['matched'])
+
+        # One issue (and suggestion) per incompatible word, in table order
+        for word in table[value][table_keys[rule]]:
+            if word.replace('_', ' ') not in matched:
+                continue
+
+            if rule == 'ethnicity_eye_mismatch':
+                description = f'Eye color "{name}" is unusual for {value}'
+                typical = table[value]['typical_eye_colors']
+                suggestions.append({
+                    'field': 'eye_color',
+                    'current': name,
+                    'suggested': typical[0],
+                    'reason': f'{value} typically has {", ".join(typical)} eyes'
+                })
+            elif rule == 'ethnicity_hair_mismatch':
+                description = f'Hair color "{name}" is unusual for {value}'
+            elif rule == 'era_lighting_mismatch':
+                description = f'Lighting "{name}" is anachronistic for {value} era'
+                compatible = table[value]['compatible_lighting']
+                suggestions.append({
+                    'field': 'lighting',
+                    'current': name,
+                    'suggested': compatible[0],
+                    'reason': f'{value} era works better with {", ".join(compatible[:3])} lighting'
+                })
+            else:
+                description = f'Clothing "{name}" is anachronistic for {value} era'
+
+            issues.append({
+                'type': rule,
+                'severity': v['severity'],
+                'description': description,
+                'element': elem.get('element_id')
+            })
+
     for elem in elements:
-        template = elem.get('template', elem.get('ai_prompt_template', ''))
-        if template in seen_templates:
+        if id(elem) in duplicates:
             issues.append({
                 'type': 'duplicate',
                 'severity': 'low',
-                'description': f'Duplicate element template detected',
+                'description': 'Duplicate element template detected',
                 'element': elem.get('element_id')
             })
-        else:
-            seen_templates[template] = elem.get('element_id')
-    
+
     # Generate report
     report = {
         'is_consistent': len([i for i in issues if i['severity'] in ['high', 'medium']]) == 0,
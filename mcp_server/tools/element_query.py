@@ -7,13 +7,19 @@ Element Query Tool - Query elements from Universal Elements Library
 import sys
 import os
 import json
-from typing import Dict, List, Optional
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
 
 
 # Add project root to path for imports
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+_PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if _PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, _PROJECT_ROOT)
 
-from skill_library.element_db import ElementDB
+from skill_library.element_db import ElementDB, library_stamp
+from mcp_server.tools.json_output import dumps, project
 
 
 # Category mapping from framework fields to database categories
@@ -37,8 +43,14 @@ FIELD_TO_CATEGORY = {
     'scene.environment': 'environments'
 }
 
-# Domain statistics cache
-_domain_stats_cache = None
+# Fields of a formatted element (valid values for fields= projection)
+ELEMENT_FIELDS = ('handle', 'element_id', 'name', 'chinese_name', 'template',
+                  'keywords', 'reusability_score', 'relevance_score')
+
+# Domain statistics cache: (db_path, domain) -> (library version, cached_at, stats)
+_domain_stats_cache: Dict[Tuple[str, Optional[str]], Tuple[object, float, Dict]] = {}
+_domain_stats_lock = threading.Lock()
+_domain_stats_counts = {'hits': 0, 'misses': 0}
 
 
 def get_db_path() -> str:
@@ -51,7 +63,8 @@ def query_elements(
     domain: str,
     category: str,
     keywords: List[str] = None,
-    limit: int = 10
+    limit: int = 10,
+    engine=None
 ) -> List[Dict]:
     """
     Query elements from the Universal Elements Library.
@@ -61,10 +74,17 @@ def query_elements(
         category: Category ID (makeup_styles/lighting_techniques/etc)
         keywords: Optional search keywords
         limit: Maximum number of results
+        engine: Optional shared EngineContext; its in-memory element index
+            replaces opening the database
     
     Returns:
         List of element dictionaries
     """
+    fetch_limit = limit * 3 if keywords else limit  # Get more if filtering
+
+    if engine is not None:
+        return _score_and_format(list(engine.index.top(domain, category, fetch_limit)), keywords, limit)
+
     db = ElementDB(get_db_path())
     
     try:
@@ -72,41 +92,96 @@ def query_elements(
         elements = db.search_by_domain(
             domain_id=domain,
             category_id=category,
-            limit=limit * 3 if keywords else limit  # Get more if filtering
+            limit=fetch_limit
         )
-        
-        # If keywords provided, filter and score
-        if keywords and elements:
-            scored_elements = []
-            for elem in elements:
-                score = calculate_relevance(elem, keywords)
-                if score > 0:
-                    elem['relevance_score'] = score
-                    scored_elements.append(elem)
-            
-            # Sort by relevance score
-            scored_elements.sort(key=lambda x: x.get('relevance_score', 0), reverse=True)
-            elements = scored_elements[:limit]
-        
-        # Format elements for output
-        result = []
-        for elem in elements:
-            result.append({
-                'element_id': elem.get('element_id'),
-                'name': elem.get('name'),
-                'chinese_name': elem.get('chinese_name'),
-                'template': elem.get('ai_prompt_template', '')[:200],  # Truncate for readability
-                'keywords': elem.get('keywords', ''),
-                'reusability_score': elem.get('reusability_score', 0),
-                'relevance_score': elem.get('relevance_score', 0)
-            })
-        
-        return result
+        return _score_and_format(elements, keywords, limit)
     
     finally:
         db.close()
 
 
+def _score_and_format(elements: List[Dict], keywords: Optional[List[str]], limit: int) -> List[Dict]:
+    """Filter/rank by keyword relevance and format for output (input dicts are not modified)."""
+    relevance = {}
+
+    # If keywords provided, filter and score
+    if keywords and elements:
+        scored_elements = []
+        for elem in elements:
+            score = calculate_relevance(elem, keywords)
+            if score > 0:
+                relevance[id(elem)] = score
+                scored_elements.append(elem)
+        
+        # Sort by relevance score
+        scored_elements.sort(key=lambda x: relevance[id(x)], reverse=True)
+        elements = scored_elements[:limit]
+    
+    # Format elements for output
+    return [format_element(elem, relevance.get(id(elem), elem.get('relevance_score', 0)))
+            for elem in elements]
+
+
+def format_element(elem: Dict, relevance_score: float = 0) -> Dict:
+    """Element row/index entry → tool output dict."""
+    return {
+        'element_id': elem.get('element_id'),
+        'name': elem.get('name'),
+        'chinese_name': elem.get('chinese_name'),
+        'template': elem.get('ai_prompt_template', '')[:200],  # Truncate for readability
+        'keywords': elem.get('keywords', ''),
+        'reusability_score': elem.get('reusability_score', 0),
+        'relevance_score': relevance_score
+    }
+
+
+def register_elements(elements: List[Dict], cache) -> List[Dict]:
+    """
+    Register query results in a session handle cache.
+
+    Args:
+        elements: Formatted elements
+        cache: ElementHandleCache of the calling session
+
+    Returns:
+        The elements, each tagged with its 'handle'
+    """
+    for elem in elements:
+        elem['handle'] = cache.register(elem)
+    return elements
+
+
+def load_element_refs(elements_json: str, cache, engine=None) -> List[Dict]:
+    """
+    Parse an elements argument: a JSON list of element dicts and/or handles /
+    element_ids, or a plain comma-separated list of handles / element_ids.
+
+    Args:
+        elements_json: Tool argument
+        cache: ElementHandleCache of the calling session
+        engine: Optional EngineContext used to resolve element_ids not in the cache
+
+    Returns:
+        Resolved elements
+
+    Raises:
+        json.JSONDecodeError: Malformed JSON list
+        KeyError: Unknown handles / element_ids (listed in the message)
+    """
+    from mcp_server.handles import resolve_refs
+
+    text = elements_json.strip()
+    if text.startswith('['):
+        refs = json.loads(text)
+    else:
+        refs = [part for part in text.split(',') if part.strip()]
+
+    elements, missing = resolve_refs(refs, cache, engine, format_element)
+    if missing:
+        raise KeyError(', '.join(missing))
+    return elements
+
+
 def calculate_relevance(element: Dict, keywords: List[str]) -> float:
     """
     Calculate relevance score for an element against keywords.
@@ -135,7 +210,8 @@ def calculate_relevance(element: Dict, keywords: List[str]) -> float:
     return matches / len(keywords)
 
 
-def query_by_field(field_name: str, keywords: List[str] = None, domain: str = 'portrait', limit: int = 10) -> List[Dict]:
+def query_by_field(field_name: str, keywords: List[str] = None, domain: str = 'portrait', limit: int = 10,
+                   engine=None) -> List[Dict]:
     """
     Query elements by framework field name.
     
@@ -144,6 +220,7 @@ def query_by_field(field_name: str, keywords: List[str] = None, domain: str = 'p
         keywords: Search keywords
         domain: Domain to search in
         limit: Result limit
+        engine: Optional shared EngineContext
     
     Returns:
         List of matching elements
@@ -152,51 +229,149 @@ def query_by_field(field_name: str, keywords: List[str] = None, domain: str = 'p
     if not category:
         return []
     
-    return query_elements(domain, category, keywords, limit)
+    return query_elements(domain, category, keywords, limit, engine=engine)
 
 
-def get_domain_stats(domain: str = None) -> Dict:
+def get_domain_stats(domain: str = None, engine=None, ttl: Optional[float] = None,
+                     version=None) -> Dict:
     """
     Get statistics about the element library.
     
+    Results are cached per domain until the library change counter moves
+    (and, with ttl, for at most ttl seconds).
+    
     Args:
         domain: Specific domain or None for all
+        engine: Optional shared EngineContext; queries run on a pooled
+            connection instead of opening the database
+        ttl: Optional maximum age of a cached result in seconds
+        version: Library version the caller already read (read here if None)
     
     Returns:
-        Statistics dictionary
+        Statistics dictionary (a copy; safe to modify)
     """
-    global _domain_stats_cache
-    
+    db_path = engine.db_path if engine is not None else get_db_path()
+    if version is None:
+        version = engine.library_version() if engine is not None else _read_library_version(db_path)
+
+    key = (db_path, domain)
+    cached = _domain_stats_cache.get(key)
+    # Without a version (missing database) only a TTL can make an entry valid
+    if (cached is not None and cached[0] == version and (version is not None or ttl is not None)
+            and (ttl is None or time.time() - cached[1] < ttl)):
+        with _domain_stats_lock:
+            _domain_stats_counts['hits'] += 1
+        return _copy_stats(cached[2])
+
+    with _domain_stats_lock:
+        _domain_stats_counts['misses'] += 1
+    stats = _load_domain_stats(domain, engine)
+    with _domain_stats_lock:
+        _domain_stats_cache[key] = (version, time.time(), stats)
+    return _copy_stats(stats)
+
+
+def stats_cache_info() -> Dict:
+    """Hit/miss counts and size of the domain statistics cache."""
+    with _domain_stats_lock:
+        return {**_domain_stats_counts, 'entries': len(_domain_stats_cache)}
+
+
+def _read_library_version(db_path: str):
+    """Library version of a database file (change counter, else file stamp; None when missing)."""
+    if not os.path.exists(db_path):
+        return None
+    try:
+        conn = sqlite3.connect(db_path)
+    except sqlite3.Error:
+        return None
+    try:
+        return library_stamp(conn, db_path)
+    finally:
+        conn.close()
+
+
+def _copy_stats(stats: Dict) -> Dict:
+    return {
+        'total_elements': stats['total_elements'],
+        'domains': {domain_id: dict(info) for domain_id, info in stats['domains'].items()},
+    }
+
+
+def _load_domain_stats(domain: Optional[str], engine=None) -> Dict:
+    """Query the library statistics (no caching)."""
+    if engine is not None:
+        with engine.pool.connection() as conn:
+            stats = {
+                'total_elements': conn.execute("SELECT COUNT(*) FROM elements").fetchone()[0],
+                'domains': [
+                    {'domain_id': row[0], 'name': row[1], 'total_elements': row[2]}
+                    for row in conn.execute(
+                        "SELECT domain_id, name, total_elements FROM domains ORDER BY total_elements DESC"
+                    )
+                ],
+            }
+        return _format_domain_stats(stats, domain)
+
     db = ElementDB(get_db_path())
     
     try:
-        stats = db.get_stats()
-        
-        result = {
-            'total_elements': stats.get('total_elements', 0),
-            'domains': {}
-        }
-        
-        # Get domain breakdown
-        if 'domains' in stats:
-            for d in stats['domains']:
-                if domain is None or d['domain_id'] == domain:
-                    result['domains'][d['domain_id']] = {
-                        'name': d.get('name', d['domain_id']),
-                        'element_count': d.get('element_count', 0)
-                    }
-        
-        return result
+        return _format_domain_stats(db.get_stats(), domain)
     
     finally:
         db.close()
 
 
-def format_elements_json(elements: List[Dict]) -> str:
-    """Format elements list as pretty JSON string."""
-    return json.dumps(elements, ensure_ascii=False, indent=2)
+def _format_domain_stats(stats: Dict, domain: Optional[str]) -> Dict:
+    """Reduce ElementDB.get_stats() output to the tool's stats structure."""
+    result = {
+        'total_elements': stats.get('total_elements', 0),
+        'domains': {}
+    }
+    
+    # Get domain breakdown
+    if 'domains' in stats:
+        for d in stats['domains']:
+            if domain is None or d['domain_id'] == domain:
+                result['domains'][d['domain_id']] = {
+                    'name': d.get('name', d['domain_id']),
+                    'element_count': d.get('element_count', 0)
+                }
+    
+    return result
+
+
+def parse_fields(fields: str) -> Optional[List[str]]:
+    """
+    Parse a comma-separated fields= argument.
+
+    Returns:
+        Field names in order (None when empty)
+
+    Raises:
+        ValueError: Unknown field names
+    """
+    names = [f.strip() for f in fields.split(',') if f.strip()] if fields else []
+    unknown = [f for f in names if f not in ELEMENT_FIELDS]
+    if unknown:
+        raise ValueError(f"未知字段: {', '.join(unknown)}（可用: {', '.join(ELEMENT_FIELDS)}）")
+    return names or None
+
+
+def format_elements_json(elements: List[Dict], compact: bool = False,
+                         fields: Optional[List[str]] = None, short_keys: bool = False) -> str:
+    """
+    Format elements list as JSON string.
+
+    Args:
+        elements: Formatted elements
+        compact: No indentation (fast encoder when available)
+        fields: Keep only these fields, in this order
+        short_keys: Use short field names (see json_output.SHORT_KEYS)
+    """
+    return dumps(project(elements, fields, short_keys), compact)
 
 
-def format_stats_json(stats: Dict) -> str:
-    """Format stats as pretty JSON string."""
-    return json.dumps(stats, ensure_ascii=False, indent=2)
+def format_stats_json(stats: Dict, compact: bool = False) -> str:
+    """Format stats as JSON string (pretty unless compact)."""
+    return dumps(stats, compact)
@@ -7,15 +7,20 @@ This module provides a unified interface for generating images using Google's
 Gemini 3 Pro image generation model.
 """
 
+import logging
 import sys
 import os
-import json
 from datetime import datetime
 from typing import Optional
 
 # Add project root to path
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-sys.path.insert(0, PROJECT_ROOT)
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from mcp_server.tools.json_output import dumps
+
+logger = logging.getLogger(__name__)
 
 
 def _get_gemini_client():
@@ -88,9 +93,8 @@ def generate_image(
     try:
         client = _get_gemini_client()
         
-        print(f"🎨 Generating image with Gemini 3 Pro...")
-        print(f"   Aspect ratio: {aspect_ratio}")
-        print(f"   Resolution: {resolution}")
+        logger.info("🎨 Generating image with Gemini 3 Pro (aspect ratio %s, resolution %s)",
+                    aspect_ratio, resolution)
         
         response = client.models.generate_content(
             model="gemini-3-pro-image-preview",
@@ -109,7 +113,7 @@ def generate_image(
             if part.inline_data is not None:
                 image = part.as_image()
                 image.save(output_path)
-                print(f"✅ Image saved: {output_path}")
+                logger.info("✅ Image saved: %s", output_path)
                 return {
                     "status": "success",
                     "path": output_path,
@@ -138,9 +142,9 @@ def generate_image(
         }
 
 
-def format_result_json(result: dict) -> str:
-    """Format the generation result as JSON string."""
-    return json.dumps(result, indent=2, ensure_ascii=False)
+def format_result_json(result: dict, compact: bool = False) -> str:
+    """Format the generation result as JSON string (pretty unless compact)."""
+    return dumps(result, compact)
 
 
 if __name__ == "__main__":
@@ -2,11 +2,17 @@
 # -*- coding: utf-8 -*-
 """
 Intent Parser Tool - Parse user natural language into structured intent
+
+All keyword tables are compiled once into an Aho-Corasick automaton;
+parse_intent scans the request a single time and every detector reads the
+collected matches.
 """
 
-import json
 import re
-from typing import Dict, List, Optional
+from collections import deque
+from typing import Dict, List, Optional, Set, Tuple
+
+from mcp_server.tools.json_output import dumps
 
 
 # Domain keywords mapping
@@ -63,24 +69,274 @@ MAKEUP_KEYWORDS = {
 }
 
 
-def detect_domain(text: str) -> str:
+# Gender keywords (checked in order: male first)
+GENDER_KEYWORDS = {
+    'male': ['男', '男性', '男孩', '少年', 'man', 'boy', 'male'],
+    'female': ['女', '女性', '女孩', '少女', '美女', 'woman', 'girl', 'female']
+}
+
+# Ethnicity keywords
+ETHNICITY_KEYWORDS = {
+    'East_Asian': ['亚洲', '中国', '日本', '韩国', '东亚', 'asian', 'chinese', 'japanese', 'korean'],
+    'European': ['欧洲', '西方', '白人', 'european', 'western', 'caucasian'],
+    'African': ['非洲', '黑人', 'african'],
+    'South_Asian': ['南亚', '印度', 'indian', 'south asian'],
+    'Latin': ['拉丁', 'latin', 'hispanic']
+}
+
+# Age range keywords
+AGE_RANGE_KEYWORDS = {
+    'child': ['儿童', '小孩', 'child', 'kid'],
+    'teen': ['少年', '青少年', 'teen', 'teenager'],
+    'young_adult': ['年轻', '青年', '少女', '少年', 'young'],
+    'adult': ['成年', '成人', 'adult'],
+    'middle_aged': ['中年', 'middle aged'],
+    'elderly': ['老年', '老人', 'elderly', 'old']
+}
+
+# Portrait art style keywords
+ART_STYLE_KEYWORDS = {
+    'anime': ['动漫', '二次元', 'anime'],
+    'realistic': ['写实', '真实', 'realistic'],
+    'cinematic': ['电影级', '电影', 'cinematic'],
+    'illustration': ['插画', 'illustration']
+}
+
+# Art domain keywords
+ART_TYPE_KEYWORDS = {
+    'ink_wash': ['水墨', '国画', 'ink wash'],
+    'oil_painting': ['油画', 'oil painting'],
+    'watercolor': ['水彩', 'watercolor'],
+    'sketch': ['素描', 'sketch']
+}
+
+ART_SUBJECT_KEYWORDS = {
+    'landscape': ['山水', '风景', 'landscape'],
+    'still_life': ['静物', 'still life'],
+    'abstract': ['抽象', 'abstract']
+}
+
+# Design domain keywords
+DESIGN_TYPE_KEYWORDS = {
+    'bento_grid': ['Bento', 'bento', '网格'],
+    'glassmorphism': ['玻璃态', 'glassmorphism', 'glass'],
+    'poster': ['海报', 'poster'],
+    'ui': ['UI', 'ui', '界面']
+}
+
+# Product domain keywords
+PRODUCT_STYLE_KEYWORDS = {
+    'luxury': ['奢华', '高端', 'luxury'],
+    'commercial': ['商业', 'commercial'],
+    'minimal': ['极简', 'minimal']
+}
+
+# Slot name -> (keyword table, keywords lower-cased before matching).
+# Every detector matches against the lower-cased request; gender, ethnicity
+# and age range compare their keywords as written.
+KEYWORD_TABLES = {
+    'domain': (DOMAIN_KEYWORDS, True),
+    'era': (ERA_KEYWORDS, True),
+    'lighting': (LIGHTING_KEYWORDS, True),
+    'director': (DIRECTOR_KEYWORDS, True),
+    'clothing': (CLOTHING_KEYWORDS, True),
+    'makeup': (MAKEUP_KEYWORDS, True),
+    'gender': (GENDER_KEYWORDS, False),
+    'ethnicity': (ETHNICITY_KEYWORDS, False),
+    'age_range': (AGE_RANGE_KEYWORDS, False),
+    'art_style': (ART_STYLE_KEYWORDS, True),
+    'art_type': (ART_TYPE_KEYWORDS, True),
+    'art_subject': (ART_SUBJECT_KEYWORDS, True),
+    'design_type': (DESIGN_TYPE_KEYWORDS, True),
+    'product_style': (PRODUCT_STYLE_KEYWORDS, True),
+}
+
+
+class KeywordMatches:
+    """Every keyword occurrence found in one request (expanded on first use)."""
+
+    __slots__ = ('_hits', '_patterns', '_values', '_matches', '_entries')
+
+    def __init__(self, hits: List[Tuple[int, List[int]]], automaton: 'KeywordAutomaton'):
+        # (end offset, pattern ids ending there) collected by the scan
+        self._hits = hits
+        self._patterns = automaton._patterns
+        self._values = automaton.slot_values
+        self._matches: Optional[List[Tuple[int, int, str, str]]] = None
+        self._entries: Optional[Dict[str, Set[Tuple[int, int]]]] = None
+
+    @property
+    def matches(self) -> List[Tuple[int, int, str, str]]:
+        """(start, end, slot, value) of every occurrence, in text order."""
+        if self._matches is None:
+            self._matches = [
+                (end - length, end, slot, value)
+                for end, pids in self._hits
+                for pid in pids
+                for length, targets in (self._patterns[pid],)
+                for slot, value, _ in targets
+            ]
+        return self._matches
+
+    def _slot_entries(self, slot: str) -> Set[Tuple[int, int]]:
+        if self._entries is None:
+            # slot -> {(value index, keyword index)} of keywords that occurred
+            pids: Set[int] = set()
+            for _, ending in self._hits:
+                pids.update(ending)
+            entries: Dict[str, Set[Tuple[int, int]]] = {}
+            for pid in pids:
+                for slot_name, _, entry in self._patterns[pid][1]:
+                    if slot_name in entries:
+                        entries[slot_name].add(entry)
+                    else:
+                        entries[slot_name] = {entry}
+            self._entries = entries
+        return self._entries.get(slot, set())
+
+    def first(self, slot: str, default: Optional[str]) -> Optional[str]:
+        """Value a keyword-order scan would pick: first value in table order with any match."""
+        entries = self._slot_entries(slot)
+        if not entries:
+            return default
+        return self._values[slot][min(entries)[0]]
+
+    def scores(self, slot: str) -> Dict[str, int]:
+        """Number of distinct keywords that occurred, per value (table order)."""
+        values = self._values[slot]
+        scores = {value: 0 for value in values}
+        for value_index, _ in self._slot_entries(slot):
+            scores[values[value_index]] += 1
+        return scores
+
+
+class KeywordAutomaton:
+    """
+    Aho-Corasick automaton over all keyword tables.
+
+    Built once; scan() walks the lower-cased text a single time and reports
+    every occurrence of every keyword (overlapping ones included), so the cost
+    depends on the text length, not on the number of keywords.
+    """
+
+    def __init__(self, tables: Dict[str, Tuple[Dict[str, List[str]], bool]]):
+        """
+        Args:
+            tables: Slot name -> (keyword table, lower-case keywords)
+        """
+        # Trie: transitions per state, pattern ids ending at each state
+        self._goto: List[Dict[str, int]] = [{}]
+        self._out: List[List[int]] = [[]]
+        # Pattern id -> (length, [(slot, value, (value index, keyword index))])
+        self._patterns: List[Tuple[int, List[Tuple[str, str, Tuple[int, int]]]]] = []
+        pattern_ids: Dict[str, int] = {}
+        # Slot -> values in table order
+        self.slot_values = {slot: tuple(table) for slot, (table, _) in tables.items()}
+
+        for slot, (table, lower) in tables.items():
+            for value_index, (value, keywords) in enumerate(table.items()):
+                for keyword_index, keyword in enumerate(keywords):
+                    pattern = keyword.lower() if lower else keyword
+                    if not pattern or pattern != pattern.lower():
+                        # Matched against lower-cased text: can never occur
+                        continue
+                    pid = pattern_ids.get(pattern)
+                    if pid is None:
+                        pid = pattern_ids[pattern] = len(self._patterns)
+                        self._patterns.append((len(pattern), []))
+                        self._add(pattern, pid)
+                    self._patterns[pid][1].append((slot, value, (value_index, keyword_index)))
+
+        self._alphabet = frozenset(ch for transitions in self._goto for ch in transitions)
+        self._build_failure_links()
+        # Complete transitions per state (trie edges + resolved failure links),
+        # filled in as characters are seen
+        self._delta: List[Dict[str, int]] = [dict(transitions) for transitions in self._goto]
+
+    def _add(self, pattern: str, pid: int):
+        state = 0
+        for ch in pattern:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._out.append([])
+            state = nxt
+        self._out[state].append(pid)
+
+    def _build_failure_links(self):
+        self._fail = [0] * len(self._goto)
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fallback = self._fail[state]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[nxt] = self._goto[fallback].get(ch, 0)
+                # Patterns ending at the failure state also end here
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def _transition(self, state: int, ch: str) -> int:
+        """Next state for a character missing from the state's transition cache."""
+        if ch not in self._alphabet:
+            return 0
+        source = state
+        while state and ch not in self._goto[state]:
+            state = self._fail[state]
+        nxt = self._goto[state].get(ch, 0)
+        self._delta[source][ch] = nxt
+        return nxt
+
+    def scan(self, text: str) -> KeywordMatches:
+        """Find every keyword occurrence in text (lower-cased here)."""
+        delta, out, transition = self._delta, self._out, self._transition
+        hits = []
+        state = 0
+
+        for i, ch in enumerate(text.lower()):
+            nxt = delta[state].get(ch)
+            state = transition(state, ch) if nxt is None else nxt
+            if out[state]:
+                hits.append((i + 1, out[state]))
+
+        return KeywordMatches(hits, self)
+
+
+INTENT_AUTOMATON = KeywordAutomaton(KEYWORD_TABLES)
+
+_SLOT_OF_TABLE = {id(table): slot for slot, (table, _) in KEYWORD_TABLES.items()}
+
+
+def scan_keywords(text: str) -> KeywordMatches:
+    """All keyword matches of a request in one pass."""
+    return INTENT_AUTOMATON.scan(text)
+
+
+def detect_domain(text: str, matches: Optional[KeywordMatches] = None) -> str:
     """Detect the domain from user input text."""
-    text_lower = text.lower()
+    if matches is None:
+        matches = scan_keywords(text)
     
-    scores = {domain: 0 for domain in DOMAIN_KEYWORDS}
-    
-    for domain, keywords in DOMAIN_KEYWORDS.items():
-        for kw in keywords:
-            if kw.lower() in text_lower:
-                scores[domain] += 1
+    scores = matches.scores('domain')
     
     # Default to portrait if no clear match
     best_domain = max(scores, key=scores.get)
     return best_domain if scores[best_domain] > 0 else 'portrait'
 
 
-def detect_value(text: str, keywords_map: Dict[str, List[str]], default: str) -> str:
+def detect_value(text: str, keywords_map: Dict[str, List[str]], default: str,
+                 matches: Optional[KeywordMatches] = None) -> str:
     """Detect a value based on keywords mapping."""
+    slot = _SLOT_OF_TABLE.get(id(keywords_map))
+    if slot is not None and KEYWORD_TABLES[slot][0] is keywords_map:
+        if matches is None:
+            matches = scan_keywords(text)
+        return matches.first(slot, default)
+    
+    # Table not compiled into the automaton
     text_lower = text.lower()
     
     for value, keywords in keywords_map.items():
@@ -91,67 +347,26 @@ def detect_value(text: str, keywords_map: Dict[str, List[str]], default: str) ->
     return default
 
 
-def detect_gender(text: str) -> str:
+def detect_gender(text: str, matches: Optional[KeywordMatches] = None) -> str:
     """Detect gender from text."""
-    male_keywords = ['男', '男性', '男孩', '少年', 'man', 'boy', 'male']
-    female_keywords = ['女', '女性', '女孩', '少女', '美女', 'woman', 'girl', 'female']
-    
-    text_lower = text.lower()
-    
-    for kw in male_keywords:
-        if kw in text_lower:
-            return 'male'
-    
-    for kw in female_keywords:
-        if kw in text_lower:
-            return 'female'
-    
-    return 'female'  # Default
+    if matches is None:
+        matches = scan_keywords(text)
+    return matches.first('gender', 'female')  # Default
 
 
-def detect_ethnicity(text: str) -> str:
+def detect_ethnicity(text: str, matches: Optional[KeywordMatches] = None) -> str:
     """Detect ethnicity from text."""
-    ethnicity_map = {
-        'East_Asian': ['亚洲', '中国', '日本', '韩国', '东亚', 'asian', 'chinese', 'japanese', 'korean'],
-        'European': ['欧洲', '西方', '白人', 'european', 'western', 'caucasian'],
-        'African': ['非洲', '黑人', 'african'],
-        'South_Asian': ['南亚', '印度', 'indian', 'south asian'],
-        'Latin': ['拉丁', 'latin', 'hispanic']
-    }
-    
-    text_lower = text.lower()
-    
-    for ethnicity, keywords in ethnicity_map.items():
-        for kw in keywords:
-            if kw in text_lower:
-                return ethnicity
-    
+    if matches is None:
+        matches = scan_keywords(text)
     # Default to East Asian for Chinese context
-    if any(ord(c) > 127 for c in text):  # Contains non-ASCII (likely Chinese)
-        return 'East_Asian'
-    
-    return 'East_Asian'
+    return matches.first('ethnicity', 'East_Asian')
 
 
-def detect_age_range(text: str) -> str:
+def detect_age_range(text: str, matches: Optional[KeywordMatches] = None) -> str:
     """Detect age range from text."""
-    age_map = {
-        'child': ['儿童', '小孩', 'child', 'kid'],
-        'teen': ['少年', '青少年', 'teen', 'teenager'],
-        'young_adult': ['年轻', '青年', '少女', '少年', 'young'],
-        'adult': ['成年', '成人', 'adult'],
-        'middle_aged': ['中年', 'middle aged'],
-        'elderly': ['老年', '老人', 'elderly', 'old']
-    }
-    
-    text_lower = text.lower()
-    
-    for age, keywords in age_map.items():
-        for kw in keywords:
-            if kw in text_lower:
-                return age
-    
-    return 'young_adult'
+    if matches is None:
+        matches = scan_keywords(text)
+    return matches.first('age_range', 'young_adult')
 
 
 def parse_intent(user_request: str, domain_hint: str = 'auto') -> Dict:
@@ -165,9 +380,12 @@ def parse_intent(user_request: str, domain_hint: str = 'auto') -> Dict:
     Returns:
         Structured intent dictionary
     """
+    # Every keyword table is matched in one pass
+    matches = scan_keywords(user_request)
+    
     # Detect domain
     if domain_hint == 'auto':
-        domain = detect_domain(user_request)
+        domain = detect_domain(user_request, matches)
     else:
         domain = domain_hint
     
@@ -179,19 +397,19 @@ def parse_intent(user_request: str, domain_hint: str = 'auto') -> Dict:
     if domain == 'portrait':
         # Subject
         intent['subject'] = {
-            'gender': detect_gender(user_request),
-            'ethnicity': detect_ethnicity(user_request),
-            'age_range': detect_age_range(user_request)
+            'gender': detect_gender(user_request, matches),
+            'ethnicity': detect_ethnicity(user_request, matches),
+            'age_range': detect_age_range(user_request, matches)
         }
         
         # Era
-        era = detect_value(user_request, ERA_KEYWORDS, 'modern')
+        era = detect_value(user_request, ERA_KEYWORDS, 'modern', matches)
         intent['scene'] = {
             'era': era
         }
         
         # Clothing - influenced by era
-        clothing = detect_value(user_request, CLOTHING_KEYWORDS, None)
+        clothing = detect_value(user_request, CLOTHING_KEYWORDS, None, matches)
         if clothing is None:
             clothing = 'traditional_chinese' if era == 'ancient' else 'modern'
         
@@ -199,7 +417,7 @@ def parse_intent(user_request: str, domain_hint: str = 'auto') -> Dict:
         hairstyle = 'ancient_chinese' if clothing == 'traditional_chinese' else 'modern'
         
         # Makeup - influenced by era and culture
-        makeup = detect_value(user_request, MAKEUP_KEYWORDS, None)
+        makeup = detect_value(user_request, MAKEUP_KEYWORDS, None, matches)
         if makeup is None:
             if era == 'ancient':
                 makeup = 'traditional_chinese'
@@ -213,13 +431,13 @@ def parse_intent(user_request: str, domain_hint: str = 'auto') -> Dict:
         }
         
         # Lighting
-        lighting = detect_value(user_request, LIGHTING_KEYWORDS, 'natural')
+        lighting = detect_value(user_request, LIGHTING_KEYWORDS, 'natural', matches)
         intent['lighting'] = {
             'lighting_type': lighting
         }
         
         # Director style
-        director = detect_value(user_request, DIRECTOR_KEYWORDS, None)
+        director = detect_value(user_request, DIRECTOR_KEYWORDS, None, matches)
         if director:
             intent['scene']['director_style'] = director
             # Override lighting for specific directors
@@ -227,57 +445,29 @@ def parse_intent(user_request: str, domain_hint: str = 'auto') -> Dict:
                 intent['lighting']['lighting_type'] = 'cinematic'
         
         # Art style detection
-        art_styles = {
-            'anime': ['动漫', '二次元', 'anime'],
-            'realistic': ['写实', '真实', 'realistic'],
-            'cinematic': ['电影级', '电影', 'cinematic'],
-            'illustration': ['插画', 'illustration']
-        }
-        art_style = detect_value(user_request, art_styles, 'realistic')
+        art_style = detect_value(user_request, ART_STYLE_KEYWORDS, 'realistic', matches)
         intent['technical'] = {
             'art_style': art_style
         }
     
     elif domain == 'art':
         # Art-specific parsing
-        art_types = {
-            'ink_wash': ['水墨', '国画', 'ink wash'],
-            'oil_painting': ['油画', 'oil painting'],
-            'watercolor': ['水彩', 'watercolor'],
-            'sketch': ['素描', 'sketch']
-        }
-        intent['art_type'] = detect_value(user_request, art_types, 'ink_wash')
+        intent['art_type'] = detect_value(user_request, ART_TYPE_KEYWORDS, 'ink_wash', matches)
         
         # Subject for art
-        subject_types = {
-            'landscape': ['山水', '风景', 'landscape'],
-            'still_life': ['静物', 'still life'],
-            'abstract': ['抽象', 'abstract']
-        }
-        intent['subject_type'] = detect_value(user_request, subject_types, 'landscape')
+        intent['subject_type'] = detect_value(user_request, ART_SUBJECT_KEYWORDS, 'landscape', matches)
     
     elif domain == 'design':
         # Design-specific parsing
-        design_types = {
-            'bento_grid': ['Bento', 'bento', '网格'],
-            'glassmorphism': ['玻璃态', 'glassmorphism', 'glass'],
-            'poster': ['海报', 'poster'],
-            'ui': ['UI', 'ui', '界面']
-        }
-        intent['design_type'] = detect_value(user_request, design_types, 'poster')
+        intent['design_type'] = detect_value(user_request, DESIGN_TYPE_KEYWORDS, 'poster', matches)
     
     elif domain == 'product':
         # Product-specific parsing
-        product_types = {
-            'luxury': ['奢华', '高端', 'luxury'],
-            'commercial': ['商业', 'commercial'],
-            'minimal': ['极简', 'minimal']
-        }
-        intent['product_style'] = detect_value(user_request, product_types, 'commercial')
+        intent['product_style'] = detect_value(user_request, PRODUCT_STYLE_KEYWORDS, 'commercial', matches)
     
     return intent
 
 
-def format_intent_json(intent: Dict) -> str:
-    """Format intent as pretty JSON string."""
-    return json.dumps(intent, ensure_ascii=False, indent=2)
+def format_intent_json(intent: Dict, compact: bool = False) -> str:
+    """Format intent as JSON string (pretty unless compact)."""
+    return dumps(intent, compact)
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+JSON Output - Shared encoder for tool responses
+
+Tool responses default to readable `indent=2` JSON. High-volume callers can ask
+for compact output (no whitespace, optionally short element keys), which is
+encoded with orjson when it is installed (imported on first compact dump).
+"""
+
+import json
+from typing import Any, Dict, List, Optional, Sequence
+
+# orjson module, None when not installed, False until first use
+_orjson = False
+
+
+# Element field → short key used with short_keys=True
+SHORT_KEYS = {
+    'handle': 'h',
+    'element_id': 'id',
+    'name': 'n',
+    'chinese_name': 'cn',
+    'template': 't',
+    'keywords': 'kw',
+    'reusability_score': 'rs',
+    'relevance_score': 'rel',
+}
+
+
+def _load_orjson():
+    global _orjson
+    if _orjson is False:
+        try:
+            import orjson
+        except ImportError:
+            orjson = None
+        _orjson = orjson
+    return _orjson
+
+
+def dumps(data: Any, compact: bool = False) -> str:
+    """
+    Encode a tool response.
+
+    Args:
+        data: JSON-serializable value
+        compact: No indentation or spaces (orjson when available)
+
+    Returns:
+        JSON string (non-ASCII characters kept as-is)
+    """
+    if not compact:
+        return json.dumps(data, ensure_ascii=False, indent=2)
+    orjson = _load_orjson()
+    if orjson is not None:
+        try:
+            return orjson.dumps(data).decode('utf-8')
+        except TypeError:
+            # Values orjson does not handle (e.g. non-str keys, big ints)
+            pass
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+
+
+def project(items: List[Dict], fields: Optional[Sequence[str]] = None,
+            short_keys: bool = False) -> List[Dict]:
+    """
+    Keep only the requested fields of each item, optionally renaming to short keys.
+
+    Args:
+        items: Dicts to project (not modified)
+        fields: Field names in output order (None keeps all)
+        short_keys: Rename keys using SHORT_KEYS
+
+    Returns:
+        New list of dicts
+    """
+    if not fields and not short_keys:
+        return items
+
+    result = []
+    for item in items:
+        keys = fields if fields else item.keys()
+        projected = {key: item[key] for key in keys if key in item}
+        if short_keys:
+            projected = {SHORT_KEYS.get(key, key): value for key, value in projected.items()}
+        result.append(projected)
+    return result
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Pipeline Tool - One-shot prompt generation inside the server
+
+The documented workflow (parse → query → check → compose) costs five tool
+calls, each shipping element payloads to the client as indented JSON and
+back. generate_prompt runs the whole pipeline in-process: parse the request,
+then the framework-driven generator for the detected domain fills the intent,
+selects elements from prefetched pools, checks and resolves conflicts and
+composes the prompt. Only the prompt (and an optional compact trace) leaves
+the server.
+
+batch_generate_prompts does the same for many descriptions: identical
+(normalized) requests run once, one candidate prefetch is shared by every
+worker, and results are reported as they finish.
+"""
+
+import asyncio
+import logging
+import sys
+import threading
+import time
+import unicodedata
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Dict, Iterator, List, Optional
+
+from mcp_server.tools.intent_parser import parse_intent
+from mcp_server.tools.json_output import dumps
+
+logger = logging.getLogger(__name__)
+
+
+_stdout_lock = threading.Lock()
+_stdout_depth = 0
+_stdout_saved = None
+
+
+@contextmanager
+def stdout_to_stderr() -> Iterator[None]:
+    """
+    Send library progress prints to stderr while the pipeline runs.
+
+    The stdio transport owns stdout. The generators print their steps, so
+    sys.stdout is pointed at stderr while any pipeline is active (reference
+    counted, safe with concurrent pipelines on worker threads).
+    """
+    global _stdout_depth, _stdout_saved
+    with _stdout_lock:
+        if _stdout_depth == 0:
+            _stdout_saved, sys.stdout = sys.stdout, sys.stderr
+        _stdout_depth += 1
+    try:
+        yield
+    finally:
+        with _stdout_lock:
+            _stdout_depth -= 1
+            if _stdout_depth == 0:
+                sys.stdout, _stdout_saved = _stdout_saved, None
+
+
+async def generate_prompt(
+    user_request: str,
+    domain: str = 'auto',
+    mode: str = 'auto',
+    trace: bool = False,
+    engine=None
+) -> Dict:
+    """
+    Run parse, select, check, resolve and compose in one call.
+
+    Args:
+        user_request: Natural-language description
+        domain: Domain hint (portrait/art/design/product/video/auto)
+        mode: Composition mode (simple/auto/detailed)
+        trace: Include a compact trace of every stage
+        engine: Shared EngineContext (defaults to get_engine())
+
+    Returns:
+        {'prompt', 'domain', 'elements_used'} plus 'trace' when requested
+    """
+    if engine is None:
+        from mcp_server.engine import get_engine
+        engine = get_engine()
+
+    start = time.perf_counter()
+    intent = parse_intent(user_request, domain)
+    parse_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    with stdout_to_stderr():
+        result = await engine.generators.generate_by_framework(
+            intent, domain=intent.get('domain'), mode=mode
+        )
+    generate_ms = (time.perf_counter() - start) * 1000
+
+    output = {
+        'prompt': result['prompt'],
+        'domain': intent.get('domain'),
+        'elements_used': len(result['elements']),
+    }
+    if trace:
+        output['trace'] = build_trace(intent, result, parse_ms, generate_ms)
+    return output
+
+
+def normalize_request(text: str) -> str:
+    """Canonical form used to dedupe batch requests (NFKC, collapsed whitespace, lower case)."""
+    return ' '.join(unicodedata.normalize('NFKC', text).split()).lower()
+
+
+async def batch_generate_prompts(
+    descriptions: List[str],
+    domain: str = 'auto',
+    mode: str = 'auto',
+    engine=None,
+    on_result: Optional[Callable[[List[int], Dict], Awaitable[None]]] = None
+) -> Dict:
+    """
+    Generate prompts for many descriptions in one call.
+
+    Args:
+        descriptions: Natural-language descriptions
+        domain: Domain hint applied to every description
+        mode: Composition mode (simple/auto/detailed)
+        engine: Shared EngineContext (defaults to get_engine())
+        on_result: Optional async callback(indices, output) invoked as each
+            unique request finishes (indices of all descriptions it answers);
+            its errors are logged and do not stop the batch
+
+    Returns:
+        {'results': [per description, input order], 'stats': throughput figures}
+    """
+    if engine is None:
+        from mcp_server.engine import get_engine
+        engine = get_engine()
+    generators = engine.generators
+
+    start = time.perf_counter()
+
+    # Dedupe: one intent per normalized request
+    intents: Dict[str, Dict] = {}
+    indices: Dict[str, List[int]] = {}
+    for i, description in enumerate(descriptions):
+        key = normalize_request(description)
+        if key not in intents:
+            intents[key] = parse_intent(key, domain)
+        indices.setdefault(key, []).append(i)
+
+    outputs: Dict[str, Dict] = {}
+    latencies: List[float] = []
+
+    async def run(key: str, intent: Dict):
+        t = time.perf_counter()
+        try:
+            result = await generators.generate_by_framework(
+                intent, domain=intent.get('domain'), mode=mode, pools=pools
+            )
+            output = {
+                'prompt': result['prompt'],
+                'domain': intent.get('domain'),
+                'elements_used': len(result['elements']),
+            }
+        except Exception as e:
+            output = {'error': f"{type(e).__name__}: {e}", 'domain': intent.get('domain')}
+        return key, output, (time.perf_counter() - t) * 1000
+
+    with stdout_to_stderr():
+        # One shared prefetch for every category the batch touches
+        t = time.perf_counter()
+        pools = await generators.prefetch_for_intents(list(intents.values())) if intents else {}
+        prefetch_ms = (time.perf_counter() - t) * 1000
+
+        tasks = [asyncio.ensure_future(run(key, intent)) for key, intent in intents.items()]
+        try:
+            for finished in asyncio.as_completed(tasks):
+                key, output, latency = await finished
+                outputs[key] = output
+                latencies.append(latency)
+                if on_result is not None:
+                    try:
+                        await on_result(indices[key], output)
+                    except Exception:
+                        logger.warning("Batch result callback failed; continuing", exc_info=True)
+        finally:
+            # Cancelled (or failed) before every request finished: leave no task behind
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    elapsed = time.perf_counter() - start
+
+    results = [None] * len(descriptions)
+    for key, positions in indices.items():
+        for i in positions:
+            results[i] = {'index': i, **outputs[key]}
+
+    return {
+        'results': results,
+        'stats': {
+            'total': len(descriptions),
+            'unique': len(intents),
+            'duplicates': len(descriptions) - len(intents),
+            'errors': sum(1 for output in outputs.values() if 'error' in output),
+            'workers': generators.max_workers,
+            'prefetch_ms': round(prefetch_ms, 2),
+            'elapsed_ms': round(elapsed * 1000, 2),
+            'prompts_per_second': round(len(descriptions) / elapsed, 2) if elapsed else None,
+            'unique_per_second': round(len(intents) / elapsed, 2) if elapsed else None,
+            'latency_ms': {
+                'avg': round(sum(latencies) / len(latencies), 2) if latencies else 0.0,
+                'max': round(max(latencies), 2) if latencies else 0.0,
+            },
+        },
+    }
+
+
+def build_trace(intent: Dict, result: Dict, parse_ms: float, generate_ms: float) -> Dict:
+    """Compact per-stage trace (element references instead of full payloads)."""
+    return {
+        'parsed_intent': {k: v for k, v in intent.items() if k != 'raw_request'},
+        'intent': {k: v for k, v in result['intent'].items() if k != 'raw_request'},
+        'validation_issues': [issue['message'] for issue in result['validation_issues']],
+        'elements': [
+            {'element_id': e.get('element_id'), 'category': e.get('category'),
+             'chinese_name': e.get('chinese_name')}
+            for e in result['elements']
+        ],
+        'consistency_issues': [issue['type'] for issue in result['consistency_issues']],
+        'fixes': result['fixes'],
+        'missing': [item['description'] for item in result['completeness_issues']],
+        'timings_ms': {
+            'parse': round(parse_ms, 2),
+            'generate': round(generate_ms, 2),
+            **{k: round(v, 2) for k, v in result['query_timings'].items()},
+        },
+    }
+
+
+def format_pipeline_json(output: Dict) -> str:
+    """Format pipeline output as compact JSON (no indentation)."""
+    return dumps(output, compact=True)
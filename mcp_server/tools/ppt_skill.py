@@ -7,29 +7,51 @@ PPT Skill Tool - Generates PPT images using Nano Banana Pro logic.
 import sys
 import os
 import json
+import logging
+import threading
 import time
 from datetime import datetime
 from typing import Dict, Optional, Any
 
-# Add project root and external dependency to path
+logger = logging.getLogger(__name__)
+
+# External dependency location (added to sys.path on first use)
 current_dir = os.path.dirname(os.path.abspath(__file__))
 project_root = os.path.dirname(os.path.dirname(current_dir))
 external_dir = os.path.join(project_root, 'mcp_server', 'external', 'NanoBanana-PPT-Skills')
-sys.path.insert(0, external_dir)
 
-try:
-    from google import genai
-    from google.genai import types
-    # Import functions from the cloned repo
-    # We need to make sure the import works. 
-    # generate_ppt.py is in the root of external_dir.
-    # Since we added external_dir to sys.path, we can import generate_ppt directly if it was a module,
-    # but it's a script. We can import it as a module.
-    import generate_ppt as nanobanana_lib
-except ImportError as e:
-    # Handle cases where dependencies are missing
-    nanobanana_lib = None
-    print(f"Warning: Failed to import dependencies: {e}")
+# google-genai and the NanoBanana scripts are slow to import; they are loaded
+# by _load_dependencies() on the first PPT request, not at server startup.
+genai = None
+types = None
+nanobanana_lib = None
+_load_error: Optional[str] = None
+_load_lock = threading.Lock()
+
+
+def _load_dependencies() -> bool:
+    """Import google-genai and the NanoBanana scripts once; returns whether they are available."""
+    global genai, types, nanobanana_lib, _load_error
+    if nanobanana_lib is not None or _load_error is not None:
+        return nanobanana_lib is not None
+
+    with _load_lock:
+        if nanobanana_lib is None and _load_error is None:
+            if external_dir not in sys.path:
+                sys.path.insert(0, external_dir)
+            try:
+                from google import genai as genai_module
+                from google.genai import types as types_module
+                # generate_ppt.py is a script in the root of external_dir
+                import generate_ppt as nanobanana_module
+            except ImportError as e:
+                # Handle cases where dependencies are missing
+                _load_error = str(e)
+                logger.warning("Failed to import dependencies: %s", e)
+            else:
+                genai, types, nanobanana_lib = genai_module, types_module, nanobanana_module
+
+    return nanobanana_lib is not None
 
 def _get_gemini_client():
     api_key = os.environ.get("GEMINI_API_KEY")
@@ -105,12 +127,12 @@ def generate_ppt(description: str, pages: int = 5, style: str = "gradient-glass"
     Returns:
         JSON string with result summary.
     """
-    if not nanobanana_lib:
+    if not _load_dependencies():
         return json.dumps({"error": "Dependency 'NanoBanana-PPT-Skills' or 'google-genai' not found."})
 
     try:
         # 1. Generate Plan
-        print(f"Generating plan for: {description[:50]}...")
+        logger.info("Generating plan for: %s...", description[:50])
         plan = _generate_plan(description, pages)
         
         # 2. Setup Output
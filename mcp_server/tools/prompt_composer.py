@@ -11,12 +11,9 @@ from typing import Dict, List, Optional
 
 
 # Add project root to path for imports
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
-
-try:
-    from skill_library.intelligent_generator import IntelligentGenerator
-except ImportError:
-    IntelligentGenerator = None
+_PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if _PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, _PROJECT_ROOT)
 
 
 # Template for manual composition when engine not available
@@ -29,7 +26,8 @@ def compose_prompt(
     elements: List[Dict],
     mode: str = 'auto',
     keywords_limit: int = 3,
-    subject_desc: str = ''
+    subject_desc: str = '',
+    generator=None
 ) -> str:
     """
     Compose elements into a final AI image prompt.
@@ -39,13 +37,23 @@ def compose_prompt(
         mode: Composition mode (simple/auto/detailed)
         keywords_limit: Max keywords per element
         subject_desc: Optional subject description override
+        generator: Optional shared IntelligentGenerator (not closed here);
+            a temporary one is created when omitted
     
     Returns:
         Complete prompt string
     """
     # Try using the core engine
-    if IntelligentGenerator:
+    if generator is not None:
+        try:
+            return generator.compose_prompt(elements, mode=mode, keywords_limit=keywords_limit)
+        except Exception:
+            # Fall back to manual composition
+            pass
+    else:
+        # Imported on first use (keeps server startup light)
         try:
+            from skill_library.intelligent_generator import IntelligentGenerator
             gen = IntelligentGenerator()
             prompt = gen.compose_prompt(elements, mode=mode, keywords_limit=keywords_limit)
             gen.close()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Library Writer - The server's write-side operations behind one owner
+
+Reads (element index, framework plan, stats) are served by every process;
+writes go through one place so concurrent workers never contend for the
+SQLite write lock or each run the job queue:
+
+- saving generated prompts (generated_prompts, prompt_elements and the
+  element usage stats)
+- the background job queue (jobs table + job workers)
+
+A single-process server uses a local LibraryWriter and JobManager. The
+pre-forked HTTP mode (prefork.py) runs them in one writer process started by
+start_writer(); workers reach them through connect_writer() proxies with the
+same methods.
+"""
+
+import os
+import tempfile
+import threading
+from multiprocessing.managers import BaseManager
+from typing import Dict, List, Optional, Tuple
+
+from skill_library.constants import DEFAULT_DB_PATH
+from mcp_server.jobs import (
+    DEFAULT_JOB_WORKERS, DEFAULT_JOBS_DB_PATH, JobManager, JobStore, stand_in_runners
+)
+
+
+class LibraryWriter:
+    """Write-side operations on the element library."""
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH):
+        self.db_path = db_path
+        self.saved = 0
+        self._lock = threading.Lock()
+
+    def save_prompt(self, prompt_text: str, user_intent: str, elements_used: List[Dict],
+                    style_tag: Optional[str] = None, quality_score: float = 9.0) -> int:
+        """
+        Save a generated prompt and update element usage stats.
+
+        Args:
+            prompt_text: Final prompt
+            user_intent: Original request
+            elements_used: Elements with element_id (category / field_name optional)
+            style_tag: Optional style tag
+            quality_score: Quality score recorded for usage stats
+
+        Returns:
+            prompt_id
+        """
+        from skill_library.intelligent_generator import save_generated_prompt
+        from mcp_server.tools.pipeline import stdout_to_stderr
+
+        with self._lock, stdout_to_stderr():
+            prompt_id = save_generated_prompt(
+                prompt_text, user_intent, elements_used, style_tag=style_tag,
+                quality_score=quality_score, db_path=self.db_path
+            )
+            self.saved += 1
+        return prompt_id
+
+    def stats(self) -> Dict:
+        return {'pid': os.getpid(), 'saved': self.saved}
+
+
+# ============================================================
+# Writer process (pre-forked mode)
+# ============================================================
+
+class WriterManager(BaseManager):
+    """Serves the writer-process LibraryWriter and JobManager."""
+
+
+# Created in the writer process by _init_writer()
+_writer: Optional[LibraryWriter] = None
+_jobs: Optional[JobManager] = None
+
+
+def _get_writer() -> LibraryWriter:
+    return _writer
+
+
+def _get_jobs() -> JobManager:
+    return _jobs
+
+
+WriterManager.register('writer', callable=_get_writer)
+WriterManager.register('jobs', callable=_get_jobs)
+
+
+def _init_writer(db_path: str, jobs_db_path: str, job_workers: int, stand_in: bool):
+    global _writer, _jobs
+    _writer = LibraryWriter(db_path)
+    _jobs = JobManager(JobStore(jobs_db_path), job_workers,
+                       stand_in_runners() if stand_in else None)
+    _jobs.resume()
+
+
+def start_writer(db_path: str = DEFAULT_DB_PATH, jobs_db_path: str = DEFAULT_JOBS_DB_PATH,
+                 job_workers: int = DEFAULT_JOB_WORKERS,
+                 stand_in: bool = False) -> Tuple[WriterManager, str, bytes]:
+    """
+    Start the writer process.
+
+    Args:
+        db_path: Element library (saved prompts, usage stats)
+        jobs_db_path: Job table file
+        job_workers: Background jobs run concurrently
+        stand_in: Run jobs with local stand-in generators
+
+    Returns:
+        (manager, address, authkey); workers pass address and authkey to
+        connect_writer(), the caller shuts the manager down on exit
+    """
+    address = os.path.join(tempfile.mkdtemp(prefix='skill-writer-'), 'writer.sock')
+    authkey = os.urandom(16)
+    manager = WriterManager(address=address, authkey=authkey)
+    manager.start(_init_writer, (db_path, jobs_db_path, job_workers, stand_in))
+    return manager, address, authkey
+
+
+def connect_writer(address: str, authkey: bytes):
+    """
+    Connect to the writer process.
+
+    Returns:
+        (LibraryWriter proxy, JobManager proxy)
+    """
+    manager = WriterManager(address=address, authkey=authkey)
+    manager.connect()
+    return manager.writer(), manager.jobs()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+MCP服务器启动耗时检查
+Startup-time budget check for the MCP server
+
+在全新的Python进程中（冷启动）导入服务器模块并预热EngineContext，
+分阶段报告耗时（使用数据库的临时副本，检查不会改动原数据库）；总耗时超出预算，或启动时加载了应延迟加载的模块
+（google-genai、NanoBanana脚本、异步生成器）时以非零状态退出。
+
+用法:
+    python scripts/check_startup.py [--budget 1.0] [--db extracted_results/elements.db]
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_BUDGET = 1.0
+
+# 只应在首次使用时加载的模块
+DEFERRED_MODULES = ('google.genai', 'generate_ppt', 'skill_library.async_generator')
+
+# 子进程：导入服务器（没有安装mcp时导入服务器使用的全部工具模块）+ 预热
+CHILD = r'''
+import json, sys, time
+start = time.perf_counter()
+timings = {}
+
+try:
+    import mcp  # noqa: F401
+    has_mcp = True
+except ImportError:
+    has_mcp = False
+
+t = time.perf_counter()
+if has_mcp:
+    import mcp_server.server
+else:
+    import mcp_server.tools.intent_parser, mcp_server.tools.element_query
+    import mcp_server.tools.consistency_checker, mcp_server.tools.prompt_composer
+    import mcp_server.tools.ppt_skill, mcp_server.tools.image_generator, mcp_server.tools.pipeline
+    import mcp_server.prompts.portrait, mcp_server.prompts.art, mcp_server.prompts.design
+    import mcp_server.engine
+timings['import'] = time.perf_counter() - t
+
+from mcp_server.engine import EngineContext
+t = time.perf_counter()
+engine = EngineContext(db_path=sys.argv[1], jobs_db_path=sys.argv[3])
+timings['engine'] = time.perf_counter() - t
+
+t = time.perf_counter()
+phases = engine.warm_up()
+timings['warm_up'] = time.perf_counter() - t
+timings['total'] = time.perf_counter() - start
+engine.close()
+
+print(json.dumps({
+    'has_mcp': has_mcp,
+    'timings': timings,
+    'warm_up_ms': phases,
+    'loaded': [m for m in sys.argv[2].split(',') if m in sys.modules],
+}))
+'''
+
+
+def copy_database(db_path: str, directory: str) -> str:
+    """把数据库（含WAL中的内容）复制到临时目录，返回副本路径"""
+    copy_path = os.path.join(directory, os.path.basename(db_path))
+    src = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    dst = sqlite3.connect(copy_path)
+    try:
+        src.backup(dst)
+    finally:
+        dst.close()
+        src.close()
+    return copy_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check MCP server cold-start time against a budget")
+    parser.add_argument('--budget', type=float, default=DEFAULT_BUDGET, help="秒（默认1.0）")
+    parser.add_argument('--db', default='', help="数据库路径（默认使用服务器的默认数据库）")
+    args = parser.parse_args()
+
+    sys.path.insert(0, PROJECT_ROOT)
+    from skill_library.constants import DEFAULT_DB_PATH
+
+    env = dict(os.environ, PYTHONPATH=PROJECT_ROOT + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    workdir = tempfile.mkdtemp(prefix='check-startup-')
+    try:
+        db_copy = copy_database(args.db or DEFAULT_DB_PATH, workdir)
+        proc = subprocess.run(
+            [sys.executable, '-c', CHILD, db_copy, ','.join(DEFERRED_MODULES),
+             os.path.join(workdir, 'jobs.db')],
+            cwd=PROJECT_ROOT, env=env, capture_output=True, text=True
+        )
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    if proc.returncode != 0:
+        print(proc.stderr, file=sys.stderr)
+        print("❌ 启动失败")
+        sys.exit(1)
+
+    report = json.loads(proc.stdout.strip().splitlines()[-1])
+    timings = report['timings']
+
+    print(f"{'服务器模块' if report['has_mcp'] else '工具模块（未安装mcp）'}导入: {timings['import'] * 1000:.1f}ms")
+    print(f"EngineContext 创建: {timings['engine'] * 1000:.1f}ms")
+    print(f"预热: {timings['warm_up'] * 1000:.1f}ms "
+          f"({', '.join(f'{k} {v:.1f}ms' for k, v in report['warm_up_ms'].items())})")
+    print(f"总计: {timings['total'] * 1000:.1f}ms（预算 {args.budget * 1000:.0f}ms）")
+
+    failed = False
+    if report['loaded']:
+        print(f"❌ 启动时加载了应延迟加载的模块: {', '.join(report['loaded'])}")
+        failed = True
+    if timings['total'] > args.budget:
+        print("❌ 超出启动预算")
+        failed = True
+
+    if failed:
+        sys.exit(1)
+    print("✅ 启动耗时在预算内")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,33 @@
 """
 Skill Prompt Generator Library (Antigravity Skills Collection)
 Core logic for parsing user intent, querying elements, and composing prompts.
+
+Classes are imported on first access, so importing one submodule (e.g. from
+the MCP server or `python -m skill_library.intent_validator`) does not load
+the whole library.
 """
 
-from .element_db import ElementDB
-from .intelligent_generator import IntelligentGenerator
-from .framework_loader import FrameworkLoader
+import importlib
+
+# Public name → submodule defining it
+_EXPORTS = {
+    'ElementDB': '.element_db',
+    'IntelligentGenerator': '.intelligent_generator',
+    'FrameworkLoader': '.framework_loader',
+    'AsyncIntelligentGenerator': '.async_generator',
+}
+
+__all__ = ['ElementDB', 'IntelligentGenerator', 'FrameworkLoader', 'AsyncIntelligentGenerator']
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module, __name__), name)
+    globals()[name] = value
+    return value
+
 
-__all__ = ['ElementDB', 'IntelligentGenerator', 'FrameworkLoader']
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+异步生成器门面 - 供并发请求场景（如MCP服务器）使用
+Asyncio facade over IntelligentGenerator / FrameworkDrivenGenerator
+
+数据库工作在有界线程池中执行，每个工作线程持有自己的sqlite连接，
+因此多个请求可以并行重叠，而不是排队等待同一个连接。
+"""
+
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .candidate_cursor import DEFAULT_PAGE_SIZE
+from .constants import DEFAULT_DB_PATH, DEFAULT_DOMAIN, DEFAULT_FRAMEWORK_PATH
+from .intelligent_generator import IntelligentGenerator
+
+
+class AsyncIntelligentGenerator:
+    """IntelligentGenerator 的 asyncio 门面（线程池 + 每线程连接）"""
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH,
+                 framework_path: str = DEFAULT_FRAMEWORK_PATH,
+                 max_workers: Optional[int] = None,
+                 default_timeout: Optional[float] = None,
+                 reload_manager=None):
+        """
+        初始化
+
+        参数:
+            db_path: 数据库路径
+            framework_path: 默认领域（portrait）的框架配置文件路径；其他领域
+                按 intent['domain'] 路由到各自的框架文件
+            max_workers: 工作线程数上限（默认 min(8, CPU数+4)）
+            default_timeout: 默认单次调用超时（秒），None表示不限时
+            reload_manager: 可选的ReloadManager；每次调用开始时工作线程
+                切换到最新的框架计划和知识库
+        """
+        self.db_path = db_path
+        self.framework_path = framework_path
+        self.default_timeout = default_timeout
+        self.reload_manager = reload_manager
+
+        if max_workers is None:
+            max_workers = min(8, (os.cpu_count() or 1) + 4)
+        self.max_workers = max_workers
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix='async-generator'
+        )
+        self._local = threading.local()
+        self._generators: List[IntelligentGenerator] = []
+        self._lock = threading.Lock()
+        self._closed = False
+
+    # ========== 线程内资源 ==========
+
+    def _thread_generator(self) -> IntelligentGenerator:
+        """获取当前工作线程独占的IntelligentGenerator（首次使用时创建）"""
+        gen = getattr(self._local, 'generator', None)
+        snapshot = self.reload_manager.snapshot if self.reload_manager is not None else None
+
+        if gen is None:
+            # 关闭时由调用方线程统一释放，因此允许跨线程close
+            gen = IntelligentGenerator(self.db_path, check_same_thread=False,
+                                       knowledge=snapshot.knowledge if snapshot else None)
+            self._local.generator = gen
+            self._local.version = snapshot.version if snapshot else None
+            with self._lock:
+                self._generators.append(gen)
+
+        elif snapshot is not None and self._local.version != snapshot.version:
+            # 计划已热加载：在两次调用之间切换，不影响正在执行的调用
+            # （框架计划在 _thread_framework_generator 中切换）
+            gen.set_knowledge(snapshot.knowledge)
+            self._local.version = snapshot.version
+
+        return gen
+
+    def _thread_framework_generator(self, intent: Optional[Dict] = None,
+                                    domain: Optional[str] = None):
+        """获取当前工作线程中某个领域的FrameworkDrivenGenerator（复用线程内连接）"""
+        router = getattr(self._local, 'framework_router', None)
+        if router is None:
+            from .framework_loader import FrameworkRouter
+            router = FrameworkRouter(
+                self.db_path, generator=self._thread_generator(),
+                framework_paths={DEFAULT_DOMAIN: self.framework_path}
+            )
+            self._local.framework_router = router
+
+        fgen = router.generator_for(router.resolve_domain(intent, domain))
+        if self.reload_manager is not None:
+            plan = self.reload_manager.snapshot.framework_plan
+            if plan.domain == fgen.domain and plan is not fgen.plan:
+                fgen.set_plan(plan)
+        return fgen
+
+    # ========== 调度 ==========
+
+    async def _run(self, fn: Callable[[IntelligentGenerator], Any],
+                   timeout: Optional[float]) -> Any:
+        """
+        在线程池中执行 fn(线程内generator)
+
+        超时或被取消时中断该线程上正在执行的sqlite查询；
+        尚未开始执行的任务会直接被取消。
+
+        中断与任务结束由每个任务自己的锁同步：任务结束时在锁内登记，
+        之后不再中断，因此不会误中断该工作线程接着执行的下一个任务。
+        """
+        if self._closed:
+            raise RuntimeError("AsyncIntelligentGenerator 已关闭")
+
+        task_lock = threading.Lock()
+        running = {'generator': None, 'abandoned': False}
+
+        def call():
+            with task_lock:
+                if running['abandoned']:
+                    raise asyncio.CancelledError()
+                gen = self._thread_generator()
+                running['generator'] = gen
+            try:
+                return fn(gen)
+            finally:
+                with task_lock:
+                    running['generator'] = None
+
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._executor, call)
+
+        if timeout is None:
+            timeout = self.default_timeout
+
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except (asyncio.CancelledError, asyncio.TimeoutError):
+            with task_lock:
+                running['abandoned'] = True
+                # 只在该任务仍在执行时中断（任务结束前工作线程不会开始下一个任务）
+                if running['generator'] is not None:
+                    running['generator'].conn.interrupt()
+            raise
+
+    # ========== 异步API ==========
+
+    async def select_elements_by_intent(self, intent: Dict, reject_conflicts: bool = False,
+                                        timeout: Optional[float] = None) -> List[Dict]:
+        """异步版 IntelligentGenerator.select_elements_by_intent"""
+        return await self._run(
+            lambda gen: gen.select_elements_by_intent(intent, reject_conflicts=reject_conflicts), timeout
+        )
+
+    async def check_consistency(self, elements: List[Dict],
+                                timeout: Optional[float] = None) -> List[Dict]:
+        """异步版 IntelligentGenerator.check_consistency"""
+        return await self._run(lambda gen: gen.check_consistency(elements), timeout)
+
+    async def resolve_conflicts(self, elements: List[Dict], issues: List[Dict],
+                                timeout: Optional[float] = None) -> Tuple[List[Dict], List[str]]:
+        """异步版 IntelligentGenerator.resolve_conflicts"""
+        return await self._run(lambda gen: gen.resolve_conflicts(elements, issues), timeout)
+
+    async def compose_prompt(self, elements: List[Dict], mode: str = 'auto',
+                             keywords_limit: int = 3,
+                             timeout: Optional[float] = None) -> str:
+        """异步版 IntelligentGenerator.compose_prompt"""
+        return await self._run(
+            lambda gen: gen.compose_prompt(elements, mode=mode, keywords_limit=keywords_limit),
+            timeout
+        )
+
+    async def check_completeness(self, intent: Dict, prompt: str,
+                                 timeout: Optional[float] = None) -> List[Dict]:
+        """异步版 IntelligentGenerator.check_completeness"""
+        return await self._run(lambda gen: gen.check_completeness(intent, prompt), timeout)
+
+    async def get_element_by_category(self, domain: str, category: str,
+                                      value_filter: Optional[str] = None,
+                                      timeout: Optional[float] = None) -> Optional[Dict]:
+        """异步版 IntelligentGenerator.get_element_by_category"""
+        return await self._run(
+            lambda gen: gen.get_element_by_category(domain, category, value_filter), timeout
+        )
+
+    async def get_all_elements_by_category(self, domain: str, category: str,
+                                           value_filter: Optional[str] = None,
+                                           timeout: Optional[float] = None) -> List[Dict]:
+        """异步版 IntelligentGenerator.get_all_elements_by_category"""
+        return await self._run(
+            lambda gen: gen.get_all_elements_by_category(domain, category, value_filter), timeout
+        )
+
+    async def search_style_elements(self, keywords: List[str], domain: Optional[str] = None,
+                                    timeout: Optional[float] = None) -> List[Dict]:
+        """异步版 IntelligentGenerator.search_style_elements"""
+        return await self._run(lambda gen: gen.search_style_elements(keywords, domain), timeout)
+
+    async def generate(self, intent: Dict, mode: str = 'auto',
+                       timeout: Optional[float] = None) -> Dict:
+        """
+        完整流程：选择 → 一致性检查 → 冲突修正 → 组合
+
+        整个流程在同一个工作线程内执行，超时针对整个流程计算。
+        """
+        def pipeline(gen: IntelligentGenerator) -> Dict:
+            elements = gen.select_elements_by_intent(intent)
+            issues = gen.check_consistency(elements)
+            fixes = []
+            if issues:
+                elements, fixes = gen.resolve_conflicts(elements, issues)
+            prompt = gen.compose_prompt(elements, mode=mode)
+            return {
+                'elements': elements,
+                'prompt': prompt,
+                'consistency_issues': issues,
+                'fixes': fixes
+            }
+
+        return await self._run(pipeline, timeout)
+
+    async def generate_variants(self, intent: Dict, n: int = 8, seed: Optional[int] = None,
+                                diversity: float = 0.5, mode: str = 'auto',
+                                timeout: Optional[float] = None) -> List[Dict]:
+        """异步版 IntelligentGenerator.generate_variants"""
+        return await self._run(
+            lambda gen: gen.generate_variants(intent, n=n, seed=seed, diversity=diversity, mode=mode),
+            timeout
+        )
+
+    async def generate_by_framework(self, intent: Dict, timeout: Optional[float] = None,
+                                    domain: Optional[str] = None, mode: str = 'auto',
+                                    pools: Optional[Dict[Tuple[str, str], List[Dict]]] = None) -> Dict:
+        """
+        异步版 FrameworkDrivenGenerator.generate_by_framework（按领域路由）
+
+        pools: 可选，prefetch_for_intents 得到的共享候选池（工作线程直接采用，不再各自预取）
+        """
+        def generate(gen: IntelligentGenerator) -> Dict:
+            if pools:
+                gen.adopt_candidate_pools(pools)
+            return self._thread_framework_generator(intent, domain).generate_by_framework(intent, mode)
+
+        return await self._run(generate, timeout)
+
+    async def prefetch_for_intents(self, intents: List[Dict], domain: Optional[str] = None,
+                                   timeout: Optional[float] = None) -> Dict[Tuple[str, str], List[Dict]]:
+        """
+        在一个工作线程中为一批intent一次预取候选池（按领域分组）
+
+        返回:
+            {(领域, 类别): 元素列表}，传给 generate_by_framework(pools=...) 共享
+        """
+        def prefetch(gen: IntelligentGenerator) -> Dict[Tuple[str, str], List[Dict]]:
+            groups = {}
+            for intent in intents:
+                fgen = self._thread_framework_generator(intent, domain)
+                groups.setdefault(fgen.domain, (fgen, []))[1].append(intent)
+
+            pools = {}
+            for fgen, group in groups.values():
+                pools.update(fgen.prefetch_for_intents(group))
+            return pools
+
+        return await self._run(prefetch, timeout)
+
+    async def query_all_candidates_by_framework(self, intent: Dict,
+                                                limit: Optional[int] = DEFAULT_PAGE_SIZE,
+                                                timeout: Optional[float] = None,
+                                                domain: Optional[str] = None) -> Dict[str, List[Dict]]:
+        """异步版 FrameworkDrivenGenerator.query_all_candidates_by_framework（按领域路由）"""
+        def query(gen: IntelligentGenerator) -> Dict[str, List[Dict]]:
+            fgen = self._thread_framework_generator(intent, domain)
+            return fgen.query_all_candidates_by_framework(intent, limit)
+
+        return await self._run(query, timeout)
+
+    # ========== 生命周期 ==========
+
+    def close(self):
+        """等待执行中的任务结束，然后关闭所有线程连接"""
+        if self._closed:
+            return
+        self._closed = True
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            for gen in self._generators:
+                gen.close()
+            self._generators.clear()
+
+    async def aclose(self):
+        """异步关闭（不阻塞事件循环）"""
+        await asyncio.get_running_loop().run_in_executor(None, self.close)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分页候选游标
+Paged, lazily materialized candidate pools
+
+query_all_candidates_by_framework 原本把每个类别的全部元素一次性读入内存。
+CandidateCursor 按得分（reusability_score 降序）分页读取：每次只取一页，
+调用方需要更多时再取下一页。分页使用键集（score, rowid）而不是OFFSET，
+翻页代价与已读取的数量无关；续传令牌可以跨请求传回以继续读取。
+"""
+
+import base64
+import json
+import sqlite3
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+
+DEFAULT_PAGE_SIZE = 20
+
+
+def encode_token(domain: str, category: str, score: Optional[float], rowid: int) -> str:
+    """把续传位置编码为不透明令牌"""
+    raw = json.dumps([domain, category, score, rowid], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_token(token: str) -> Tuple[str, str, Optional[float], int]:
+    """解析续传令牌（格式错误时抛出ValueError）"""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        domain, category, score, rowid = json.loads(base64.urlsafe_b64decode(padded))
+        return domain, category, score, int(rowid)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"无效的续传令牌: {token}") from e
+
+
+class CandidateCursor:
+    """某个(领域, 类别)候选元素的分页游标，按得分降序惰性读取"""
+
+    def __init__(self, conn: sqlite3.Connection, domain: str, category: str,
+                 row_to_element: Callable[[Tuple], Dict],
+                 page_size: int = DEFAULT_PAGE_SIZE, limit: Optional[int] = None,
+                 token: Optional[str] = None):
+        """
+        参数:
+            conn: 数据库连接
+            domain: 领域
+            category: 类别
+            row_to_element: 查询行 → 元素字典
+            page_size: 每页数量
+            limit: 最多读取的元素数量（None表示不限）
+            token: 续传令牌（从上次读取的位置继续）
+        """
+        self.conn = conn
+        self.domain = domain
+        self.category = category
+        self.page_size = max(1, page_size)
+        self.limit = limit
+        self._row_to_element = row_to_element
+
+        # 最后读取位置 (score, rowid)；None表示从头开始
+        self._position: Optional[Tuple[Optional[float], int]] = None
+        if token:
+            token_domain, token_category, score, rowid = decode_token(token)
+            if (token_domain, token_category) != (domain, category):
+                raise ValueError(f"续传令牌不属于 {domain}/{category}")
+            self._position = (score, rowid)
+
+        self.fetched = 0
+        # 数据库中是否已没有更多元素
+        self.exhausted = False
+
+    @property
+    def token(self) -> Optional[str]:
+        """
+        当前位置的续传令牌
+
+        达到limit但数据库还有更多元素时仍返回令牌，可用新的游标继续读取；
+        已读完或尚未读取时为None
+        """
+        if self.exhausted or self._position is None:
+            return None
+        return encode_token(self.domain, self.category, *self._position)
+
+    @property
+    def remaining(self) -> Optional[int]:
+        """limit内还可以读取的数量（None表示不限）"""
+        return None if self.limit is None else max(0, self.limit - self.fetched)
+
+    def fetch(self, n: Optional[int] = None) -> List[Dict]:
+        """
+        读取下一批元素
+
+        参数:
+            n: 数量（默认一页；受limit限制）
+
+        返回:
+            元素列表（为空表示已读完）
+        """
+        if self.exhausted:
+            return []
+
+        n = self.page_size if n is None else n
+        if self.limit is not None:
+            n = min(n, self.remaining)
+        if n <= 0:
+            return []
+
+        query = """
+            SELECT element_id, name, chinese_name, ai_prompt_template,
+                   keywords, reusability_score, category_id, rowid
+            FROM elements
+            WHERE domain_id = ? AND category_id = ?
+        """
+        params = [self.domain, self.category]
+
+        # 键集分页（DESC排序时NULL在最后）
+        if self._position is not None:
+            score, rowid = self._position
+            if score is None:
+                query += " AND reusability_score IS NULL AND rowid > ?"
+                params.append(rowid)
+            else:
+                query += """ AND (reusability_score < ?
+                              OR (reusability_score = ? AND rowid > ?)
+                              OR reusability_score IS NULL)"""
+                params.extend([score, score, rowid])
+
+        query += " ORDER BY reusability_score DESC, rowid ASC LIMIT ?"
+        params.append(n + 1)
+
+        rows = self.conn.execute(query, params).fetchall()
+        has_more = len(rows) > n
+        rows = rows[:n]
+
+        if rows:
+            last = rows[-1]
+            self._position = (last[5], last[7])
+        self.fetched += len(rows)
+
+        if not has_more:
+            self.exhausted = True
+
+        return [self._row_to_element(row[:7]) for row in rows]
+
+    def __iter__(self) -> Iterator[Dict]:
+        """逐页惰性迭代剩余元素"""
+        while True:
+            page = self.fetch()
+            if not page:
+                return
+            yield from page
+
+    def page(self) -> Dict:
+        """读取一页并返回可序列化的结果 {'elements', 'next_token'}"""
+        elements = self.fetch()
+        return {'elements': elements, 'next_token': self.token}
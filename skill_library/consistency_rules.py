@@ -0,0 +1,548 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+统一的一致性规则集
+Declarative consistency rules compiled into per-category bit tests
+
+IntelligentGenerator.check_consistency 和 MCP 的 consistency_checker 原本各自
+用子串扫描检查颜色词。这里用声明式规则描述约束，由 RuleEngine 编译为：
+
+- 每个类别的规则列表（只检查与该类别相关的规则）
+- 每个上下文取值（人种/时代）的禁止/必需特征掩码
+
+元素特征来自 element_features 的离线特征表（未索引的元素按需提取并缓存；
+规则中不在基础词表里的词会追加到引擎的词表，此时按新词表提取），
+检查一个元素只是几次位运算。两个检查器保留各自原有的规则集和严重程度
+（生成器用 build_rules，MCP检查器的规则表在 consistency_checker 中），
+都通过 RuleEngine 得到违规列表，再各自格式化为自己的问题描述。
+"""
+
+import sqlite3
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from .element_features import FEATURE_COLUMNS, FeatureVocabulary, load_feature_table
+from .intelligent_generator import default_knowledge
+
+
+# 框架字段/MCP字段名 → 数据库类别
+CATEGORY_ALIASES = {
+    'facial.eyes': 'eye_types',
+    'styling.hair_color': 'hair_colors',
+    'styling.hairstyle': 'hairstyles',
+    'styling.clothing': 'clothing_styles',
+    'lighting.lighting_type': 'lighting_techniques',
+    'subject.ethnicity': 'ethnicity',
+}
+
+# 人种元素名称 → 标准人种名称（人种元素作为上下文时使用）
+ETHNICITY_NAMES = {
+    'east_asian': 'East_Asian',
+    'southeast_asian': 'Southeast_Asian',
+    'south_asian': 'South_Asian',
+    'european': 'European',
+    'african': 'African',
+    'middle_eastern': 'Middle_Eastern',
+    'latin_american': 'Latin_American',
+}
+
+# 允许出现多个元素的类别
+MULTI_ELEMENT_CATEGORIES = ('lighting_techniques', 'photography_techniques')
+
+
+def build_rules(knowledge: Optional[Dict] = None) -> List[Dict]:
+    """
+    IntelligentGenerator 的规则集
+
+    元素规则（unary）:
+        categories: 适用的类别
+        context: 规则依赖的上下文（'ethnicity' 或 'era'）
+        feature: 检查的特征列
+        forbidden: {上下文取值: [词]}，元素包含任一词即冲突
+        required: {上下文取值: [词]}，元素一个都不包含即冲突（可选）
+
+    组合规则（unique）:
+        key: 分组键（'category' 或 'template'），同组出现多个元素即冲突
+        exempt: 不检查的分组
+        allow_empty: 空键（如没有模板）也参与分组（默认跳过）
+
+    check_consistency 只有人种上下文（来自人种元素），时代规则只在选择阶段
+    给出时代上下文时生效（ConsistencyState、SelectionSolver）。
+    """
+    k = knowledge or default_knowledge()
+    return [
+        {
+            'name': 'ethnicity_eye_mismatch',
+            'severity': 'medium',
+            'categories': ('eye_types',),
+            'context': 'ethnicity',
+            'feature': 'eye_color',
+            'forbidden': k.get('ethnicity_incompatible_eyes', {}),
+        },
+        {
+            'name': 'ethnicity_hair_mismatch',
+            'severity': 'low',
+            'categories': ('hair_colors',),
+            'context': 'ethnicity',
+            'feature': 'hair_color',
+            'required': k.get('ethnicity_typical_hair', {}),
+        },
+        {
+            'name': 'era_clothing_mismatch',
+            'severity': 'high',
+            'categories': ('clothing_styles',),
+            'context': 'era',
+            'feature': 'era_marker',
+            'forbidden': k.get('era_incompatible_clothing', {}),
+        },
+        {
+            'name': 'era_lighting_mismatch',
+            'severity': 'medium',
+            'categories': ('lighting_techniques',),
+            'context': 'era',
+            'feature': 'lighting_type',
+            'forbidden': k.get('era_incompatible_lighting', {}),
+        },
+        {
+            'name': 'duplicate_category',
+            'severity': 'high',
+            'key': 'category',
+            'exempt': MULTI_ELEMENT_CATEGORIES,
+        },
+    ]
+
+
+def rule_words(rules: List[Dict]) -> Dict[str, List[str]]:
+    """元素规则中出现的词 {特征: [词]}（按规则顺序，供扩展特征词表）"""
+    words: Dict[str, List[str]] = {}
+    for rule in rules:
+        if 'key' in rule:
+            continue
+        feature_words = words.setdefault(rule['feature'], [])
+        for table in (rule.get('forbidden', {}), rule.get('required', {})):
+            for value_words in table.values():
+                feature_words.extend(value_words)
+    return words
+
+
+def element_category(element: Dict) -> Optional[str]:
+    """元素所属的数据库类别（兼容框架字段名）"""
+    category = element.get('category') or element.get('category_id') or element.get('field_name')
+    return CATEGORY_ALIASES.get(category, category)
+
+
+class RuleEngine:
+    """编译后的规则集：按类别索引的位测试 + 组合唯一性检查"""
+
+    def __init__(self, knowledge: Optional[Dict] = None,
+                 rules: Optional[List[Dict]] = None,
+                 include_template: bool = True):
+        """
+        参数:
+            knowledge: 常识知识库（默认使用内置知识库）
+            rules: 规则集（默认 build_rules(knowledge)）
+            include_template: 特征是否同时取自模板；False时只看名称，每次检查
+                都重新提取，不使用特征表和按element_id的缓存
+        """
+        self.knowledge = knowledge or default_knowledge()
+        self.rules = rules if rules is not None else build_rules(self.knowledge)
+        self.include_template = include_template
+
+        # 词表 = 基础词表 + 规则中出现的新词（知识库新增的颜色/服装/光影词）
+        self.vocabulary = FeatureVocabulary(rule_words(self.rules))
+
+        self._features: Dict[str, Tuple[int, ...]] = {}
+        self._categories: Dict[str, Optional[str]] = {}
+
+        # 类别 → [编译后的规则]；上下文 → 受其影响的类别
+        self.category_rules: Dict[str, List[Dict]] = {}
+        self.context_categories: Dict[str, set] = {}
+        self.unique_rules: List[Dict] = []
+
+        for rule in self.rules:
+            if 'key' in rule:
+                self.unique_rules.append({**rule, 'exempt': frozenset(rule.get('exempt', ()))})
+                continue
+
+            feature = rule['feature']
+            forbidden = rule.get('forbidden', {})
+            required = rule.get('required', {})
+            compiled = {
+                'name': rule['name'],
+                'severity': rule['severity'],
+                'context': rule['context'],
+                'feature': feature,
+                'column': FEATURE_COLUMNS.index(feature),
+                # 上下文取值 → (禁止掩码, 必需掩码)
+                'masks': {
+                    value: (self.vocabulary.mask(feature, forbidden.get(value, [])),
+                            self.vocabulary.mask(feature, required.get(value, [])))
+                    for value in set(forbidden) | set(required)
+                },
+            }
+            for category in rule['categories']:
+                self.category_rules.setdefault(category, []).append(compiled)
+                self.context_categories.setdefault(rule['context'], set()).add(category)
+
+    @classmethod
+    def from_connection(cls, conn: sqlite3.Connection,
+                        knowledge: Optional[Dict] = None) -> 'RuleEngine':
+        """预加载离线特征表（未索引的元素在检查时按需提取）"""
+        engine = cls(knowledge)
+        for element_id, (category, masks) in load_feature_table(conn, engine.vocabulary).items():
+            engine._features[element_id] = masks
+            engine._categories[element_id] = category
+        return engine
+
+    # ========== 特征 ==========
+
+    def features_for(self, element: Dict) -> Tuple[int, ...]:
+        """元素特征掩码（已索引的直接返回，未知元素提取后缓存）"""
+        if not self.include_template:
+            return self.vocabulary.extract(element, include_template=False)
+        element_id = element.get('element_id')
+        features = self._features.get(element_id) if element_id else None
+        if features is None:
+            features = self.vocabulary.extract(element)
+            if element_id:
+                self._features[element_id] = features
+                self._categories[element_id] = element_category(element)
+        return features
+
+    def indexed_elements(self) -> List[Tuple[str, Optional[str], Tuple[int, ...]]]:
+        """已缓存的元素 [(element_id, 类别, 特征掩码)]"""
+        return [(eid, self._categories.get(eid), masks) for eid, masks in self._features.items()]
+
+    # ========== 检查 ==========
+
+    def rules_for(self, category: Optional[str]) -> List[Dict]:
+        """该类别需要检查的规则"""
+        return self.category_rules.get(CATEGORY_ALIASES.get(category, category), [])
+
+    def match(self, rule: Dict, features: Tuple[int, ...], context: Dict) -> Optional[List[str]]:
+        """
+        单条规则的位测试
+
+        返回:
+            冲突时返回命中的禁止词（必需规则未满足时为空列表），不冲突返回None
+        """
+        masks = rule['masks'].get(context.get(rule['context']))
+        if masks is None:
+            return None
+
+        forbidden, required = masks
+        mask = features[rule['column']]
+        hit = mask & forbidden
+        if hit:
+            return self.vocabulary.mask_words(rule['feature'], hit)
+        if required and not mask & required:
+            return []
+        return None
+
+    def element_violations(self, element: Dict, context: Dict,
+                           category: Optional[str] = None) -> List[Dict]:
+        """单个元素在给定上下文下违反的规则"""
+        category = category or element_category(element)
+        rules = self.rules_for(category)
+        if not rules:
+            return []
+
+        features = self.features_for(element)
+        violations = []
+        for rule in rules:
+            matched = self.match(rule, features, context)
+            if matched is not None:
+                violations.append({
+                    'rule': rule['name'],
+                    'severity': rule['severity'],
+                    'category': CATEGORY_ALIASES.get(category, category),
+                    'element': element,
+                    'context': rule['context'],
+                    'value': context.get(rule['context']),
+                    'matched': matched,
+                })
+        return violations
+
+    @staticmethod
+    def unique_key(rule: Dict, element: Dict, category: Optional[str] = None) -> Optional[str]:
+        """组合规则的分组键（豁免或无键时返回None）"""
+        if rule['key'] == 'category':
+            key = CATEGORY_ALIASES.get(category, category) or element_category(element)
+        else:
+            key = element.get('template', element.get('ai_prompt_template', ''))
+        if (not key and not rule.get('allow_empty')) or key in rule['exempt']:
+            return None
+        return key
+
+    def unique_violations(self, elements: List[Dict]) -> List[Dict]:
+        """组合唯一性检查（同类别/同模板重复）"""
+        violations = []
+        for rule in self.unique_rules:
+            groups: Dict[str, List[Dict]] = {}
+            for elem in elements:
+                key = self.unique_key(rule, elem)
+                if key is not None:
+                    groups.setdefault(key, []).append(elem)
+
+            for key, group in groups.items():
+                if len(group) > 1:
+                    violations.append({
+                        'rule': rule['name'],
+                        'severity': rule['severity'],
+                        'key': key,
+                        'count': len(group),
+                        'elements': group,
+                    })
+        return violations
+
+    def verify(self) -> List[str]:
+        """
+        自检：每条元素规则的每个词都能触发（或满足）该规则
+
+        对每个禁止词构造只含该词的元素，应当冲突；对每个必需词构造的元素
+        不应冲突。热加载知识库时用于发现编译后不起作用的词。
+
+        返回:
+            问题描述列表（为空表示全部规则有效）
+        """
+        problems = []
+        for rule in self.rules:
+            if 'key' in rule:
+                continue
+            for kind in ('forbidden', 'required'):
+                for value, words in rule.get(kind, {}).items():
+                    for word in words:
+                        element = {'name': word, 'template': word}
+                        features = self.vocabulary.extract(element, self.include_template)
+                        for category in rule['categories']:
+                            conflict = any(
+                                compiled['name'] == rule['name']
+                                and self.match(compiled, features, {rule['context']: value}) is not None
+                                for compiled in self.rules_for(category)
+                            )
+                            if conflict != (kind == 'forbidden'):
+                                problems.append(f"{rule['name']}: {rule['context']}={value} "
+                                                f"的{'禁止' if kind == 'forbidden' else '必需'}词 '{word}' 不起作用")
+        return problems
+
+    def check(self, elements: List[Dict], context: Dict) -> List[Dict]:
+        """
+        检查一组元素
+
+        参数:
+            elements: 元素列表
+            context: {'ethnicity': 人种标准名称, 'era': 时代}（缺失的上下文对应规则不检查）
+
+        返回:
+            违规列表（元素规则在前，按元素顺序；组合规则在后）
+        """
+        violations = []
+        for elem in elements:
+            violations.extend(self.element_violations(elem, context))
+        violations.extend(self.unique_violations(elements))
+        return violations
+
+    def check_batch(self, element_sets: List[List[Dict]],
+                    contexts: List[Dict]) -> List[List[Dict]]:
+        """批量检查（特征缓存在各组之间共享）"""
+        return [self.check(elements, context) for elements, context in zip(element_sets, contexts)]
+
+
+@lru_cache(maxsize=1)
+def default_engine() -> RuleEngine:
+    """内置知识库编译出的规则引擎（进程内共享）"""
+    return RuleEngine()
+
+
+class ConsistencyState:
+    """
+    增量一致性状态：选择阶段逐个加入元素
+
+    按类别保存已选元素；加入新元素时只检查与该类别相关的规则和
+    组合唯一性，选择器可以据此当场拒绝不兼容的候选，而不是先生成再修补。
+    上下文未指定人种时，加入的人种元素会成为人种上下文。
+    """
+
+    def __init__(self, context: Optional[Dict] = None,
+                 engine: Optional[RuleEngine] = None):
+        """
+        参数:
+            context: {'ethnicity': 人种标准名称, 'era': 时代}
+            engine: 规则引擎（默认 default_engine()）
+        """
+        self.engine = engine or default_engine()
+        self.context = {'ethnicity': None, 'era': None, **(context or {})}
+        self.slots: Dict[str, List[Dict]] = {}
+        self.violations: List[Dict] = []
+        self._elements: List[Dict] = []
+        # 组合规则名 → {分组键: [元素]}
+        self._groups: Dict[str, Dict[str, List[Dict]]] = {
+            rule['name']: {} for rule in self.engine.unique_rules
+        }
+
+    @property
+    def elements(self) -> List[Dict]:
+        """按加入顺序的已选元素"""
+        return list(self._elements)
+
+    def _derived_context(self, element: Dict, category: Optional[str]) -> Optional[Dict]:
+        """加入该元素后的新上下文（上下文不变时返回None）"""
+        if category != 'ethnicity' or self.context.get('ethnicity'):
+            return None
+        ethnicity = ETHNICITY_NAMES.get((element.get('name') or '').lower())
+        if not ethnicity:
+            return None
+        return {**self.context, 'ethnicity': ethnicity}
+
+    def probe(self, element: Dict, category: Optional[str] = None) -> List[Dict]:
+        """
+        加入该元素会产生的新违规（不修改状态）
+
+        代价只与该类别相关的规则数量成正比；人种元素确定人种上下文时，
+        再重检受人种规则约束的已选类别。
+        """
+        category = CATEGORY_ALIASES.get(category, category) or element_category(element)
+        context = self._derived_context(element, category) or self.context
+        violations = self.engine.element_violations(element, context, category)
+
+        if context is not self.context:
+            for affected in self.engine.context_categories.get('ethnicity', ()):
+                for other in self.slots.get(affected, []):
+                    violations.extend(
+                        v for v in self.engine.element_violations(other, context, affected)
+                        if v['context'] == 'ethnicity'
+                    )
+
+        for rule in self.engine.unique_rules:
+            key = self.engine.unique_key(rule, element, category)
+            group = self._groups[rule['name']].get(key) if key is not None else None
+            if group:
+                violations.append({
+                    'rule': rule['name'],
+                    'severity': rule['severity'],
+                    'key': key,
+                    'count': len(group) + 1,
+                    'elements': group + [element],
+                })
+        return violations
+
+    def is_compatible(self, element: Dict, category: Optional[str] = None,
+                      severities: Tuple[str, ...] = ('high', 'medium')) -> bool:
+        """加入该元素是否不会产生指定严重程度的违规"""
+        return not any(v['severity'] in severities for v in self.probe(element, category))
+
+    def add(self, element: Dict, category: Optional[str] = None) -> List[Dict]:
+        """
+        加入元素
+
+        返回:
+            本次新增的违规
+        """
+        category = CATEGORY_ALIASES.get(category, category) or element_category(element)
+        violations = self.probe(element, category)
+
+        context = self._derived_context(element, category)
+        if context:
+            self.context = context
+
+        self.slots.setdefault(category, []).append(element)
+        self._elements.append(element)
+        for rule in self.engine.unique_rules:
+            key = self.engine.unique_key(rule, element, category)
+            if key is not None:
+                self._groups[rule['name']].setdefault(key, []).append(element)
+
+        self.violations.extend(violations)
+        return violations
+
+
+class CompatibilityMatrix:
+    """
+    每个(人种, 时代)组合的兼容性位图（规则判断委托给 RuleEngine）
+
+    每个已知元素占一位；组合校验只需一次与运算。
+    """
+
+    def __init__(self, knowledge: Optional[Dict] = None,
+                 engine: Optional[RuleEngine] = None):
+        self.engine = engine or RuleEngine(knowledge)
+        self.knowledge = self.engine.knowledge
+        self._ordinals: Dict[str, int] = {}
+        self._profiles: Dict[Tuple, Dict] = {}
+        for element_id, _, _ in self.engine.indexed_elements():
+            self._ordinals[element_id] = len(self._ordinals)
+
+    @classmethod
+    def from_connection(cls, conn: sqlite3.Connection,
+                        knowledge: Optional[Dict] = None) -> 'CompatibilityMatrix':
+        """从离线特征表加载（表不存在或词表已变化时退回按需提取）"""
+        return cls(engine=RuleEngine.from_connection(conn, knowledge))
+
+    # ========== 特征 ==========
+
+    def features_for(self, element: Dict) -> Tuple[int, ...]:
+        """元素特征掩码（新元素同时分配位号并补进已缓存的位图）"""
+        features = self.engine.features_for(element)
+        element_id = element.get('element_id')
+        if element_id and element_id not in self._ordinals:
+            ordinal = len(self._ordinals)
+            self._ordinals[element_id] = ordinal
+            category = element_category(element)
+            for profile in self._profiles.values():
+                if not self._conflicts(category, features, profile['context']):
+                    profile['bitmap'] |= 1 << ordinal
+        return features
+
+    def _conflicts(self, category: Optional[str], features: Tuple[int, ...],
+                   context: Dict) -> Optional[str]:
+        for rule in self.engine.rules_for(category):
+            if self.engine.match(rule, features, context) is not None:
+                return rule['name']
+        return None
+
+    # ========== 组合画像 ==========
+
+    def profile(self, ethnicity: Optional[str], era: Optional[str]) -> Dict:
+        """(人种, 时代) 组合的兼容性位图（首次使用时计算）"""
+        key = (ethnicity, era)
+        profile = self._profiles.get(key)
+        if profile is None:
+            context = {'ethnicity': ethnicity, 'era': era}
+            bitmap = 0
+            for element_id, category, features in self.engine.indexed_elements():
+                ordinal = self._ordinals.get(element_id)
+                if ordinal is not None and not self._conflicts(category, features, context):
+                    bitmap |= 1 << ordinal
+            profile = {'context': context, 'bitmap': bitmap}
+            self._profiles[key] = profile
+        return profile
+
+    # ========== 检查 ==========
+
+    def element_conflict(self, element: Dict, ethnicity: Optional[str],
+                         era: Optional[str], category: Optional[str] = None) -> Optional[str]:
+        """单个元素在该组合下违反的规则名（兼容则返回None）"""
+        features = self.features_for(element)
+        category = category or element_category(element)
+        return self._conflicts(category, features, {'ethnicity': ethnicity, 'era': era})
+
+    def is_compatible(self, element: Dict, ethnicity: Optional[str], era: Optional[str]) -> bool:
+        """单个元素是否与该组合兼容"""
+        return self.element_conflict(element, ethnicity, era) is None
+
+    def combination_mask(self, elements: List[Dict]) -> int:
+        """元素组合的位掩码（每个元素占一位）"""
+        mask = 0
+        for element in elements:
+            self.features_for(element)
+            ordinal = self._ordinals.get(element.get('element_id'))
+            if ordinal is not None:
+                mask |= 1 << ordinal
+        return mask
+
+    def validate_combinations(self, combinations: List[List[Dict]],
+                              ethnicity: Optional[str], era: Optional[str]) -> List[bool]:
+        """批量校验：每个组合一次与运算"""
+        masks = [self.combination_mask(elements) for elements in combinations]
+        bitmap = self.profile(ethnicity, era)['bitmap']
+        return [mask & ~bitmap == 0 for mask in masks]
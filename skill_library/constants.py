@@ -11,3 +11,18 @@ PROJECT_ROOT = os.path.dirname(PACKAGE_DIR)
 # Default paths
 DEFAULT_DB_PATH = os.path.join(PROJECT_ROOT, "extracted_results", "elements.db")
 DEFAULT_FRAMEWORK_PATH = os.path.join(PROJECT_ROOT, "prompt_framework.yaml")
+FRAMEWORKS_DIR = os.path.join(PROJECT_ROOT, "frameworks")
+DEFAULT_KNOWLEDGE_PATH = os.path.join(PROJECT_ROOT, "knowledge_base", "knowledge.yaml")
+
+# Compiled plan cache (framework plans etc.)
+DEFAULT_CACHE_DIR = os.path.join(PROJECT_ROOT, ".cache")
+
+# Per-domain framework files (routed by the domain parse_intent detects)
+DEFAULT_DOMAIN = "portrait"
+DOMAIN_FRAMEWORK_PATHS = {
+    "portrait": DEFAULT_FRAMEWORK_PATH,
+    "art": os.path.join(FRAMEWORKS_DIR, "art.yaml"),
+    "design": os.path.join(FRAMEWORKS_DIR, "design.yaml"),
+    "product": os.path.join(FRAMEWORKS_DIR, "product.yaml"),
+    "video": os.path.join(FRAMEWORKS_DIR, "video.yaml"),
+}
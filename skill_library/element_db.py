@@ -8,6 +8,7 @@ Universal Elements Library - Database Layer
 支持导出/导入JSON用于版本控制
 """
 
+import os
 import sqlite3
 import json
 from pathlib import Path
@@ -19,6 +20,68 @@ import re
 
 from .constants import DEFAULT_DB_PATH
 
+
+# 写入这些表时递增库变更计数（缓存据此判断库是否变化）
+CHANGE_COUNTER_TABLES = ('domains', 'categories', 'elements', 'tags', 'element_tags')
+
+
+def ensure_change_counter(conn: sqlite3.Connection):
+    """
+    创建库变更计数表和维护它的触发器（幂等）
+
+    library_changes 只有一行；上述表的任何 INSERT/UPDATE/DELETE 都会使 version 加1。
+    这是对数据库文件的一次性迁移，只在显式要求时执行（MCP服务器
+    --install-change-counter）；没有计数表时 library_stamp 退回文件时间戳。
+    """
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS library_changes (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version INTEGER NOT NULL
+    )
+    """)
+    conn.execute("INSERT OR IGNORE INTO library_changes (id, version) VALUES (1, 0)")
+    for table in CHANGE_COUNTER_TABLES:
+        for op in ('INSERT', 'UPDATE', 'DELETE'):
+            conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_{op.lower()}_changes
+            AFTER {op} ON {table}
+            BEGIN
+                UPDATE library_changes SET version = version + 1 WHERE id = 1;
+            END
+            """)
+    conn.commit()
+
+
+def library_version(conn: sqlite3.Connection) -> Optional[int]:
+    """当前库变更计数（没有计数表时返回None）"""
+    try:
+        row = conn.execute("SELECT version FROM library_changes WHERE id = 1").fetchone()
+    except sqlite3.OperationalError:
+        return None
+    return row[0] if row else None
+
+
+def library_stamp(conn: sqlite3.Connection, db_path: Optional[str] = None):
+    """
+    库版本标记：库变化时一定改变（缓存据此失效）
+
+    有变更计数时返回计数（一次索引查询）；否则退回数据库文件（及WAL文件）的
+    修改时间和大小，此时任何写入（包括保存提示词）都会改变标记。
+    """
+    version = library_version(conn)
+    if version is not None or not db_path:
+        return version
+
+    parts = []
+    for path in (db_path, f"{db_path}-wal"):
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        parts.append(f"{st.st_mtime_ns:x}.{st.st_size:x}")
+    return f"f{'-'.join(parts)}" if parts else 'missing'
+
+
 class ElementDB:
     """通用元素库数据库管理类"""
 
@@ -142,6 +205,8 @@ class ElementDB:
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_elements_domain ON elements(domain_id)")
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_elements_category ON elements(category_id)")
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_elements_reusability ON elements(reusability_score DESC)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_elements_domain_category_score "
+                       "ON elements(domain_id, category_id, reusability_score DESC)")
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_tags_name ON tags(tag_name)")
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_element_tags_tag ON element_tags(tag_id)")
 
@@ -486,6 +551,10 @@ class ElementDB:
 
     # ========== 统计方法 ==========
 
+    def get_library_version(self) -> Optional[int]:
+        """库变更计数（每次写入元素/领域/类别/标签后递增）"""
+        return library_version(self.conn)
+
     def get_stats(self) -> Dict:
         """获取库的统计信息"""
         cursor = self.conn.cursor()
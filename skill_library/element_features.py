@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+元素特征索引
+Element feature columns
+
+一致性检查原本在请求时对模板/名称做颜色词子串扫描。这里把相关属性
+（眼睛颜色、发色、时代标记、光影类型）离线提取为位掩码特征列，存入
+element_features 表。一致性规则（consistency_rules）对这些掩码做位测试，
+并据此为每个 (人种, 时代) 组合预计算兼容性位图。
+
+词表由基础词表和规则（知识库）中出现的词组成：知识库新增的词在编译规则时
+追加到词表中，词表指纹随之变化，旧的离线特征表不再使用（元素按需提取，
+重新构建特征表后恢复预计算）。
+
+离线构建:
+    python -m skill_library.element_features [db_path]
+"""
+
+import hashlib
+import re
+import sqlite3
+import sys
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .constants import DEFAULT_DB_PATH
+
+
+# 基础特征词表（每个词占一位；顺序决定位号，修改后特征表会自动失效重建）
+FEATURE_VOCABULARIES = {
+    'eye_color': ('blue', 'green', 'violet', 'hazel', 'grey', 'gray', 'amber',
+                  'brown', 'dark brown', 'black'),
+    'hair_color': ('blonde', 'red', 'auburn', 'brown', 'dark brown', 'black',
+                   'grey', 'silver', 'white', 'pink'),
+    'era_marker': ('modern', 'casual', 'business', 'contemporary', 'formal',
+                   'traditional', 'hanfu', 'period', 'ancient', 'classical', 'kimono'),
+    'lighting_type': ('neon', 'studio flash', 'studio', 'natural', 'dramatic',
+                      'soft', 'cinematic', 'rim', 'golden hour'),
+}
+
+FEATURE_COLUMNS = tuple(FEATURE_VOCABULARIES)
+
+
+def _normalize(text: str) -> str:
+    return (text or '').lower().replace('_', ' ')
+
+
+def _vocabulary_version(vocabularies: Dict[str, Tuple[str, ...]]) -> str:
+    return hashlib.sha1(repr(sorted(vocabularies.items())).encode('utf-8')).hexdigest()[:12]
+
+
+class FeatureVocabulary:
+    """
+    特征词表：词 → 位号，以及按词表提取元素特征
+
+    基础词表之外的词（如知识库新增的颜色词）追加在对应特征的末尾，已有词的
+    位号不变；词表指纹随之变化，按旧词表写入的离线特征表视为过期。
+    """
+
+    def __init__(self, extra_words: Optional[Dict[str, Iterable[str]]] = None):
+        """
+        参数:
+            extra_words: {特征: [词]}，不在基础词表中的词追加到末尾
+        """
+        words = {feature: [_normalize(w) for w in base] for feature, base in FEATURE_VOCABULARIES.items()}
+        for feature, extra in (extra_words or {}).items():
+            for word in extra:
+                word = _normalize(word)
+                if word and word not in words[feature]:
+                    words[feature].append(word)
+
+        self.words: Dict[str, Tuple[str, ...]] = {feature: tuple(w) for feature, w in words.items()}
+        self.added: Dict[str, Tuple[str, ...]] = {
+            feature: w[len(FEATURE_VOCABULARIES[feature]):] for feature, w in self.words.items()
+            if len(w) > len(FEATURE_VOCABULARIES[feature])
+        }
+        # 词表指纹：写入特征表，用于判断离线结果是否过期
+        self.version = _vocabulary_version(self.words)
+
+        self._bits = {feature: {word: bit for bit, word in enumerate(w)} for feature, w in self.words.items()}
+        self._patterns = {
+            feature: [
+                (1 << bit, re.compile(r'(?<![a-z])' + re.escape(word) + r'(?![a-z])'))
+                for bit, word in enumerate(w)
+            ]
+            for feature, w in self.words.items()
+        }
+
+    def mask(self, feature: str, words: Iterable[str]) -> int:
+        """把词列表转换为特征位掩码（不在词表中的词忽略）"""
+        bits = self._bits[feature]
+        mask = 0
+        for word in words:
+            bit = bits.get(_normalize(word))
+            if bit is not None:
+                mask |= 1 << bit
+        return mask
+
+    def extract(self, element: Dict, include_template: bool = True) -> Tuple[int, ...]:
+        """
+        从元素的名称和模板提取特征位掩码
+
+        参数:
+            element: 元素
+            include_template: 是否同时检查模板（False时只看名称）
+
+        返回:
+            按 FEATURE_COLUMNS 顺序的掩码元组 (eye_color, hair_color, era_marker, lighting_type)
+        """
+        text = _normalize(element.get('name'))
+        if include_template:
+            template = element.get('template') or element.get('ai_prompt_template') or ''
+            text = f"{text} {_normalize(template)}"
+
+        masks = []
+        for feature in FEATURE_COLUMNS:
+            mask = 0
+            for bit, pattern in self._patterns[feature]:
+                if pattern.search(text):
+                    mask |= bit
+            masks.append(mask)
+        return tuple(masks)
+
+    def mask_words(self, feature: str, mask: int) -> List[str]:
+        """把特征位掩码还原为词列表"""
+        return [word for bit, word in enumerate(self.words[feature]) if mask & (1 << bit)]
+
+
+# 基础词表（知识库没有新增词时规则引擎使用的词表）
+DEFAULT_VOCABULARY = FeatureVocabulary()
+VOCABULARY_VERSION = DEFAULT_VOCABULARY.version
+
+
+def feature_mask(feature: str, words: Iterable[str]) -> int:
+    """把词列表转换为基础词表的特征位掩码（不在词表中的词忽略）"""
+    return DEFAULT_VOCABULARY.mask(feature, words)
+
+
+def extract_features(element: Dict, include_template: bool = True) -> Tuple[int, ...]:
+    """按基础词表提取元素特征（见 FeatureVocabulary.extract）"""
+    return DEFAULT_VOCABULARY.extract(element, include_template)
+
+
+def build_element_features(db_path: str = DEFAULT_DB_PATH,
+                           vocabulary: Optional[FeatureVocabulary] = None) -> int:
+    """
+    离线提取所有元素的特征并写入 element_features 表
+
+    参数:
+        db_path: 数据库路径
+        vocabulary: 特征词表（默认基础词表；应与规则引擎使用的词表一致）
+
+    返回:
+        写入的元素数量
+    """
+    vocabulary = vocabulary or DEFAULT_VOCABULARY
+    conn = sqlite3.connect(db_path)
+    try:
+        cursor = conn.cursor()
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS element_features (
+            element_id TEXT PRIMARY KEY,
+            category_id TEXT,
+            eye_color INTEGER DEFAULT 0,
+            hair_color INTEGER DEFAULT 0,
+            era_marker INTEGER DEFAULT 0,
+            lighting_type INTEGER DEFAULT 0,
+            vocabulary_version TEXT,
+            FOREIGN KEY (element_id) REFERENCES elements(element_id) ON DELETE CASCADE
+        )
+        """)
+        for column in FEATURE_COLUMNS:
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_features_{column} "
+                           f"ON element_features({column})")
+
+        cursor.execute("SELECT element_id, category_id, name, ai_prompt_template FROM elements")
+        rows = [
+            (element_id, category_id,
+             *vocabulary.extract({'name': name, 'template': template}),
+             vocabulary.version)
+            for element_id, category_id, name, template in cursor.fetchall()
+        ]
+
+        cursor.execute("DELETE FROM element_features")
+        cursor.executemany("""
+            INSERT INTO element_features
+                (element_id, category_id, eye_color, hair_color, era_marker,
+                 lighting_type, vocabulary_version)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+        conn.commit()
+        return len(rows)
+    finally:
+        conn.close()
+
+
+def load_feature_table(conn: sqlite3.Connection,
+                       vocabulary: Optional[FeatureVocabulary] = None) -> Dict[str, Tuple[str, Tuple[int, ...]]]:
+    """
+    读取离线特征表（表不存在或不是按该词表构建时返回空字典）
+
+    返回:
+        {element_id: (category_id, 特征掩码元组)}
+    """
+    try:
+        rows = conn.execute("""
+            SELECT element_id, category_id, eye_color, hair_color, era_marker, lighting_type
+            FROM element_features WHERE vocabulary_version = ?
+        """, ((vocabulary or DEFAULT_VOCABULARY).version,)).fetchall()
+    except sqlite3.OperationalError:
+        return {}
+
+    return {element_id: (category_id, tuple(masks)) for element_id, category_id, *masks in rows}
+
+
+def mask_words(feature: str, mask: int) -> List[str]:
+    """把基础词表的特征位掩码还原为词列表"""
+    return DEFAULT_VOCABULARY.mask_words(feature, mask)
+
+
+if __name__ == '__main__':
+    from .consistency_rules import RuleEngine
+
+    db_path = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_DB_PATH
+    # 使用当前知识库的词表（含知识库新增的词），与服务器编译的规则一致
+    vocabulary = RuleEngine().vocabulary
+    count = build_element_features(db_path, vocabulary)
+    print(f"✅ 已提取 {count} 个元素的特征（词表版本 {vocabulary.version}）")
@@ -6,11 +6,14 @@ Framework Loader and Framework-Driven Prompt Generator
 """
 
 
-import yaml
+import copy
 import os
+import time
 
-from typing import Dict, List, Optional, Any
-from .constants import DEFAULT_FRAMEWORK_PATH, DEFAULT_DB_PATH
+from typing import Dict, List, Optional, Any, Tuple, Union
+from .constants import DEFAULT_FRAMEWORK_PATH, DEFAULT_DB_PATH, DEFAULT_DOMAIN, DOMAIN_FRAMEWORK_PATHS
+from .candidate_cursor import DEFAULT_PAGE_SIZE, CandidateCursor, decode_token
+from .framework_plan import FrameworkPlan, load_plan
 
 
 class FrameworkLoader:
@@ -25,22 +28,51 @@ class FrameworkLoader:
             framework_path: 框架配置文件路径
 
         返回:
-            框架配置字典
+            框架配置字典（副本，可自由修改）
         """
-        if not os.path.exists(framework_path):
-            raise FileNotFoundError(f"框架配置文件不存在: {framework_path}")
+        plan = FrameworkLoader.load_plan(framework_path)
+        return copy.deepcopy(plan.framework)
 
-        with open(framework_path, 'r', encoding='utf-8') as f:
-            framework = yaml.safe_load(f)
+    @staticmethod
+    def load_plan(framework_path: str = DEFAULT_FRAMEWORK_PATH) -> FrameworkPlan:
+        """
+        加载编译后的框架计划（进程内和磁盘缓存，见 framework_plan.load_plan）
+
+        参数:
+            framework_path: 框架配置文件路径
+
+        返回:
+            FrameworkPlan
+        """
+        plan = load_plan(framework_path)
+
+        print(f"✓ 加载框架: {plan.description}")
+        print(f"  领域: {plan.domain}")
+        print(f"  版本: {plan.framework_version}")
+        print(f"  类别数: {len(plan.framework['categories'])}")
+
+        return plan
 
-        print(f"✓ 加载框架: {framework['description']}")
-        print(f"  版本: {framework['framework_version']}")
-        print(f"  类别数: {len(framework['categories'])}")
+    # 最近一次从框架字典编译的计划 (字典, 计划)，按对象身份命中（保留字典引用，
+    # id不会被复用）。传入的字典视为只读：修改后请传入新的字典（load()每次返回
+    # 新副本）或直接传 FrameworkPlan
+    _dict_plan: Optional[Tuple[Dict, FrameworkPlan]] = None
 
-        return framework
+    @staticmethod
+    def _as_plan(framework: Union[Dict, FrameworkPlan]) -> FrameworkPlan:
+        if isinstance(framework, FrameworkPlan):
+            return framework
+
+        cached = FrameworkLoader._dict_plan
+        if cached is not None and cached[0] is framework:
+            return cached[1]
+
+        plan = FrameworkPlan.from_framework(framework)
+        FrameworkLoader._dict_plan = (framework, plan)
+        return plan
 
     @staticmethod
-    def get_all_fields(framework: Dict) -> Dict[str, Dict]:
+    def get_all_fields(framework: Union[Dict, FrameworkPlan]) -> Dict[str, Dict]:
         """
         获取框架中所有的字段定义
 
@@ -51,155 +83,139 @@ class FrameworkLoader:
                 ...
             }
         """
-        all_fields = {}
-
-        for category_name, category_config in framework['categories'].items():
-            for field_name, field_config in category_config['fields'].items():
-                full_field_name = f"{category_name}.{field_name}"
-                all_fields[full_field_name] = {
-                    'category': category_name,
-                    'field': field_name,
-                    **field_config
-                }
-
-        return all_fields
+        plan = FrameworkLoader._as_plan(framework)
+        return {
+            field['name']: {k: v for k, v in field.items() if k not in ('name', 'category_required')}
+            for field in plan.fields
+        }
 
     @staticmethod
-    def get_required_fields(framework: Dict) -> List[str]:
+    def get_required_fields(framework: Union[Dict, FrameworkPlan]) -> List[str]:
         """获取所有必选字段"""
-        required = []
-
-        for category_name, category_config in framework['categories'].items():
-            if category_config.get('required'):
-                for field_name, field_config in category_config['fields'].items():
-                    if field_config.get('required'):
-                        required.append(f"{category_name}.{field_name}")
-
-        return required
+        plan = FrameworkLoader._as_plan(framework)
+        return [field['name'] for field in plan.fields
+                if field['category_required'] and field.get('required')]
 
     @staticmethod
-    def apply_dependencies(intent: Dict, framework: Dict) -> Dict:
+    def apply_dependencies(intent: Dict, framework: Union[Dict, FrameworkPlan]) -> Dict:
         """
         应用框架的依赖规则
 
         参数:
             intent: 原始intent
-            framework: 框架配置
+            framework: 框架配置或编译后的计划
 
         返回:
-            应用规则后的intent
+            应用规则后的intent（不修改原始intent）
         """
-        updated_intent = intent.copy()
-
-        dependencies = framework.get('dependencies', [])
+        plan = FrameworkLoader._as_plan(framework)
+        updated_intent, applied = plan.validator.apply_dependencies(intent)
 
-        for rule in dependencies:
-            # 检查条件是否满足
-            if 'when' in rule:
-                conditions_met = True
-
-                for condition_field, condition_value in rule['when'].items():
-                    category, field = condition_field.split('.')
-                    actual_value = updated_intent.get(category, {}).get(field)
-
-                    if actual_value != condition_value:
-                        conditions_met = False
-                        break
-
-                # 如果条件满足，应用then规则
-                if conditions_met and 'then' in rule:
-                    print(f"✓ 应用依赖规则: {rule.get('name', '未命名')}")
-
-                    for then_field, then_value in rule['then'].items():
-                        category, field = then_field.split('.')
-
-                        if category not in updated_intent:
-                            updated_intent[category] = {}
-
-                        updated_intent[category][field] = then_value
-                        print(f"  → 设置 {then_field} = {then_value}")
+        for name, then in applied:
+            print(f"✓ 应用依赖规则: {name}")
+            for category, field, then_value in then:
+                print(f"  → 设置 {category}.{field} = {then_value}")
 
         return updated_intent
 
     @staticmethod
-    def validate_intent(intent: Dict, framework: Dict) -> List[Dict]:
+    def validate_intent(intent: Dict, framework: Union[Dict, FrameworkPlan],
+                        check_values: bool = False) -> List[Dict]:
         """
         验证intent的完整性和一致性
 
+        一致性检查中，取值落在条件列表中即视为问题（单值条件不单独触发）。
+
+        参数:
+            intent: intent
+            framework: 框架配置或编译后的计划
+            check_values: 是否同时检查枚举取值和字段类型
+
         返回:
             问题列表
         """
-        issues = []
-
-        validation = framework.get('validation', {})
-
-        # 检查必选字段
-        required_fields = validation.get('required_fields', [])
-        for req in required_fields:
-            field_path = req['field']
-            category, field = field_path.split('.')
-
-            if category not in intent or field not in intent[category]:
-                issues.append({
-                    'type': 'missing_required',
-                    'field': field_path,
-                    'severity': 'error',
-                    'message': req['error_message']
-                })
-
-        # 检查一致性
-        consistency_checks = validation.get('consistency_checks', [])
-        for check in consistency_checks:
-            if 'when' in check:
-                # 检查条件
-                for condition_field, condition_values in check['when'].items():
-                    category, field = condition_field.split('.')
-                    actual_value = intent.get(category, {}).get(field)
-
-                    # 如果值在条件列表中，说明有问题
-                    if isinstance(condition_values, list):
-                        if actual_value in condition_values:
-                            issues.append({
-                                'type': 'consistency_check',
-                                'name': check['name'],
-                                'severity': check['severity'],
-                                'message': check['message'],
-                                'suggestion': check.get('suggestion', '')
-                            })
-                    else:
-                        if actual_value == condition_values:
-                            # 检查其他条件字段
-                            pass
-
-        return issues
+        plan = FrameworkLoader._as_plan(framework)
+        return plan.validator.validate(intent, check_values)
 
+    @staticmethod
+    def validate_batch(intents: List[Dict], framework: Union[Dict, FrameworkPlan],
+                       check_values: bool = True, keep_results: bool = False) -> Dict:
+        """
+        批量补全并验证intent（不打印逐条日志）
+
+        返回:
+            汇总结果，见 IntentValidator.validate_batch
+        """
+        plan = FrameworkLoader._as_plan(framework)
+        return plan.validator.validate_batch(intents, check_values, keep_results)
 
 
 class FrameworkDrivenGenerator:
     """框架驱动的生成器"""
 
+    # 不按字段查询数据库的类别（主体单独处理，其余不对应元素）
+    # 框架文件的 execution.skipped_categories 可以覆盖
+    SKIPPED_CATEGORIES = ('subject', 'expression', 'scene', 'technical')
+
+    # 约束求解时每个字段参与搜索的候选数上限
+    SOLVER_MAX_CANDIDATES = 24
+
     def __init__(self, db_path: str = DEFAULT_DB_PATH,
-                 framework_path: str = DEFAULT_FRAMEWORK_PATH):
+                 framework_path: str = DEFAULT_FRAMEWORK_PATH,
+                 generator=None, use_solver: bool = True,
+                 solver_time_budget: float = 0.05):
         """
         初始化
 
         参数:
             db_path: 数据库路径
             framework_path: 框架配置文件路径
+            generator: 可选，复用已有的IntelligentGenerator（不传则新建）
+            use_solver: 字段选择是否使用约束求解（False时逐字段贪心）
+            solver_time_budget: 约束求解的时间预算（秒），超时返回目前最好的组合
         """
-        # 加载框架
-        self.framework = FrameworkLoader.load(framework_path)
+        # 加载框架（编译后的计划；self.framework 为共享的原始字典，只读使用）
+        self.plan = FrameworkLoader.load_plan(framework_path)
+        self.framework = self.plan.framework
 
         # 加载IntelligentGenerator（用于数据库查询）
-        from .intelligent_generator import IntelligentGenerator
-        self.generator = IntelligentGenerator(db_path)
+        if generator is None:
+            from .intelligent_generator import IntelligentGenerator
+            generator = IntelligentGenerator(db_path)
+        self.generator = generator
+
+        self.use_solver = use_solver
+        self.solver_time_budget = solver_time_budget
+
+        # 最近一次query_by_framework的分步耗时（毫秒）和求解结果
+        self.last_query_timings = {}
+        self.last_solver_result = None
+
+    def set_plan(self, plan: FrameworkPlan):
+        """替换框架计划（热加载时使用；正在执行的调用不受影响）"""
+        self.plan = plan
+        self.framework = plan.framework
 
-    def generate_by_framework(self, intent: Dict) -> Dict:
+    @property
+    def domain(self) -> str:
+        """当前框架计划的领域"""
+        return self.plan.domain
+
+    @property
+    def lookup_domains(self) -> Tuple[str, ...]:
+        """查找元素的领域顺序（框架领域 + execution.fallback_domains）"""
+        return (self.plan.domain, *self.plan.execution.get('fallback_domains', ()))
+
+    def _execution(self, key: str, default):
+        return self.plan.execution.get(key, default)
+
+    def generate_by_framework(self, intent: Dict, mode: str = 'auto') -> Dict:
         """
         根据框架和intent生成提示词
 
         参数:
             intent: 用户意图（可能不完整）
+            mode: 提示词组合模式（simple/auto/detailed）
 
         返回:
             {
@@ -218,13 +234,13 @@ class FrameworkDrivenGenerator:
         print("\n📋 步骤1：应用框架依赖规则")
         print("-"*80)
 
-        complete_intent = FrameworkLoader.apply_dependencies(intent, self.framework)
+        complete_intent = FrameworkLoader.apply_dependencies(self.plan.nest_intent(intent), self.plan)
 
         # 步骤2：验证intent
         print("\n✓ 步骤2：验证Intent")
         print("-"*80)
 
-        validation_issues = FrameworkLoader.validate_intent(complete_intent, self.framework)
+        validation_issues = FrameworkLoader.validate_intent(complete_intent, self.plan)
 
         if validation_issues:
             print(f"⚠️ 发现 {len(validation_issues)} 个验证问题:")
@@ -239,7 +255,8 @@ class FrameworkDrivenGenerator:
 
         elements = self.query_by_framework(complete_intent)
 
-        print(f"✓ 查询到 {len(elements)} 个元素")
+        print(f"✓ 查询到 {len(elements)} 个元素"
+              f"（耗时 {sum(self.last_query_timings.values()):.1f}ms）")
 
         # 步骤4：一致性检查
         print("\n✓ 步骤4：一致性检查")
@@ -260,7 +277,7 @@ class FrameworkDrivenGenerator:
         print("\n✨ 步骤5：生成最终提示词")
         print("-"*80)
 
-        prompt = self.generator.compose_prompt(elements, mode='auto', keywords_limit=3)
+        prompt = self.generator.compose_prompt(elements, mode=mode, keywords_limit=3)
 
         # 步骤6：完整性检查
         print("\n🎯 步骤6：完整性检查")
@@ -282,12 +299,39 @@ class FrameworkDrivenGenerator:
             'validation_issues': validation_issues,
             'consistency_issues': consistency_issues,
             'completeness_issues': completeness_issues,
-            'fixes': fixes_applied
+            'fixes': fixes_applied,
+            'query_timings': dict(self.last_query_timings)
         }
 
-    def query_all_candidates_by_framework(self, intent: Dict) -> Dict[str, List[Dict]]:
+    def candidate_fields(self, intent: Dict) -> List[Tuple[str, str]]:
+        """需要候选列表的字段 [(字段名, db类别)]（按框架顺序）"""
+        fields = {}
+        skipped = self._execution('skipped_categories', self.SKIPPED_CATEGORIES)
+
+        # 框架中需要查询数据库的字段（默认跳过subject/expression/scene/technical）
+        for field in self.plan.fields:
+            if field['category'] in skipped or 'db_category' not in field:
+                continue
+            fields[field['name']] = field['db_category']
+
+        # subject相关的候选（眼睛、发色）
+        if self._execution('subject_attributes', True) and 'ethnicity' in intent.get('subject', {}):
+            fields['facial.eyes'] = 'eye_types'
+            fields['styling.hair_color'] = 'hair_colors'
+
+        return list(fields.items())
+
+    def query_all_candidates_by_framework(self, intent: Dict,
+                                          limit: Optional[int] = DEFAULT_PAGE_SIZE) -> Dict[str, List[Dict]]:
         """
-        查询所有候选元素（供SKILL分析选择）
+        查询候选元素（供SKILL分析选择）
+
+        参数:
+            intent: 用户意图
+            limit: 每个字段最多返回的候选数（按得分降序，默认一页；
+                None表示读取全部，需要显式传入）
+
+        框架领域中没有某个类别的元素时，依次使用 fallback_domains。
 
         返回:
             {
@@ -297,142 +341,237 @@ class FrameworkDrivenGenerator:
             }
         """
         candidates = {}
+        intent = self.plan.nest_intent(intent)
 
-        # 遍历框架的所有category
-        for category_name, category_config in self.framework['categories'].items():
-
-            # 跳过不需要查询数据库的category
-            if category_name in ['subject', 'expression', 'scene', 'technical']:
-                continue
-
-            # 获取该category的intent值
-            category_intent = intent.get(category_name, {})
-
-            # 遍历该category的所有字段
-            for field_name, field_config in category_config['fields'].items():
-
-                # 获取字段值
-                field_value = category_intent.get(field_name, field_config.get('default'))
+        for field_key, db_category in self.candidate_fields(intent):
+            elements = []
+            for domain in self.lookup_domains:
+                if limit is None:
+                    # 查询该类别的所有元素
+                    elements = self.generator.get_all_elements_by_category(domain, db_category)
+                else:
+                    elements = self._cursor(db_category, limit=limit, page_size=limit,
+                                            domain=domain).fetch()
+                if elements:
+                    break
 
-                # 如果该字段有db_category（需要查询数据库）
-                if 'db_category' in field_config:
+            if elements:
+                candidates[field_key] = elements
+                print(f"✓ {field_key}: 查询到 {len(elements)} 个候选元素")
 
-                    db_category = field_config['db_category']
-                    field_key = f"{category_name}.{field_name}"
+        return candidates
 
-                    # 查询该类别的所有元素
-                    all_elements = self.generator.get_all_elements_by_category('portrait', db_category)
+    def query_candidate_cursors(self, intent: Dict, limit: Optional[int] = DEFAULT_PAGE_SIZE,
+                                page_size: int = DEFAULT_PAGE_SIZE,
+                                tokens: Optional[Dict[str, str]] = None) -> Dict[str, CandidateCursor]:
+        """
+        为每个字段返回惰性分页的候选游标（不执行查询）
 
-                    if all_elements:
-                        candidates[field_key] = all_elements
-                        print(f"✓ {field_key}: 查询到 {len(all_elements)} 个候选元素")
+        调用方按需 fetch()/迭代，只有真正需要的页才会读取；
+        cursor.token 可以通过 tokens 参数传回，从上次的位置继续。
+        与 query_all_candidates_by_framework 相同，框架领域中没有某个类别的
+        元素时，游标读取 fallback_domains 中第一个有该类别元素的领域。
 
-        # 查询subject相关的候选
-        subject = intent.get('subject', {})
+        参数:
+            intent: 用户意图
+            limit: 每个字段最多读取的候选数（None表示不限）
+            page_size: 每页数量
+            tokens: {字段名: 续传令牌}
 
-        if 'ethnicity' in subject:
-            # 眼睛候选
-            eye_candidates = self.generator.get_all_elements_by_category('portrait', 'eye_types')
-            if eye_candidates:
-                candidates['facial.eyes'] = eye_candidates
-                print(f"✓ facial.eyes: 查询到 {len(eye_candidates)} 个候选元素")
-
-            # 发色候选
-            hair_candidates = self.generator.get_all_elements_by_category('portrait', 'hair_colors')
-            if hair_candidates:
-                candidates['styling.hair_color'] = hair_candidates
-                print(f"✓ styling.hair_color: 查询到 {len(hair_candidates)} 个候选元素")
+        返回:
+            {字段名: CandidateCursor}
+        """
+        tokens = tokens or {}
+        cursors = {}
+        for field_key, db_category in self.candidate_fields(self.plan.nest_intent(intent)):
+            token = tokens.get(field_key)
+            cursors[field_key] = self._cursor(db_category, limit=limit, page_size=page_size,
+                                              token=token,
+                                              domain=self._candidate_domain(db_category, token))
+        return cursors
+
+    def _candidate_domain(self, db_category: str, token: Optional[str] = None) -> str:
+        """游标读取的领域：续传令牌所在的领域，否则第一个有该类别元素的领域"""
+        if token:
+            try:
+                token_domain = decode_token(token)[0]
+            except ValueError:
+                token_domain = None
+            if token_domain in self.lookup_domains:
+                return token_domain
+
+        for domain in self.lookup_domains:
+            row = self.generator.conn.execute(
+                "SELECT 1 FROM elements WHERE domain_id = ? AND category_id = ? LIMIT 1",
+                (domain, db_category)
+            ).fetchone()
+            if row:
+                return domain
+        return self.plan.domain
+
+    def _cursor(self, db_category: str, limit: Optional[int], page_size: int,
+                token: Optional[str] = None, domain: Optional[str] = None) -> CandidateCursor:
+        return CandidateCursor(
+            self.generator.conn, domain or self.plan.domain, db_category,
+            row_to_element=self.generator._row_to_element,
+            page_size=page_size, limit=limit, token=token
+        )
 
-        return candidates
+    # 不对应框架字段、每次都补充的固定类别（execution.fixed_categories 可以覆盖）
+    FIXED_CATEGORIES = ('skin_tones', 'skin_textures', 'face_shapes', 'expressions', 'poses')
 
-    def query_by_framework(self, intent: Dict) -> List[Dict]:
+    def build_query_plan(self, intent: Dict) -> List[Dict]:
         """
-        根据框架遍历查询所有字段
+        把intent展开为查询计划（纯函数，不访问数据库）
 
-        这是核心方法：代码不需要知道有哪些字段，只遍历框架
+        返回:
+            [{'field': 字段名, 'db_category': db类别, 'keywords': 按顺序尝试的关键词,
+              'value': 字段取值（None表示不打印查找日志）,
+              'depends_on': 前置字段（前置字段未找到元素时跳过）}]
         """
-        elements = []
+        steps = []
 
-        # 1. 处理主体属性（特殊处理）
-        subject = intent.get('subject', {})
+        # 1. 主体属性（特殊处理；没有人物主体的领域关闭 execution.subject_attributes）
+        subject = intent.get('subject', {}) if self._execution('subject_attributes', True) else {}
 
         if 'gender' in subject:
-            elem = self.generator.get_element_by_category('portrait', 'gender', subject['gender'])
-            if elem:
-                elements.append(elem)
+            steps.append(self._step('subject.gender', 'gender', (subject['gender'],)))
 
         if 'ethnicity' in subject:
-            elem = self.generator.get_element_by_category('portrait', 'ethnicity', subject['ethnicity'])
-            if elem:
-                elements.append(elem)
+            ethnicity_name = subject['ethnicity']
+            steps.append(self._step('subject.ethnicity', 'ethnicity', (ethnicity_name,)))
 
-                # 自动选择匹配人种的眼睛和头发
-                ethnicity_name = subject['ethnicity']
+            # 自动选择匹配人种的眼睛和头发（人种元素找到时才生效）
+            eye_filter = 'almond' if ethnicity_name == 'East_Asian' else None
+            steps.append(self._step('facial.eyes', 'eye_types', (eye_filter,),
+                                    depends_on='subject.ethnicity'))
 
-                if ethnicity_name == 'East_Asian':
-                    eye_elem = self.generator.get_element_by_category('portrait', 'eye_types', 'almond')
-                else:
-                    eye_elem = self.generator.get_element_by_category('portrait', 'eye_types')
-
-                if eye_elem:
-                    elements.append(eye_elem)
-
-                typical_hair = self.generator.knowledge['ethnicity_typical_hair'].get(ethnicity_name, ['black'])
-                hair_color_elem = self.generator.get_element_by_category('portrait', 'hair_colors', typical_hair[0])
-                if hair_color_elem:
-                    elements.append(hair_color_elem)
+            typical_hair = self.generator.knowledge['ethnicity_typical_hair'].get(ethnicity_name, ['black'])
+            steps.append(self._step('styling.hair_color', 'hair_colors', (typical_hair[0],),
+                                    depends_on='subject.ethnicity'))
 
         if 'age_range' in subject:
-            elem = self.generator.get_element_by_category('portrait', 'age_range')
-            if elem:
-                elements.append(elem)
+            steps.append(self._step('subject.age_range', 'age_range'))
 
-        # 2. 遍历框架的所有category（除了subject和expression）
-        for category_name, category_config in self.framework['categories'].items():
+        # 2. 框架中需要查询数据库的字段（除了subject和expression等已处理的类别）
+        skipped = self._execution('skipped_categories', self.SKIPPED_CATEGORIES)
+        for field in self.plan.fields:
+            if field['category'] in skipped or 'db_category' not in field:
+                continue
 
-            # 跳过已处理的
-            if category_name in ['subject', 'expression', 'scene', 'technical']:
+            # 获取字段值
+            field_value = intent.get(field['category'], {}).get(field['field'], field.get('default'))
+
+            # 跳过空值、默认值或auto
+            if not field_value or field_value in ['modern', 'natural', 'auto', 'none']:
                 continue
 
-            # 获取该category的intent值
-            category_intent = intent.get(category_name, {})
+            steps.append(self._step(field['name'], field['db_category'],
+                                    self.plan.keywords_for(field['name'], field_value), field_value))
 
-            # 遍历该category的所有字段
-            for field_name, field_config in category_config['fields'].items():
+        # 3. 其他固定类别
+        for attr in self._execution('fixed_categories', self.FIXED_CATEGORIES):
+            steps.append(self._step(attr, attr))
 
-                # 获取字段值
-                field_value = category_intent.get(field_name, field_config.get('default'))
+        return steps
 
-                # 如果该字段有db_category（需要查询数据库）
-                if 'db_category' in field_config and field_value:
+    @staticmethod
+    def _step(field: str, db_category: str, keywords: Tuple[Optional[str], ...] = (None,),
+              value: Optional[str] = None, depends_on: Optional[str] = None) -> Dict:
+        return {'field': field, 'db_category': db_category, 'keywords': tuple(keywords),
+                'value': value, 'depends_on': depends_on}
 
-                    # 跳过默认值或auto
-                    if field_value in ['modern', 'natural', 'auto', 'none']:
-                        continue
+    def prefetch_for_intents(self, intents: List[Dict]) -> Dict[Tuple[str, str], List[Dict]]:
+        """
+        为一批intent一次预取所有涉及类别的候选池
 
-                    db_category = field_config['db_category']
+        返回:
+            {(领域, 类别): 元素列表}，可交给其他生成器的 adopt_candidate_pools 共享
+        """
+        categories = {}
+        for intent in intents:
+            complete_intent, _ = self.plan.validator.apply_dependencies(self.plan.nest_intent(intent))
+            for step in self.build_query_plan(complete_intent):
+                categories[step['db_category']] = None
+
+        pools = {}
+        for domain in self.lookup_domains:
+            wanted = list(categories)
+            if domain == 'portrait':
+                # 冲突修正使用的替代元素池
+                wanted += [c for c in self.generator.CONFLICT_POOL_CATEGORIES if c not in categories]
+            for category, elements in self.generator.prefetch_candidate_pools(wanted, domain).items():
+                pools[(domain, category)] = elements
+        return pools
+
+    def query_by_framework(self, intent: Dict, use_solver: Optional[bool] = None) -> List[Dict]:
+        """
+        根据框架遍历查询所有字段
 
-                    # 获取搜索关键词
-                    keywords_map = field_config.get('search_keywords', {})
-                    keywords = keywords_map.get(field_value, [field_value])
+        这是核心方法：代码不需要知道有哪些字段，只遍历框架。
+        查询计划涉及的所有类别按领域各一次查询预取为候选池，每个字段的候选
+        在内存中按关键词回退顺序排列（先按关键词顺序；同一关键词先查框架领域，
+        再查 fallback_domains；同级按reusability降序）。
 
-                    # 查询数据库
-                    elem = None
-                    for kw in keywords:
-                        elem = self.generator.get_element_by_category('portrait', db_category, kw)
-                        if elem:
-                            print(f"✓ {category_name}.{field_name} = '{field_value}' → 找到: '{elem['chinese_name']}'（关键词: {kw}）")
-                            elements.append(elem)
-                            break
+        默认用 SelectionSolver 在各字段候选上一次求解整体一致的组合：没有冲突时
+        每个字段取排在第一的候选（与逐字段贪心相同），有冲突时取排名最靠前的
+        兼容候选。use_solver=False 时逐字段取第一个命中（贪心）。
+        各步骤耗时（毫秒）记录在 self.last_query_timings。
 
-                    if not elem:
-                        print(f"⚠️ {category_name}.{field_name} = '{field_value}' → 未找到元素")
+        参数:
+            intent: 完整的intent
+            use_solver: 是否使用约束求解（None表示使用 self.use_solver）
+        """
+        elements = []
+        timings = {}
+
+        steps = self.build_query_plan(intent)
+
+        domains = self.lookup_domains
+        start = time.perf_counter()
+        categories = list(dict.fromkeys(step['db_category'] for step in steps))
+        for domain in domains:
+            self.generator.prefetch_candidate_pools(categories, domain)
+        timings['prefetch'] = (time.perf_counter() - start) * 1000
+
+        if use_solver is None:
+            use_solver = self.use_solver
+        max_candidates = self.SOLVER_MAX_CANDIDATES if use_solver else 1
+
+        # 每个步骤的候选 [(元素, 命中的关键词)]，按偏好顺序（同一字段可能有多个步骤）
+        step_candidates = {}
+        found = set()
+        for i, step in enumerate(steps):
+            # 前置字段（如人种）没找到时不补充依赖它的元素
+            if step['depends_on'] and step['depends_on'] not in found:
+                continue
 
-        # 3. 处理其他固定类别
-        for attr in ['skin_tones', 'skin_textures', 'face_shapes', 'expressions', 'poses']:
-            elem = self.generator.get_element_by_category('portrait', attr)
-            if elem:
+            start = time.perf_counter()
+            candidates = self._step_candidates(step, domains, max_candidates)
+            timings[step['field']] = timings.get(step['field'], 0.0) + (time.perf_counter() - start) * 1000
+            if candidates:
+                step_candidates[i] = candidates
+                found.add(step['field'])
+
+        picks = {i: candidates[0] for i, candidates in step_candidates.items()}
+        if use_solver and any(len(candidates) > 1 for candidates in step_candidates.values()):
+            start = time.perf_counter()
+            picks = self._solve_picks(intent, steps, step_candidates)
+            timings['solve'] = (time.perf_counter() - start) * 1000
+
+        for i, step in enumerate(steps):
+            field_name, field_value = step['field'], step['value']
+            if step['depends_on'] and step['depends_on'] not in found:
+                continue
+
+            pick = picks.get(i)
+            if pick:
+                elem, matched = pick
+                if field_value is not None:
+                    print(f"✓ {field_name} = '{field_value}' → 找到: '{elem['chinese_name']}'（关键词: {matched}）")
                 elements.append(elem)
+            elif field_value is not None:
+                print(f"⚠️ {field_name} = '{field_value}' → 未找到元素")
 
         # 4. 处理风格关键词
         style_keywords = []
@@ -461,11 +600,137 @@ class FrameworkDrivenGenerator:
                 style_keywords.extend(['traditional', 'period', 'classical'])
 
         if style_keywords:
+            start = time.perf_counter()
             style_elements = self.generator.search_style_elements(style_keywords)
+            timings['style_search'] = (time.perf_counter() - start) * 1000
             elements.extend(style_elements)
 
+        self.last_query_timings = timings
         return elements
 
+    def _step_candidates(self, step: Dict, domains: Tuple[str, ...],
+                         max_candidates: int) -> List[Tuple[Dict, Optional[str]]]:
+        """查询步骤的候选 [(元素, 命中的关键词)]（按偏好顺序，最多max_candidates个）"""
+        candidates = []
+        seen = set()
+        for kw in step['keywords']:
+            for domain in domains:
+                pool = self.generator._candidate_pools([step['db_category']], domain)[step['db_category']]
+                for elem in pool:
+                    if elem['element_id'] in seen or not self.generator._matches_filter(elem, kw):
+                        continue
+                    seen.add(elem['element_id'])
+                    candidates.append((elem, kw))
+                    if len(candidates) >= max_candidates:
+                        return candidates
+        return candidates
+
+    def _solve_picks(self, intent: Dict, steps: List[Dict],
+                     step_candidates: Dict[int, List[Tuple[Dict, Optional[str]]]]) -> Dict[int, Tuple]:
+        """
+        用 SelectionSolver 选出整体一致的组合
+
+        候选的匹配分按偏好排名递减（100, 99, ...），任何违反约束的惩罚都大于
+        排名差，因此求解结果是排名最靠前的一致组合。
+
+        返回:
+            {步骤序号: (元素, 命中的关键词)}
+        """
+        from .selection_solver import SelectionSolver
+
+        # 求解器按字段名区分变量；同一字段的多个步骤加上序号
+        keys = {i: f"{steps[i]['field']}#{i}" for i in step_candidates}
+        scored = {
+            keys[i]: [(elem, 100.0 - rank) for rank, (elem, _) in enumerate(candidates)]
+            for i, candidates in step_candidates.items()
+        }
+        solver = SelectionSolver(intent, self.generator.knowledge,
+                                 max_candidates=self.SOLVER_MAX_CANDIDATES,
+                                 time_budget=self.solver_time_budget,
+                                 compatibility=self.generator.compatibility)
+        result = solver.solve(scored)
+        self.last_solver_result = result
+
+        picks = {}
+        for i, key in keys.items():
+            elem = result['selected'].get(key)
+            if elem is not None:
+                picks[i] = next(c for c in step_candidates[i] if c[0] is elem)
+        return picks
+
+    def close(self):
+        """关闭数据库连接"""
+        self.generator.close()
+
+
+class FrameworkRouter:
+    """
+    按领域路由的框架生成器
+
+    每个领域一个框架文件（见 constants.DOMAIN_FRAMEWORK_PATHS），编译后的计划
+    由 load_plan 缓存（文件修改后自动重新编译）。所有领域的生成器共享同一个
+    IntelligentGenerator，候选池按 (领域, 类别) 缓存在同一个连接上。
+    """
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH, generator=None,
+                 framework_paths: Optional[Dict[str, str]] = None,
+                 default_domain: str = DEFAULT_DOMAIN):
+        """
+        参数:
+            db_path: 数据库路径
+            generator: 可选，复用已有的IntelligentGenerator（不传则新建）
+            framework_paths: {领域: 框架文件路径}，覆盖默认配置中的对应领域
+            default_domain: intent没有领域或领域没有框架时使用的领域
+        """
+        self.framework_paths = {**DOMAIN_FRAMEWORK_PATHS, **(framework_paths or {})}
+        self.default_domain = default_domain
+
+        if generator is None:
+            from .intelligent_generator import IntelligentGenerator
+            generator = IntelligentGenerator(db_path)
+        self.generator = generator
+        self.db_path = db_path
+
+        self._generators: Dict[str, FrameworkDrivenGenerator] = {}
+
+    def available_domains(self) -> List[str]:
+        """有框架文件的领域"""
+        return [domain for domain, path in self.framework_paths.items() if os.path.exists(path)]
+
+    def resolve_domain(self, intent: Optional[Dict] = None, domain: Optional[str] = None) -> str:
+        """确定使用的领域（显式参数 > intent['domain'] > 默认领域）"""
+        domain = domain or (intent or {}).get('domain') or self.default_domain
+        if domain not in self.framework_paths or not os.path.exists(self.framework_paths[domain]):
+            print(f"⚠️ 领域 '{domain}' 没有框架配置，使用 {self.default_domain}")
+            domain = self.default_domain
+        return domain
+
+    def generator_for(self, domain: Optional[str] = None) -> FrameworkDrivenGenerator:
+        """某个领域的框架生成器（首次使用时创建；框架文件变化时切换到新计划）"""
+        domain = self.resolve_domain(domain=domain)
+        fgen = self._generators.get(domain)
+
+        if fgen is None:
+            fgen = FrameworkDrivenGenerator(self.db_path, self.framework_paths[domain],
+                                            generator=self.generator)
+            self._generators[domain] = fgen
+        else:
+            plan = load_plan(self.framework_paths[domain])
+            if plan is not fgen.plan:
+                fgen.set_plan(plan)
+
+        return fgen
+
+    def generate(self, intent: Dict, domain: Optional[str] = None, mode: str = 'auto') -> Dict:
+        """按intent的领域执行 generate_by_framework"""
+        return self.generator_for(self.resolve_domain(intent, domain)).generate_by_framework(intent, mode)
+
+    def query_all_candidates(self, intent: Dict, limit: Optional[int] = DEFAULT_PAGE_SIZE,
+                             domain: Optional[str] = None) -> Dict[str, List[Dict]]:
+        """按intent的领域执行 query_all_candidates_by_framework"""
+        fgen = self.generator_for(self.resolve_domain(intent, domain))
+        return fgen.query_all_candidates_by_framework(intent, limit)
+
     def close(self):
         """关闭数据库连接"""
         self.generator.close()
@@ -686,30 +951,132 @@ class ElementSelector:
         candidates_dict: Dict[str, List[Dict]],
         intent: Dict,
         keywords_map: Dict[str, List[str]],
-        debug: bool = False
+        debug: bool = False,
+        reject_conflicts: bool = False,
+        use_solver: bool = False,
+        time_budget: float = 0.05,
+        knowledge: Optional[Dict] = None
     ) -> Dict[str, Dict]:
         """
         从多个字段的候选中批量选择最佳元素
 
+        默认逐字段贪心选择；use_solver=True 时把一致性规则作为约束一次求解整体
+        组合（见 select_consistent_from_candidates_dict）。两种方式都只选择匹配分
+        大于0的候选，结果按 candidates_dict 的字段顺序。
+
         参数:
             candidates_dict: {field_name: [候选列表]}
             intent: 用户完整意图
             keywords_map: {field_name: [关键词列表]}
             debug: 是否输出调试信息
+            reject_conflicts: 贪心选择时逐字段维护一致性状态，与已选元素冲突的
+                候选直接跳过（所有候选都冲突时仍选得分最高的）；约束求解本身
+                避开冲突，此参数对其不起作用
+            use_solver: 是否使用约束求解
+            time_budget: 约束求解的时间预算（秒）
+            knowledge: 常识知识库（默认使用内置知识库）
 
         返回:
             {field_name: 最佳元素}
         """
+        if use_solver:
+            return ElementSelector.select_consistent_from_candidates_dict(
+                candidates_dict, intent, keywords_map, time_budget=time_budget,
+                knowledge=knowledge, debug=debug
+            )
+
         selected = {}
 
+        state = None
+        if reject_conflicts:
+            from .consistency_rules import ConsistencyState
+            scene = intent.get('scene', {})
+            state = ConsistencyState({
+                'ethnicity': intent.get('subject', {}).get('ethnicity'),
+                'era': scene.get('era') if isinstance(scene, dict) else None,
+            })
+
         for field_name, candidates in candidates_dict.items():
             keywords = keywords_map.get(field_name, [])
 
+            if state is not None:
+                compatible = [
+                    c for c in candidates
+                    if state.is_compatible(c, ElementSelector._field_category(field_name, c))
+                ]
+                if compatible:
+                    candidates = compatible
+
             best_elem, score = ElementSelector.select_best_element(
                 candidates, keywords, intent, field_name, debug
             )
 
             if best_elem:
                 selected[field_name] = best_elem
+                if state is not None:
+                    state.add(best_elem, ElementSelector._field_category(field_name, best_elem))
 
         return selected
+
+    @staticmethod
+    def _field_category(field_name: str, element: Dict) -> Optional[str]:
+        """元素的数据库类别（元素本身没有时按字段名推断）"""
+        from .consistency_rules import element_category
+        return element_category(element) or field_name
+
+    @staticmethod
+    def select_consistent_from_candidates_dict(
+        candidates_dict: Dict[str, List[Dict]],
+        intent: Dict,
+        keywords_map: Dict[str, List[str]],
+        beam_width: int = 8,
+        time_budget: float = 0.05,
+        knowledge: Optional[Dict] = None,
+        debug: bool = False
+    ) -> Dict[str, Dict]:
+        """
+        从多个字段的候选中选择全局一致的最佳组合
+
+        与 select_from_candidates_dict 使用相同的匹配评分，但把一致性规则
+        （人种 vs 眼睛/发色、时代 vs 服装/光影、重复元素）作为约束，
+        用带剪枝的束搜索一次选出整体得分最高的组合。与贪心选择相同，
+        只考虑匹配分大于0的候选（没有这样的候选的字段不选），结果按
+        candidates_dict 的字段顺序。
+
+        参数:
+            candidates_dict: {field_name: [候选列表]}
+            intent: 用户完整意图
+            keywords_map: {field_name: [关键词列表]}
+            beam_width: 束宽
+            time_budget: 搜索时间预算（秒），超时返回目前最好的结果
+            knowledge: 常识知识库（默认使用内置知识库）
+            debug: 是否输出调试信息
+
+        返回:
+            {field_name: 最佳元素}
+        """
+        from .selection_solver import SelectionSolver
+
+        scored = {}
+        for field_name, candidates in candidates_dict.items():
+            keywords = keywords_map.get(field_name, [])
+            scored[field_name] = [
+                (elem, score) for elem, score in (
+                    (elem, ElementSelector.calculate_match_score(elem, keywords, intent, field_name))
+                    for elem in candidates
+                )
+                if score > 0
+            ]
+
+        solver = SelectionSolver(intent, knowledge, beam_width=beam_width, time_budget=time_budget)
+        result = solver.solve(scored)
+
+        if debug:
+            print(f"\n🎯 一致性约束选择：{len(result['selected'])} 个字段，"
+                  f"总分 {result['score']:.1f}，扩展 {result['expanded']} 个状态，"
+                  f"耗时 {result['elapsed'] * 1000:.1f}ms"
+                  f"{'' if result['complete'] else '（超时，返回当前最优）'}")
+            for violation in result['violations']:
+                print(f"  ⚠️ {violation['field']}: {violation['rule']}")
+
+        return result['selected']
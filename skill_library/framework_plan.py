@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+编译后的框架计划
+Compiled, immutable plan of prompt_framework.yaml
+
+FrameworkLoader 原本每次构造 FrameworkDrivenGenerator 都重新读取并解析YAML，
+每个请求再遍历嵌套字典。这里把框架一次性编译为不可变的计划：
+
+- 扁平字段表（按框架顺序）及 db_category 映射
+- 每个字段取值的搜索关键词列表
+- 依赖规则与验证规则（条件/结果均为元组）
+- 预编译的验证/补全程序（plan.validator，见 intent_validator）
+- 领域和执行配置（每个领域一个框架文件，见 load_domain_plan）
+
+编译结果按文件内容哈希缓存到磁盘（pickle），进程内再按 mtime 缓存；
+解析YAML时优先使用 libyaml 的 CSafeLoader。
+"""
+
+import hashlib
+import os
+import pickle
+import threading
+from types import MappingProxyType
+from typing import Dict, Optional, Tuple
+
+import yaml
+
+from .constants import DEFAULT_CACHE_DIR, DEFAULT_DOMAIN, DEFAULT_FRAMEWORK_PATH, DOMAIN_FRAMEWORK_PATHS
+from .intent_validator import IntentValidator
+
+try:
+    from yaml import CSafeLoader as _YamlLoader
+except ImportError:  # 没有libyaml时退回纯Python实现
+    from yaml import SafeLoader as _YamlLoader
+
+
+# 编译格式版本（修改 compile_framework 输出结构时递增，旧的磁盘缓存自动失效）
+PLAN_FORMAT_VERSION = 2
+
+
+def _freeze(value):
+    """递归转换为只读结构（dict → MappingProxyType，list → tuple）"""
+    if isinstance(value, dict):
+        return MappingProxyType({k: _freeze(v) for k, v in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def _split_field(path: str) -> Tuple[str, str]:
+    category, field = path.split('.')
+    return category, field
+
+
+def compile_framework(framework: Dict) -> Dict:
+    """
+    把框架字典编译为计划数据（纯Python结构，可pickle）
+
+    返回:
+        {
+            'description', 'framework_version', 'domain',
+            'execution': 执行配置（skipped_categories / fixed_categories /
+                         subject_attributes / fallback_domains，未配置的项不出现）,
+            'fields': [{'name', 'category', 'field', 'category_required', ...字段配置}],
+            'dependencies': [{'name', 'when': [(category, field, value)], 'then': [...]}],
+            'required_fields': [(category, field, error_message)],
+            'consistency_checks': [{'name', 'severity', 'message', 'suggestion',
+                                    'when': [(category, field, value)]}],
+            'framework': 原始框架字典
+        }
+    """
+    fields = []
+    for category_name, category_config in framework.get('categories', {}).items():
+        for field_name, field_config in category_config.get('fields', {}).items():
+            field = dict(field_config)
+            field['search_keywords'] = {
+                value: list(keywords or [])
+                for value, keywords in (field_config.get('search_keywords') or {}).items()
+            }
+            fields.append({
+                **field,
+                'name': f"{category_name}.{field_name}",
+                'category': category_name,
+                'field': field_name,
+                'category_required': bool(category_config.get('required')),
+            })
+
+    dependencies = []
+    for rule in framework.get('dependencies', []):
+        dependencies.append({
+            'name': rule.get('name', '未命名'),
+            'when': [(*_split_field(k), v) for k, v in (rule.get('when') or {}).items()],
+            'then': [(*_split_field(k), v) for k, v in (rule.get('then') or {}).items()],
+            'has_when': 'when' in rule,
+            'has_then': 'then' in rule,
+        })
+
+    validation = framework.get('validation', {})
+    required_fields = [
+        (*_split_field(req['field']), req['error_message'])
+        for req in validation.get('required_fields', [])
+    ]
+    consistency_checks = [
+        {
+            'name': check['name'],
+            'severity': check['severity'],
+            'message': check['message'],
+            'suggestion': check.get('suggestion', ''),
+            'when': [(*_split_field(k), v) for k, v in (check.get('when') or {}).items()],
+        }
+        for check in validation.get('consistency_checks', [])
+    ]
+
+    return {
+        'description': framework.get('description'),
+        'framework_version': framework.get('framework_version'),
+        'domain': framework.get('domain', DEFAULT_DOMAIN),
+        'execution': dict(framework.get('execution') or {}),
+        'fields': fields,
+        'dependencies': dependencies,
+        'required_fields': required_fields,
+        'consistency_checks': consistency_checks,
+        'framework': framework,
+    }
+
+
+class FrameworkPlan:
+    """不可变的框架计划（所有映射为只读视图，序列为元组）"""
+
+    __slots__ = ('fingerprint', 'description', 'framework_version', 'domain', 'execution',
+                 'fields', 'field_table', 'intent_keys', 'db_categories', 'search_keywords',
+                 'dependencies', 'required_fields', 'consistency_checks', 'framework',
+                 'validator')
+
+    def __init__(self, data: Dict, fingerprint: Optional[str] = None):
+        """
+        参数:
+            data: compile_framework 的输出
+            fingerprint: 框架文件内容指纹（计划版本号）
+        """
+        set_attr = object.__setattr__
+        set_attr(self, 'fingerprint', fingerprint)
+        set_attr(self, 'description', data['description'])
+        set_attr(self, 'framework_version', data['framework_version'])
+        set_attr(self, 'domain', data['domain'])
+        set_attr(self, 'execution', _freeze(data['execution']))
+
+        fields = _freeze(data['fields'])
+        set_attr(self, 'fields', fields)
+        set_attr(self, 'field_table', MappingProxyType({f['name']: f for f in fields}))
+        # parse_intent 的扁平键 → (类别, 字段)
+        set_attr(self, 'intent_keys', tuple(
+            (f['intent_key'], f['category'], f['field']) for f in fields if f.get('intent_key')
+        ))
+        set_attr(self, 'db_categories', MappingProxyType(
+            {f['name']: f['db_category'] for f in fields if 'db_category' in f}
+        ))
+        set_attr(self, 'search_keywords', MappingProxyType(
+            {f['name']: f['search_keywords'] for f in fields}
+        ))
+        set_attr(self, 'dependencies', _freeze(data['dependencies']))
+        set_attr(self, 'required_fields', _freeze(data['required_fields']))
+        set_attr(self, 'consistency_checks', _freeze(data['consistency_checks']))
+        # 原始框架字典（兼容旧接口，只读使用）
+        set_attr(self, 'framework', data['framework'])
+        # 验证闭包不能pickle，每次构造计划时从上面的只读结构编译
+        set_attr(self, 'validator', IntentValidator(self))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("FrameworkPlan 是不可变的")
+
+    def keywords_for(self, field_name: str, value: str) -> Tuple[str, ...]:
+        """字段取值对应的搜索关键词（未配置时就是取值本身）"""
+        return self.search_keywords.get(field_name, {}).get(value, (value,))
+
+    def nest_intent(self, intent: Dict) -> Dict:
+        """
+        把扁平的intent键（如 art 领域的 art_type）放到框架的 类别.字段 下
+
+        已有的嵌套取值优先；没有需要转换的键时原样返回。
+        """
+        moves = [(key, category, field) for key, category, field in self.intent_keys
+                 if key in intent and field not in intent.get(category, {})]
+        if not moves:
+            return intent
+
+        nested = intent.copy()
+        for key, category, field in moves:
+            nested[category] = {**nested.get(category, {}), field: intent[key]}
+        return nested
+
+    @classmethod
+    def from_framework(cls, framework: Dict) -> 'FrameworkPlan':
+        """直接从框架字典编译（不经过缓存）"""
+        return cls(compile_framework(framework))
+
+
+# ========== 加载与缓存 ==========
+
+_plans: Dict[str, Tuple[Tuple[int, int], FrameworkPlan]] = {}
+_plans_lock = threading.Lock()
+
+
+def _cache_file(cache_dir: str, fingerprint: str) -> str:
+    return os.path.join(cache_dir, f"framework_{fingerprint}.pickle")
+
+
+def _read_disk_cache(path: str) -> Optional[Dict]:
+    try:
+        with open(path, 'rb') as f:
+            payload = pickle.load(f)
+    except (OSError, pickle.PickleError, EOFError, AttributeError, ImportError):
+        return None
+    if not isinstance(payload, dict) or payload.get('format') != PLAN_FORMAT_VERSION:
+        return None
+    return payload['data']
+
+
+def _write_disk_cache(path: str, data: Dict):
+    """原子写入（写临时文件后rename）；缓存目录不可写时静默跳过"""
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump({'format': PLAN_FORMAT_VERSION, 'data': data}, f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    except OSError:
+        pass
+
+
+def load_plan(framework_path: str = DEFAULT_FRAMEWORK_PATH,
+              cache_dir: Optional[str] = DEFAULT_CACHE_DIR) -> FrameworkPlan:
+    """
+    加载编译后的框架计划
+
+    进程内按 (mtime, size) 复用；文件变化时按内容哈希查找磁盘缓存，
+    都未命中才解析YAML并编译。
+
+    参数:
+        framework_path: 框架配置文件路径
+        cache_dir: 磁盘缓存目录（None表示不使用磁盘缓存）
+
+    返回:
+        FrameworkPlan
+    """
+    if not os.path.exists(framework_path):
+        raise FileNotFoundError(f"框架配置文件不存在: {framework_path}")
+
+    key = os.path.abspath(framework_path)
+    stat = os.stat(key)
+    stamp = (stat.st_mtime_ns, stat.st_size)
+
+    cached = _plans.get(key)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+
+    with _plans_lock:
+        cached = _plans.get(key)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+
+        with open(key, 'rb') as f:
+            content = f.read()
+        fingerprint = hashlib.sha1(content).hexdigest()[:16]
+
+        data = None
+        if cache_dir:
+            data = _read_disk_cache(_cache_file(cache_dir, fingerprint))
+        if data is None:
+            data = compile_framework(yaml.load(content.decode('utf-8'), Loader=_YamlLoader))
+            if cache_dir:
+                _write_disk_cache(_cache_file(cache_dir, fingerprint), data)
+
+        plan = FrameworkPlan(data, fingerprint)
+        _plans[key] = (stamp, plan)
+        return plan
+
+
+def load_domain_plan(domain: str = DEFAULT_DOMAIN,
+                     framework_paths: Optional[Dict[str, str]] = None) -> FrameworkPlan:
+    """
+    加载某个领域的框架计划（与 load_plan 相同的缓存）
+
+    参数:
+        domain: 领域（portrait/art/design/product/video）
+        framework_paths: {领域: 框架文件路径}，覆盖默认配置
+
+    返回:
+        FrameworkPlan
+    """
+    paths = DOMAIN_FRAMEWORK_PATHS if framework_paths is None else framework_paths
+    if domain not in paths:
+        raise ValueError(f"没有领域 '{domain}' 的框架配置（可用: {', '.join(paths)}）")
+    return load_plan(paths[domain])
@@ -7,89 +7,165 @@
 
 import sqlite3
 import json
+import math
+import re
+from functools import lru_cache
 from typing import Dict, List, Optional, Tuple
 
 
 
+from .candidate_cursor import DEFAULT_PAGE_SIZE
 from .constants import DEFAULT_DB_PATH
 
 
-class IntelligentGenerator:
-    """智能提示词生成器 - 理解意图，检查一致性"""
+@lru_cache(maxsize=256)
+def _like_pattern(value_filter: str):
+    """把SQL LIKE的通配符（% 和 _）转换为等价的忽略大小写正则"""
+    regex = ''.join(
+        '.*' if ch == '%' else '.' if ch == '_' else re.escape(ch)
+        for ch in value_filter
+    )
+    return re.compile(regex, re.IGNORECASE | re.DOTALL)
+
+
+def default_knowledge() -> Dict:
+    """内置的元素关系和常识约束（IntelligentGenerator.load_knowledge 的数据来源）"""
+    return {
+        # 人种 → 典型眼睛颜色
+        'ethnicity_typical_eyes': {
+            'East_Asian': ['black', 'dark brown', 'brown'],
+            'Southeast_Asian': ['dark brown', 'brown', 'black'],
+            'South_Asian': ['dark brown', 'brown', 'black'],
+            'European': ['blue', 'green', 'brown', 'hazel', 'grey'],
+            'African': ['dark brown', 'black', 'brown'],
+            'Middle_Eastern': ['brown', 'dark brown', 'hazel', 'black'],
+            'Latin_American': ['brown', 'dark brown', 'hazel', 'green'],
+        },
 
-    def __init__(self, db_path: str = DEFAULT_DB_PATH):
-        self.conn = sqlite3.connect(db_path)
-        self.cursor = self.conn.cursor()
+        # 人种 → 不合理的眼睛颜色（出现即视为冲突）
+        'ethnicity_incompatible_eyes': {
+            'East_Asian': ['green', 'blue', 'violet'],
+            'African': ['blue', 'green'],
+        },
 
-        # 加载常识知识库
-        self.knowledge = self.load_knowledge()
+        # 人种 → 替换眼型时的优先关键词（按顺序尝试）
+        'ethnicity_preferred_eyes': {
+            'East_Asian': ['almond brown', 'almond'],
+        },
 
-    def load_knowledge(self) -> Dict:
-        """加载元素关系和常识约束"""
-        return {
-            # 人种 → 典型眼睛颜色
-            'ethnicity_typical_eyes': {
-                'East_Asian': ['black', 'dark brown', 'brown'],
-                'Southeast_Asian': ['dark brown', 'brown', 'black'],
-                'South_Asian': ['dark brown', 'brown', 'black'],
-                'European': ['blue', 'green', 'brown', 'hazel', 'grey'],
-                'African': ['dark brown', 'black', 'brown'],
-                'Middle_Eastern': ['brown', 'dark brown', 'hazel', 'black'],
-                'Latin_American': ['brown', 'dark brown', 'hazel', 'green'],
-            },
+        # 人种 → 典型发色
+        'ethnicity_typical_hair': {
+            'East_Asian': ['black', 'dark brown'],
+            'Southeast_Asian': ['black', 'dark brown'],
+            'South_Asian': ['black', 'dark brown'],
+            'European': ['blonde', 'brown', 'black', 'red', 'auburn'],
+            'African': ['black', 'dark brown'],
+            'Middle_Eastern': ['black', 'dark brown', 'brown'],
+            'Latin_American': ['black', 'dark brown', 'brown'],
+        },
 
-            # 人种 → 典型发色
-            'ethnicity_typical_hair': {
-                'East_Asian': ['black', 'dark brown'],
-                'Southeast_Asian': ['black', 'dark brown'],
-                'South_Asian': ['black', 'dark brown'],
-                'European': ['blonde', 'brown', 'black', 'red', 'auburn'],
-                'African': ['black', 'dark brown'],
-                'Middle_Eastern': ['black', 'dark brown', 'brown'],
-                'Latin_American': ['black', 'dark brown', 'brown'],
-            },
+        # 时代 → 不合时宜的服装/光影（名称或模板中出现即视为冲突；选择阶段使用）
+        'era_incompatible_clothing': {
+            'ancient': ['modern', 'casual', 'business'],
+        },
+        'era_incompatible_lighting': {
+            'ancient': ['neon', 'studio_flash'],
+        },
 
-            # 风格类型定义
-            'style_types': {
-                'anime': {'type': 'art_style', 'affects': 'rendering', 'description': '动漫绘画风格'},
-                'manga': {'type': 'art_style', 'affects': 'rendering', 'description': '漫画绘画风格'},
-                'realistic': {'type': 'art_style', 'affects': 'rendering', 'description': '写实绘画风格'},
-                'illustration': {'type': 'art_style', 'affects': 'rendering', 'description': '插画绘画风格'},
+        # 风格类型定义
+        'style_types': {
+            'anime': {'type': 'art_style', 'affects': 'rendering', 'description': '动漫绘画风格'},
+            'manga': {'type': 'art_style', 'affects': 'rendering', 'description': '漫画绘画风格'},
+            'realistic': {'type': 'art_style', 'affects': 'rendering', 'description': '写实绘画风格'},
+            'illustration': {'type': 'art_style', 'affects': 'rendering', 'description': '插画绘画风格'},
 
-                'cyberpunk': {'type': 'atmosphere', 'affects': 'scene', 'description': '赛博朋克场景氛围'},
-                'fantasy': {'type': 'atmosphere', 'affects': 'scene', 'description': '奇幻场景氛围'},
-                'vintage': {'type': 'atmosphere', 'affects': 'scene', 'description': '复古场景氛围'},
+            'cyberpunk': {'type': 'atmosphere', 'affects': 'scene', 'description': '赛博朋克场景氛围'},
+            'fantasy': {'type': 'atmosphere', 'affects': 'scene', 'description': '奇幻场景氛围'},
+            'vintage': {'type': 'atmosphere', 'affects': 'scene', 'description': '复古场景氛围'},
 
-                'neon': {'type': 'lighting', 'affects': 'lighting', 'description': '霓虹灯光'},
-                'dramatic': {'type': 'lighting', 'affects': 'lighting', 'description': '戏剧性灯光'},
-            },
+            'neon': {'type': 'lighting', 'affects': 'lighting', 'description': '霓虹灯光'},
+            'dramatic': {'type': 'lighting', 'affects': 'lighting', 'description': '戏剧性灯光'},
+        },
 
-            # 导演/风格 → 光影需求映射
-            'director_lighting_styles': {
-                'zhang_yimou': {
-                    'description': '张艺谋电影风格',
-                    'lighting_keywords': ['dramatic', 'shadow', 'rim', 'contrast', 'chiaroscuro', 'volumetric'],
-                    'required_elements': ['dramatic shadows', 'rim lighting'],
-                },
-                'cinematic': {
-                    'description': '电影级',
-                    'lighting_keywords': ['dramatic', 'cinematic', 'rim', 'contrast'],
-                    'required_elements': ['dramatic lighting', 'rim lighting'],
-                },
-                'film_noir': {
-                    'description': '黑色电影',
-                    'lighting_keywords': ['shadow', 'contrast', 'chiaroscuro', 'low key'],
-                    'required_elements': ['dramatic shadows', 'high contrast'],
-                },
+        # 导演/风格 → 光影需求映射
+        'director_lighting_styles': {
+            'zhang_yimou': {
+                'description': '张艺谋电影风格',
+                'lighting_keywords': ['dramatic', 'shadow', 'rim', 'contrast', 'chiaroscuro', 'volumetric'],
+                'required_elements': ['dramatic shadows', 'rim lighting'],
+            },
+            'cinematic': {
+                'description': '电影级',
+                'lighting_keywords': ['dramatic', 'cinematic', 'rim', 'contrast'],
+                'required_elements': ['dramatic lighting', 'rim lighting'],
+            },
+            'film_noir': {
+                'description': '黑色电影',
+                'lighting_keywords': ['shadow', 'contrast', 'chiaroscuro', 'low key'],
+                'required_elements': ['dramatic shadows', 'high contrast'],
             },
+        },
 
-            # 人物属性类别（不应该被style关键词覆盖）
-            'subject_attribute_categories': {
-                'gender', 'age_range', 'ethnicity', 'skin_tones',
-                'eye_types', 'hair_colors', 'hair_styles',
-                'face_shapes', 'nose_types', 'lip_types'
-            }
+        # 人物属性类别（不应该被style关键词覆盖）
+        'subject_attribute_categories': {
+            'gender', 'age_range', 'ethnicity', 'skin_tones',
+            'eye_types', 'hair_colors', 'hair_styles',
+            'face_shapes', 'nose_types', 'lip_types'
         }
+    }
+
+
+class IntelligentGenerator:
+    """智能提示词生成器 - 理解意图，检查一致性"""
+
+    # 冲突修正会用到的候选池类别（选择阶段预取，修正阶段不再查库）
+    CONFLICT_POOL_CATEGORIES = ('eye_types', 'hair_colors')
+
+    # 生成变体时保持不变的身份类别
+    VARIANT_FIXED_CATEGORIES = ('gender', 'age_range', 'ethnicity')
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH, check_same_thread: bool = True,
+                 knowledge: Optional[Dict] = None):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path, check_same_thread=check_same_thread)
+        self.cursor = self.conn.cursor()
+
+        # 加载常识知识库（可由调用方传入，如热加载的快照）
+        self.knowledge = knowledge if knowledge is not None else self.load_knowledge()
+
+        # 预取的候选池 {(domain, category): [元素, ...]}，按reusability降序
+        # 以库版本标记为准：库变化后下一次预取时整体丢弃
+        self.candidate_pools = {}
+        self._pools_version = None
+
+        # 兼容替代索引 {(ethnicity, category): [元素, ...]}，按优先级排序
+        self.compatible_alternatives = {}
+
+        # 元素特征/兼容性位图（首次一致性检查时加载）
+        self._compatibility = None
+        self.consistency_state = None
+
+    @property
+    def compatibility(self):
+        """元素特征索引与兼容性位图（见 consistency_rules.CompatibilityMatrix）"""
+        if self._compatibility is None:
+            from .consistency_rules import CompatibilityMatrix
+            self._compatibility = CompatibilityMatrix.from_connection(self.conn, self.knowledge)
+        return self._compatibility
+
+    def load_knowledge(self) -> Dict:
+        """加载元素关系和常识约束（内置表 + knowledge_base/knowledge.yaml 覆盖）"""
+        from .reload_manager import load_knowledge_file
+        knowledge, _ = load_knowledge_file()
+        return knowledge
+
+    def set_knowledge(self, knowledge: Dict):
+        """替换知识库，并丢弃由旧知识库派生的兼容替代索引和规则"""
+        self.knowledge = knowledge
+        self.compatible_alternatives = {}
+        self._compatibility = None
+        if ('portrait', 'eye_types') in self.candidate_pools:
+            self._build_compatible_alternatives()
 
     def get_element_by_category(self, domain: str, category: str,
                                 value_filter: Optional[str] = None) -> Optional[Dict]:
@@ -114,22 +190,7 @@ class IntelligentGenerator:
         if not row:
             return None
 
-        keywords = None
-        if row[4]:
-            try:
-                keywords = json.loads(row[4])
-            except:
-                pass
-
-        return {
-            'element_id': row[0],
-            'name': row[1],
-            'chinese_name': row[2],
-            'template': row[3],
-            'keywords': keywords,
-            'reusability': row[5],
-            'category': row[6]
-        }
+        return self._row_to_element(row)
 
     def get_all_elements_by_category(self, domain: str, category: str,
                                      value_filter: Optional[str] = None) -> List[Dict]:
@@ -151,82 +212,203 @@ class IntelligentGenerator:
         self.cursor.execute(query, params)
         rows = self.cursor.fetchall()
 
-        elements = []
-        for row in rows:
-            keywords = None
-            if row[4]:
-                try:
-                    keywords = json.loads(row[4])
-                except:
-                    pass
+        return [self._row_to_element(row) for row in rows]
 
-            elements.append({
-                'element_id': row[0],
-                'name': row[1],
-                'chinese_name': row[2],
-                'template': row[3],
-                'keywords': keywords,
-                'reusability': row[5],
-                'category': row[6]
-            })
+    def refresh_candidate_pools(self) -> bool:
+        """
+        库变化后丢弃已预取的候选池及由其派生的兼容替代索引和特征缓存
 
-        return elements
+        库版本见 element_db.library_stamp（一次索引查询或文件stat）。
 
-    def select_elements_by_intent(self, intent: Dict) -> List[Dict]:
+        返回:
+            是否丢弃了旧的候选池
         """
-        基于解析的意图从数据库选择元素
+        from .element_db import library_stamp
+
+        version = library_stamp(self.conn, self.db_path)
+        if version == self._pools_version:
+            return False
+
+        stale = bool(self.candidate_pools)
+        self._pools_version = version
+        self.candidate_pools = {}
+        self.compatible_alternatives = {}
+        if stale:
+            self._compatibility = None
+        return stale
+
+    def prefetch_candidate_pools(self, categories: List[str],
+                                 domain: str = 'portrait') -> Dict[str, List[Dict]]:
+        """
+        一次查询预取多个类别的候选池（已缓存的类别不再查询）
 
-        intent格式:
-        {
-            'subject': {
-                'gender': 'female',
-                'ethnicity': 'East_Asian',
-                'age_range': 'young_adult'
-            },
-            'visual_style': {
-                'art_style': 'anime'
-            },
-            'atmosphere': {
-                'theme': 'cyberpunk'
-            }
+        每次调用先检查库版本，库变化后重新查询。同一请求内的逐字段挑选
+        （pick_from_pool 等）直接使用已预取的池，不再检查。
+
+        返回:
+            {category: [元素列表（按reusability降序）]}
+        """
+        self.refresh_candidate_pools()
+        return self._candidate_pools(categories, domain)
+
+    def _candidate_pools(self, categories: List[str], domain: str = 'portrait') -> Dict[str, List[Dict]]:
+        """候选池（缺失的类别一次查询补齐；不检查库版本）"""
+        missing = [c for c in categories if (domain, c) not in self.candidate_pools]
+
+        if missing:
+            placeholders = ','.join('?' for _ in missing)
+            self.cursor.execute(f"""
+                SELECT element_id, name, chinese_name, ai_prompt_template,
+                       keywords, reusability_score, category_id
+                FROM elements
+                WHERE domain_id = ? AND category_id IN ({placeholders})
+                ORDER BY reusability_score DESC
+            """, [domain] + missing)
+
+            for category in missing:
+                self.candidate_pools[(domain, category)] = []
+            for row in self.cursor.fetchall():
+                self.candidate_pools[(domain, row[6])].append(self._row_to_element(row))
+
+            if domain == 'portrait':
+                self._build_compatible_alternatives()
+
+        return {c: self.candidate_pools[(domain, c)] for c in categories}
+
+    def adopt_candidate_pools(self, pools: Dict[Tuple[str, str], List[Dict]]):
+        """
+        采用其他生成器预取的候选池（批量生成时多个工作线程共享一次预取）
+
+        池中的元素只读共享；本生成器已有的 (领域, 类别) 保持不变。
+
+        参数:
+            pools: {(领域, 类别): 元素列表}
+        """
+        self.refresh_candidate_pools()
+        added = [key for key in pools if key not in self.candidate_pools]
+        for key in added:
+            self.candidate_pools[key] = pools[key]
+
+        if any(domain == 'portrait' for domain, _ in added):
+            self._build_compatible_alternatives()
+
+    def _build_compatible_alternatives(self):
+        """根据知识库为每个(人种, 类别)预先计算兼容的替代元素"""
+        eye_pool = self.candidate_pools.get(('portrait', 'eye_types'))
+        hair_pool = self.candidate_pools.get(('portrait', 'hair_colors'))
+
+        for ethnicity in self.knowledge['ethnicity_typical_eyes']:
+            if eye_pool is not None:
+                preferred = self.knowledge['ethnicity_preferred_eyes'].get(ethnicity, [])
+                compatible = [
+                    e for e in eye_pool
+                    if self.compatibility.element_conflict(e, ethnicity, None, 'eye_types') is None
+                ]
+                self.compatible_alternatives[(ethnicity, 'eye_types')] = \
+                    self._rank_by_filters(compatible, preferred, keep_unmatched=True)
+
+            if hair_pool is not None:
+                typical_hair = self.knowledge['ethnicity_typical_hair'].get(ethnicity, ['black'])
+                self.compatible_alternatives[(ethnicity, 'hair_colors')] = \
+                    self._rank_by_filters(hair_pool, typical_hair, keep_unmatched=False)
+
+    def _rank_by_filters(self, pool: List[Dict], filters: List[str],
+                         keep_unmatched: bool) -> List[Dict]:
+        """按第一个命中的过滤词排序（稳定排序，同级保持reusability顺序）"""
+        ranked = []
+        for elem in pool:
+            rank = next((i for i, f in enumerate(filters) if self._matches_filter(elem, f)), None)
+            if rank is None:
+                if not keep_unmatched:
+                    continue
+                rank = len(filters)
+            ranked.append((rank, elem))
+
+        ranked.sort(key=lambda item: item[0])
+        return [elem for _, elem in ranked]
+
+    @staticmethod
+    def _matches_filter(elem: Dict, value_filter: Optional[str]) -> bool:
+        """内存版的 LIKE '%filter%'（模板或关键词，忽略大小写，'_'匹配任意单个字符）"""
+        if not value_filter:
+            return True
+        pattern = _like_pattern(value_filter)
+        if pattern.search(elem.get('template') or ''):
+            return True
+        return any(pattern.search(kw) for kw in (elem.get('keywords') or []) if isinstance(kw, str))
+
+    def pick_from_pool(self, category: str, value_filter: Optional[str] = None,
+                       domain: str = 'portrait') -> Optional[Dict]:
+        """从预取的候选池中选择元素（语义等同于get_element_by_category）"""
+        pool = self._candidate_pools([category], domain)[category]
+        return next((e for e in pool if self._matches_filter(e, value_filter)), None)
+
+    def get_compatible_alternative(self, ethnicity: str, category: str) -> Optional[Dict]:
+        """从兼容替代索引中取优先级最高的元素"""
+        if ethnicity not in self.knowledge['ethnicity_typical_eyes']:
+            ethnicity = 'East_Asian'
+        self._candidate_pools(list(self.CONFLICT_POOL_CATEGORIES))
+        alternatives = self.compatible_alternatives.get((ethnicity, category), [])
+        return alternatives[0] if alternatives else None
+
+    def _row_to_element(self, row: Tuple) -> Dict:
+        """将查询行转换为元素字典"""
+        keywords = None
+        if row[4]:
+            try:
+                keywords = json.loads(row[4])
+            except:
+                pass
+
+        return {
+            'element_id': row[0],
+            'name': row[1],
+            'chinese_name': row[2],
+            'template': row[3],
+            'keywords': keywords,
+            'reusability': row[5],
+            'category': row[6]
         }
+
+    def build_selection_plan(self, intent: Dict) -> Dict:
         """
-        elements = []
+        将intent转换为选择计划（不访问数据库）
+
+        返回:
+            {
+                'slots': [(category, [过滤词...], (标签, intent值) 或 None), ...],  # 按输出顺序
+                'style_keywords': [...],
+                'domain': 'portrait'
+            }
+
+        每个slot的过滤词按顺序尝试，第一个命中的过滤词决定选择结果；
+        过滤词为None表示不过滤（取reusability最高的元素）。
+        """
+        slots = []
 
-        # 1. 选择人物属性
+        # 1. 人物属性
         subject = intent.get('subject', {})
 
         if 'gender' in subject:
-            elem = self.get_element_by_category('portrait', 'gender', subject['gender'])
-            if elem:
-                elements.append(elem)
+            slots.append(('gender', [subject['gender']], None))
 
         if 'age_range' in subject:
-            elem = self.get_element_by_category('portrait', 'age_range')
-            if elem:
-                elements.append(elem)
+            slots.append(('age_range', [None], None))
 
         if 'ethnicity' in subject:
             ethnicity_name = subject['ethnicity']
-            elem = self.get_element_by_category('portrait', 'ethnicity', ethnicity_name)
-            if elem:
-                elements.append(elem)
+            slots.append(('ethnicity', [ethnicity_name], None))
 
             # 自动选择匹配人种的眼睛
             # 对于东亚人，选择almond/large expressive类型（避免green/blue）
             if ethnicity_name == 'East_Asian':
-                eye_elem = self.get_element_by_category('portrait', 'eye_types', 'almond')
+                slots.append(('eye_types', ['almond'], None))
             else:
-                eye_elem = self.get_element_by_category('portrait', 'eye_types')
-
-            if eye_elem:
-                elements.append(eye_elem)
+                slots.append(('eye_types', [None], None))
 
             # 自动选择匹配人种的发色
             typical_hair = self.knowledge['ethnicity_typical_hair'].get(ethnicity_name, ['black'])
-            hair_color_elem = self.get_element_by_category('portrait', 'hair_colors', typical_hair[0])
-            if hair_color_elem:
-                elements.append(hair_color_elem)
+            slots.append(('hair_colors', [typical_hair[0]], None))
 
         # 2. 根据intent选择服装和发型（优先使用intent指定的）
         clothing = intent.get('clothing', 'modern')
@@ -241,26 +423,11 @@ class IntelligentGenerator:
             'formal': ['formal', 'evening']
         }
 
-        # 搜索服装元素
         if clothing != 'modern':  # 如果非默认，搜索特定服装
-            search_keywords = clothing_keywords_map.get(clothing, [clothing])
-            clothing_elem = None
-            # 尝试用每个关键词搜索
-            for kw in search_keywords:
-                clothing_elem = self.get_element_by_category('portrait', 'clothing_styles', kw)
-                if clothing_elem:
-                    print(f"✓ 找到服装元素: '{clothing_elem['chinese_name']}'（搜索关键词: {kw}）")
-                    elements.append(clothing_elem)
-                    break
-
-            # 如果没找到，记录信息
-            if not clothing_elem:
-                print(f"⚠️ 未找到'{clothing}'服装元素，将通过风格关键词搜索")
+            slots.append(('clothing_styles', clothing_keywords_map.get(clothing, [clothing]), ('服装', clothing)))
         else:
             # 默认选择一个现代服装
-            elem = self.get_element_by_category('portrait', 'clothing_styles')
-            if elem:
-                elements.append(elem)
+            slots.append(('clothing_styles', [None], None))
 
         # 发型关键词映射（灵活搜索）
         hairstyle_keywords_map = {
@@ -268,41 +435,23 @@ class IntelligentGenerator:
             'traditional_japanese': ['traditional', 'japanese'],
         }
 
-        # 搜索发型元素（如果指定了特殊发型）
         if hairstyle != 'modern':
-            search_keywords = hairstyle_keywords_map.get(hairstyle, [hairstyle])
-            hair_style_elem = None
-            # 尝试用每个关键词搜索
-            for kw in search_keywords:
-                hair_style_elem = self.get_element_by_category('portrait', 'hair_styles', kw)
-                if hair_style_elem:
-                    print(f"✓ 找到发型元素: '{hair_style_elem['chinese_name']}'（搜索关键词: {kw}）")
-                    elements.append(hair_style_elem)
-                    break
-
-            # 如果没找到，记录信息
-            if not hair_style_elem:
-                print(f"⚠️ 未找到'{hairstyle}'发型元素，将通过风格关键词搜索")
+            slots.append(('hair_styles', hairstyle_keywords_map.get(hairstyle, [hairstyle]), ('发型', hairstyle)))
         else:
             # 默认选择一个现代发型
-            elem = self.get_element_by_category('portrait', 'hair_styles')
-            if elem:
-                elements.append(elem)
+            slots.append(('hair_styles', [None], None))
 
-        # 3. 选择其他人物属性
+        # 3. 其他人物属性
         for attr in ['skin_tones', 'skin_textures', 'face_shapes',
                      'makeup_styles', 'expressions', 'poses']:
-            elem = self.get_element_by_category('portrait', attr)
-            if elem:
-                elements.append(elem)
+            slots.append((attr, [None], None))
 
-        # 4. 添加风格元素（lighting, era, director_style等）
+        # 4. 风格关键词（lighting, era, director_style等）
         visual_style = intent.get('visual_style', {})
         atmosphere = intent.get('atmosphere', {})
         era = intent.get('era', 'modern')
         lighting = intent.get('lighting', 'natural')
 
-        # 收集所有风格关键词
         style_keywords = []
 
         # 添加服装关键词（补充搜索）
@@ -355,13 +504,254 @@ class IntelligentGenerator:
                 style_keywords.extend(director_keywords[director_style])
                 print(f"✓ 识别到导演风格'{director_style}'，添加特征关键词: {', '.join(director_keywords[director_style])}")
 
-        if style_keywords:
-            domain = intent.get('domain', 'portrait')
-            style_elements = self.search_style_elements(style_keywords, domain)
-            elements.extend(style_elements)
+        return {
+            'slots': slots,
+            'style_keywords': style_keywords,
+            'domain': intent.get('domain', 'portrait')
+        }
+
+    def select_elements_by_intent(self, intent: Dict, reject_conflicts: bool = False) -> List[Dict]:
+        """
+        基于解析的意图从数据库选择元素
+
+        intent格式:
+        {
+            'subject': {
+                'gender': 'female',
+                'ethnicity': 'East_Asian',
+                'age_range': 'young_adult'
+            },
+            'visual_style': {
+                'art_style': 'anime'
+            },
+            'atmosphere': {
+                'theme': 'cyberpunk'
+            }
+        }
+
+        所有人物属性类别通过一次查询预取为候选池，后续冲突修正直接复用。
+
+        reject_conflicts=True 时边选边检查（ConsistencyState）：与已选元素冲突的
+        候选直接跳过，眼睛/发色找不到兼容候选时改用兼容替代，风格元素中
+        产生冲突的（如重复类别）不再加入，选择结果无需事后修正。
+        最近一次选择的状态保存在 self.consistency_state。
+        """
+        plan = self.build_selection_plan(intent)
+        self.prefetch_candidate_pools(self._plan_categories(plan))
+
+        state = None
+        if reject_conflicts:
+            from .consistency_rules import ConsistencyState
+            # 意图中的人种/时代作为上下文（时代规则只在给出时代时生效）
+            scene = intent.get('scene', {})
+            era = scene.get('era') if isinstance(scene, dict) and scene.get('era') else intent.get('era')
+            state = ConsistencyState({
+                'ethnicity': intent.get('subject', {}).get('ethnicity'),
+                'era': era,
+            }, engine=self.compatibility.engine)
+        self.consistency_state = state
+
+        elements = []
+        for category, filters, label in plan['slots']:
+            if state is None:
+                elem, matched_filter = self._pick_first_match(category, filters)
+            else:
+                elem, matched_filter = self._pick_consistent_match(category, filters, state)
+            if elem:
+                if label:
+                    print(f"✓ 找到{label[0]}元素: '{elem['chinese_name']}'（搜索关键词: {matched_filter}）")
+                elements.append(elem)
+                if state is not None:
+                    state.add(elem, category)
+            elif label:
+                print(f"⚠️ 未找到'{label[1]}'{label[0]}元素，将通过风格关键词搜索")
+
+        if plan['style_keywords']:
+            style_elements = self.search_style_elements(plan['style_keywords'], plan['domain'])
+            for elem in style_elements:
+                if state is not None:
+                    if not state.is_compatible(elem):
+                        continue
+                    state.add(elem)
+                elements.append(elem)
 
         return elements
 
+    def _plan_categories(self, plan: Dict) -> List[str]:
+        """选择计划涉及的所有类别（含冲突修正所需类别）"""
+        categories = list(self.CONFLICT_POOL_CATEGORIES)
+        for category, _, _ in plan['slots']:
+            if category not in categories:
+                categories.append(category)
+        return categories
+
+    def _pick_first_match(self, category: str, filters: List[Optional[str]]) -> Tuple[Optional[Dict], Optional[str]]:
+        """按顺序尝试过滤词，返回(第一个命中的元素, 命中的过滤词)"""
+        for value_filter in filters:
+            elem = self.pick_from_pool(category, value_filter)
+            if elem:
+                return elem, value_filter
+        return None, None
+
+    def _pick_consistent_match(self, category: str, filters: List[Optional[str]],
+                               state) -> Tuple[Optional[Dict], Optional[str]]:
+        """
+        按顺序尝试过滤词，返回第一个加入后不产生冲突的元素
+
+        所有命中的元素都冲突时，眼睛/发色改用兼容替代，其他类别保留第一个命中
+        """
+        pool = self._candidate_pools([category])[category]
+        first = None
+        for value_filter in filters:
+            for elem in pool:
+                if not self._matches_filter(elem, value_filter):
+                    continue
+                if state.is_compatible(elem, category):
+                    return elem, value_filter
+                if first is None:
+                    first = (elem, value_filter)
+
+        if first and category in self.CONFLICT_POOL_CATEGORIES and state.context.get('ethnicity'):
+            alternative = self.get_compatible_alternative(state.context['ethnicity'], category)
+            if alternative and state.is_compatible(alternative, category):
+                return alternative, first[1]
+
+        return first or (None, None)
+
+    def generate_variants(self, intent: Dict, n: int = 8, seed: Optional[int] = None,
+                          diversity: float = 0.5, mode: str = 'auto',
+                          keywords_limit: int = 3) -> List[Dict]:
+        """
+        从同一个intent批量生成N个不同的提示词变体
+
+        候选池和风格元素只查询一次；之后每个变体只是内存中的采样、
+        一致性检查（无I/O）和组合。
+
+        参数:
+            intent: 用户意图（格式同select_elements_by_intent）
+            n: 变体数量
+            seed: 随机种子（相同seed结果可复现）
+            diversity: 多样性 0-1，0 只取最优元素，1 按reusability比例采样
+            mode: 组合模式
+            keywords_limit: 每个元素的关键词数量上限
+
+        返回:
+            [{'prompt', 'elements', 'content_hash', 'fixes'}, ...]
+            第一个变体总是确定性的最优组合；组合不足时返回少于N个
+        """
+        import hashlib
+        import random
+
+        rng = random.Random(seed)
+        diversity = max(0.0, min(1.0, diversity))
+
+        # 1. 一次性准备：选择计划、候选池、风格元素
+        plan = self.build_selection_plan(intent)
+        self.prefetch_candidate_pools(self._plan_categories(plan))
+        ethnicity = intent.get('subject', {}).get('ethnicity')
+
+        slot_candidates = []
+        for category, filters, _ in plan['slots']:
+            slot_candidates.append(self._variant_candidates(category, filters, ethnicity))
+
+        style_elements = []
+        if plan['style_keywords']:
+            style_elements = self.search_style_elements(plan['style_keywords'], plan['domain'])
+
+        # 2. 采样N个不同的组合
+        variants = []
+        seen_combinations = set()
+        seen_hashes = set()
+        max_attempts = max(n * 20, 50)
+
+        for attempt in range(max_attempts):
+            if len(variants) >= n:
+                break
+
+            picks = []
+            for candidates in slot_candidates:
+                if not candidates:
+                    continue
+                if attempt == 0 or diversity == 0:
+                    picks.append(candidates[0])
+                else:
+                    picks.append(self._weighted_choice(rng, candidates, diversity))
+
+            combination = tuple(e['element_id'] for e in picks)
+            if combination in seen_combinations:
+                continue
+            seen_combinations.add(combination)
+
+            elements = picks + style_elements
+            issues = self.check_consistency(elements)
+            fixes = []
+            if issues:
+                elements, fixes = self.resolve_conflicts(elements, issues)
+
+            # 3. 组合并按内容哈希去重
+            prompt = self.compose_prompt(elements, mode=mode, keywords_limit=keywords_limit)
+            content_hash = hashlib.sha1(prompt.encode('utf-8')).hexdigest()[:16]
+            if content_hash in seen_hashes:
+                continue
+            seen_hashes.add(content_hash)
+
+            variants.append({
+                'prompt': prompt,
+                'elements': elements,
+                'content_hash': content_hash,
+                'fixes': fixes
+            })
+
+            if diversity == 0:
+                break
+
+        return variants
+
+    def _variant_candidates(self, category: str, filters: List[Optional[str]],
+                            ethnicity: Optional[str]) -> List[Dict]:
+        """变体采样的候选：命中过滤词的元素（按过滤词顺序、reusability降序）"""
+        best, _ = self._pick_first_match(category, filters)
+        if category in self.VARIANT_FIXED_CATEGORIES:
+            return [best] if best is not None else []
+
+        if category in self.CONFLICT_POOL_CATEGORIES and ethnicity:
+            # 人种相关类别只在兼容替代中采样，保证组合本身一致
+            compatible_ids = {e['element_id'] for e in
+                              self.compatible_alternatives.get((ethnicity, category), [])}
+        else:
+            compatible_ids = None
+
+        pool = self.candidate_pools.get(('portrait', category), [])
+        candidates = []
+        seen = set()
+        for value_filter in filters:
+            for elem in pool:
+                if elem['element_id'] in seen or not self._matches_filter(elem, value_filter):
+                    continue
+                if compatible_ids is not None and elem['element_id'] not in compatible_ids:
+                    continue
+                seen.add(elem['element_id'])
+                candidates.append(elem)
+
+        # 确定性最优选择始终排在第一位
+        if best is not None:
+            candidates = [best] + [e for e in candidates if e['element_id'] != best['element_id']]
+
+        return candidates
+
+    @staticmethod
+    def _weighted_choice(rng, candidates: List[Dict], diversity: float) -> Dict:
+        """
+        按reusability加权采样（权重 ∝ score^(1/diversity)），diversity越小越偏向高分元素
+
+        权重在对数空间计算并以最高分归一（最高分的权重为1）：diversity很小时
+        不会溢出，分数都很低时也不会全部下溢为0。
+        """
+        logs = [math.log(max(e.get('reusability') or 0.0, 0.1)) for e in candidates]
+        top = max(logs)
+        weights = [math.exp((x - top) / diversity) for x in logs]
+        return rng.choices(candidates, weights=weights, k=1)[0]
+
     def calculate_relevance(self, element: Dict, required_keywords: List[str]) -> float:
         """
         计算元素与需求的相关性得分（0-1）
@@ -468,76 +858,54 @@ class IntelligentGenerator:
         """
         issues = []
 
-        # 提取关键元素
+        # 人种上下文来自已选的人种元素（没有人种元素时不检查人种相关规则）
         ethnicity_elem = self.find_element_by_category(elements, 'ethnicity')
-        eye_elem = self.find_element_by_category(elements, 'eye_types')
-        hair_elem = self.find_element_by_category(elements, 'hair_colors')
-
-        # 检查1：人种 vs 眼睛颜色（检测不合理的颜色如green/blue for 东亚人）
-        if ethnicity_elem and eye_elem:
-            ethnicity_name = self.extract_ethnicity_name(ethnicity_elem['name'])
-            eye_template = eye_elem['template'].lower()
-
-            # 检测不合理的颜色
-            incompatible_colors = []
-            if ethnicity_name == 'East_Asian':
-                # 东亚人不应该有这些眼睛颜色
-                if 'green' in eye_template or 'blue' in eye_template or 'violet' in eye_template:
-                    incompatible_colors = ['green', 'blue', 'violet']
-            elif ethnicity_name == 'African':
-                if 'blue' in eye_template or 'green' in eye_template:
-                    incompatible_colors = ['blue', 'green']
-
-            if incompatible_colors:
-                typical_eyes = self.knowledge['ethnicity_typical_eyes'].get(ethnicity_name, ['brown'])
-                issues.append({
-                    'type': 'ethnicity_eye_mismatch',
-                    'severity': 'medium',
-                    'current_ethnicity': ethnicity_elem['chinese_name'],
-                    'current_eye': eye_elem['template'],
-                    'incompatible_colors': incompatible_colors,
-                    'typical_eyes': typical_eyes,
-                    'description': f"{ethnicity_elem['chinese_name']}通常不会有包含'{', '.join(incompatible_colors)}'的眼睛",
-                    'suggestion': f"建议选择包含这些颜色的眼型: {', '.join(typical_eyes)}"
-                })
-
-        # 检查2：人种 vs 发色
-        if ethnicity_elem and hair_elem:
-            ethnicity_name = self.extract_ethnicity_name(ethnicity_elem['name'])
-            typical_hair = self.knowledge['ethnicity_typical_hair'].get(ethnicity_name, [])
-
-            hair_template = hair_elem['template'].lower()
-            is_typical = any(color in hair_template for color in typical_hair)
-
-            if not is_typical:
-                issues.append({
-                    'type': 'ethnicity_hair_mismatch',
-                    'severity': 'low',
-                    'current_ethnicity': ethnicity_elem['chinese_name'],
-                    'current_hair': hair_elem['template'],
-                    'typical_hair': typical_hair,
-                    'description': f"{ethnicity_elem['chinese_name']}通常不会有'{hair_elem['template']}'",
-                    'suggestion': f"建议改为: {', '.join(typical_hair)}"
-                })
-
-        # 检查3：重复类别（但lighting_techniques允许多个）
-        category_counts = {}
-        for elem in elements:
-            cat = elem['category']
-            category_counts[cat] = category_counts.get(cat, 0) + 1
-
-        # 允许多个元素的类别
-        multi_element_categories = {'lighting_techniques', 'photography_techniques'}
+        ethnicity_name = self.extract_ethnicity_name(ethnicity_elem['name']) if ethnicity_elem else None
+        context = {'ethnicity': ethnicity_name, 'era': None}
+        engine = self.compatibility.engine
+
+        # 眼睛/发色只检查该类别的第一个元素
+        for category in ('eye_types', 'hair_colors'):
+            elem = self.find_element_by_category(elements, category)
+            if elem is None:
+                continue
 
-        for cat, count in category_counts.items():
-            # lighting_techniques等类别允许多个元素组合
-            if count > 1 and cat not in multi_element_categories:
+            for v in engine.element_violations(elem, context, category):
+                if v['rule'] == 'ethnicity_eye_mismatch':
+                    incompatible_colors = self.knowledge['ethnicity_incompatible_eyes'].get(ethnicity_name, [])
+                    typical_eyes = self.knowledge['ethnicity_typical_eyes'].get(ethnicity_name, ['brown'])
+                    issues.append({
+                        'type': 'ethnicity_eye_mismatch',
+                        'severity': v['severity'],
+                        'current_ethnicity': ethnicity_elem['chinese_name'],
+                        'current_eye': elem['template'],
+                        'incompatible_colors': incompatible_colors,
+                        'typical_eyes': typical_eyes,
+                        'description': f"{ethnicity_elem['chinese_name']}通常不会有包含'{', '.join(incompatible_colors)}'的眼睛",
+                        'suggestion': f"建议选择包含这些颜色的眼型: {', '.join(typical_eyes)}"
+                    })
+
+                elif v['rule'] == 'ethnicity_hair_mismatch':
+                    typical_hair = self.knowledge['ethnicity_typical_hair'].get(ethnicity_name, [])
+                    issues.append({
+                        'type': 'ethnicity_hair_mismatch',
+                        'severity': v['severity'],
+                        'current_ethnicity': ethnicity_elem['chinese_name'],
+                        'current_hair': elem['template'],
+                        'typical_hair': typical_hair,
+                        'description': f"{ethnicity_elem['chinese_name']}通常不会有'{elem['template']}'",
+                        'suggestion': f"建议改为: {', '.join(typical_hair)}"
+                    })
+
+        # 重复类别（lighting_techniques等允许多个）
+        for v in engine.unique_violations(elements):
+            if v['rule'] == 'duplicate_category':
                 issues.append({
                     'type': 'duplicate_category',
-                    'severity': 'high',
-                    'category': cat,
-                    'count': count,
-                    'description': f"类别'{cat}'出现了{count}次（应该只有1次）",
+                    'severity': v['severity'],
+                    'category': v['key'],
+                    'count': v['count'],
+                    'description': f"类别'{v['key']}'出现了{v['count']}次（应该只有1次）",
                     'suggestion': "保留最相关的一个元素"
                 })
 
@@ -659,30 +1027,25 @@ class IntelligentGenerator:
         """
         解决检测到的冲突
 
+        替换元素来自预取的候选池和兼容替代索引，修正过程不再访问数据库；
+        所有修正先记录下来，最后一次性重建元素列表。
+
         返回：(修正后的元素列表, 修正说明列表)
         """
-        fixed_elements = elements.copy()
         fixes_applied = []
+        replacements = {}      # category → 新元素（追加到末尾）
+        dedupe_categories = set()
+
+        ethnicity_elem = self.find_element_by_category(elements, 'ethnicity')
+        ethnicity_name = self.extract_ethnicity_name(ethnicity_elem['name']) if ethnicity_elem else 'East_Asian'
 
         for issue in issues:
             if issue['type'] == 'ethnicity_eye_mismatch':
                 # 替换为符合人种的眼睛（选择almond/brown等合适的）
-                ethnicity_elem = self.find_element_by_category(fixed_elements, 'ethnicity')
-                ethnicity_name = self.extract_ethnicity_name(ethnicity_elem['name']) if ethnicity_elem else 'East_Asian'
-
-                # 为不同人种选择合适的眼型
-                if ethnicity_name == 'East_Asian':
-                    new_eye_elem = self.get_element_by_category('portrait', 'eye_types', 'almond brown')
-                    if not new_eye_elem:
-                        new_eye_elem = self.get_element_by_category('portrait', 'eye_types', 'almond')
-                else:
-                    new_eye_elem = self.get_element_by_category('portrait', 'eye_types')
+                new_eye_elem = self.get_compatible_alternative(ethnicity_name, 'eye_types')
 
                 if new_eye_elem:
-                    # 移除旧的eye元素
-                    fixed_elements = [e for e in fixed_elements if e['category'] != 'eye_types']
-                    # 添加新的
-                    fixed_elements.append(new_eye_elem)
+                    replacements['eye_types'] = new_eye_elem
 
                     fixes_applied.append(
                         f"✓ 修正眼睛: '{issue['current_eye']}' → '{new_eye_elem['template']}' "
@@ -691,12 +1054,10 @@ class IntelligentGenerator:
 
             elif issue['type'] == 'ethnicity_hair_mismatch':
                 # 替换发色
-                suggested_color = issue['typical_hair'][0]
-                new_hair_elem = self.get_element_by_category('portrait', 'hair_colors', suggested_color)
+                new_hair_elem = self.get_compatible_alternative(ethnicity_name, 'hair_colors')
 
                 if new_hair_elem:
-                    fixed_elements = [e for e in fixed_elements if e['category'] != 'hair_colors']
-                    fixed_elements.append(new_hair_elem)
+                    replacements['hair_colors'] = new_hair_elem
 
                     fixes_applied.append(
                         f"✓ 修正发色: '{issue['current_hair']}' → '{new_hair_elem['template']}' "
@@ -705,19 +1066,23 @@ class IntelligentGenerator:
 
             elif issue['type'] == 'duplicate_category':
                 # 保留第一个，删除其他
-                cat = issue['category']
-                kept = False
-                new_list = []
-                for elem in fixed_elements:
-                    if elem['category'] == cat:
-                        if not kept:
-                            new_list.append(elem)
-                            kept = True
-                    else:
-                        new_list.append(elem)
-
-                fixed_elements = new_list
-                fixes_applied.append(f"✓ 移除重复的'{cat}'类别元素")
+                dedupe_categories.add(issue['category'])
+                fixes_applied.append(f"✓ 移除重复的'{issue['category']}'类别元素")
+
+        # 单次遍历重建列表：被替换的类别整体移除，重复类别只保留第一个
+        fixed_elements = []
+        seen_categories = set()
+        for elem in elements:
+            cat = elem['category']
+            if cat in replacements:
+                continue
+            if cat in dedupe_categories:
+                if cat in seen_categories:
+                    continue
+                seen_categories.add(cat)
+            fixed_elements.append(elem)
+
+        fixed_elements.extend(replacements.values())
 
         return fixed_elements, fixes_applied
 
@@ -934,19 +1299,22 @@ def test_intelligent_generator():
     gen.close()
 
 
-def query_candidates_by_intent(intent: dict, db_path: str = 'extracted_results/elements.db') -> dict:
+def query_candidates_by_intent(intent: dict, db_path: str = 'extracted_results/elements.db',
+                               limit: Optional[int] = DEFAULT_PAGE_SIZE) -> dict:
     """
-    【执行层】根据Intent查询所有候选元素
+    【执行层】根据Intent查询候选元素
 
-    输入：Intent字典（由SKILL构造）
+    输入：Intent字典（由SKILL构造）；limit为每个字段的候选数（按得分降序，
+          默认一页，None表示全部）
     输出：候选字典 {field: [elements]}
     """
-    from framework_loader import FrameworkDrivenGenerator
+    from .framework_loader import FrameworkDrivenGenerator
 
     gen = FrameworkDrivenGenerator(db_path)
-    candidates = gen.query_all_candidates_by_framework(intent)
-
-    return candidates
+    try:
+        return gen.query_all_candidates_by_framework(intent, limit)
+    finally:
+        gen.close()
 
 
 def assemble_prompt_from_elements(elements: list, subject_desc: str = '') -> str:
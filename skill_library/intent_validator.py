@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+预编译的Intent验证程序
+Precompiled intent validators and dependency program
+
+FrameworkLoader.validate_intent / apply_dependencies 原本每次调用都解释框架：
+遍历类别和字段、在YAML列表里查找取值。这里在框架计划编译时生成：
+
+- 每个字段一个验证闭包（枚举取值用 frozenset 判断）
+- 必选字段表、一致性检查表（条件列表预先转为 frozenset）
+- 按拓扑顺序排列的依赖规则程序（写入某字段的规则排在读取该字段的规则之前）
+
+补全 + 验证一个intent只是一次紧凑的循环；validate_batch / validate_jsonl
+用于批量验证大量intent（每行一个JSON的语料）。
+
+批量验证:
+    python -m skill_library.intent_validator corpus.jsonl [framework_path]
+"""
+
+import heapq
+import json
+import sys
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+
+def _membership(values: Tuple) -> Callable[[object], bool]:
+    """取值 → 是否在列表中（可哈希时查 frozenset，否则退回线性比较）"""
+    allowed = frozenset(v for v in values if v.__hash__ is not None)
+
+    def contains(value) -> bool:
+        try:
+            return value in allowed
+        except TypeError:
+            return value in values
+
+    return contains
+
+
+def _field_validator(field: Dict) -> Optional[Callable[[object], Optional[Dict]]]:
+    """为单个字段生成验证闭包（无需检查的字段返回None）"""
+    name = field['name']
+    field_type = field.get('type')
+
+    if field_type == 'enum' and field.get('values'):
+        values = tuple(field['values'])
+        contains = _membership(values)
+
+        def validate_enum(value) -> Optional[Dict]:
+            if contains(value):
+                return None
+            return {
+                'type': 'invalid_value',
+                'field': name,
+                'severity': 'error',
+                'value': value,
+                'message': f"{name} 的取值 {value!r} 不在允许范围内",
+                'allowed': list(values),
+            }
+
+        return validate_enum
+
+    if field_type == 'string':
+        def validate_string(value) -> Optional[Dict]:
+            if value is None or isinstance(value, str):
+                return None
+            return {
+                'type': 'invalid_type',
+                'field': name,
+                'severity': 'error',
+                'value': value,
+                'message': f"{name} 应该是字符串，实际为 {type(value).__name__}",
+            }
+
+        return validate_string
+
+    return None
+
+
+def order_dependencies(dependencies: Iterable[Dict]) -> List[Dict]:
+    """
+    依赖规则拓扑排序
+
+    规则A的then写入规则B的when读取的字段时，A排在B之前；
+    没有先后约束的规则保持框架中的顺序，存在环时环内规则也按框架顺序执行。
+    """
+    rules = list(dependencies)
+    writes = [{(c, f) for c, f, _ in rule['then']} for rule in rules]
+    reads = [{(c, f) for c, f, _ in rule['when']} for rule in rules]
+
+    successors = [[] for _ in rules]
+    in_degree = [0] * len(rules)
+    for a in range(len(rules)):
+        for b in range(len(rules)):
+            if a != b and writes[a] & reads[b]:
+                successors[a].append(b)
+                in_degree[b] += 1
+
+    ready = [i for i, degree in enumerate(in_degree) if degree == 0]
+    heapq.heapify(ready)
+    order = []
+    while ready:
+        i = heapq.heappop(ready)
+        order.append(i)
+        for j in successors[i]:
+            in_degree[j] -= 1
+            if in_degree[j] == 0:
+                heapq.heappush(ready, j)
+
+    # 环：剩余规则按原顺序追加
+    placed = set(order)
+    order.extend(i for i in range(len(rules)) if i not in placed)
+    return [rules[i] for i in order]
+
+
+class IntentValidator:
+    """从框架计划编译得到的验证/补全程序（只读，可跨线程共享）"""
+
+    def __init__(self, plan):
+        """
+        参数:
+            plan: FrameworkPlan
+        """
+        # {类别: ((字段, 验证闭包), ...)}
+        validators: Dict[str, List[Tuple[str, Callable]]] = {}
+        for field in plan.fields:
+            validate = _field_validator(field)
+            if validate is not None:
+                validators.setdefault(field['category'], []).append((field['field'], validate))
+        self.field_validators = tuple(
+            (category, tuple(fields)) for category, fields in validators.items()
+        )
+
+        self.required_fields = tuple(plan.required_fields)
+
+        # 一致性检查：只有列表条件参与判断（单值条件不单独触发，与旧逻辑一致）
+        self.consistency_checks = tuple(
+            (
+                tuple(
+                    (category, field, _membership(values))
+                    for category, field, values in check['when']
+                    if isinstance(values, tuple)
+                ),
+                {
+                    'type': 'consistency_check',
+                    'name': check['name'],
+                    'severity': check['severity'],
+                    'message': check['message'],
+                    'suggestion': check['suggestion'],
+                },
+            )
+            for check in plan.consistency_checks
+        )
+
+        # 依赖程序：没有when或then的规则不会生效，编译时直接去掉
+        self.dependency_program = tuple(
+            (rule['name'], rule['when'], rule['then'])
+            for rule in order_dependencies(
+                r for r in plan.dependencies if r['has_when'] and r['has_then']
+            )
+        )
+
+    # ========== 补全 ==========
+
+    def apply_dependencies(self, intent: Dict) -> Tuple[Dict, List[Tuple[str, Tuple]]]:
+        """
+        执行依赖程序
+
+        返回:
+            (补全后的intent（不修改原始intent）, 生效的规则 [(规则名, then)])
+        """
+        updated = intent.copy()
+        applied = []
+
+        for name, when, then in self.dependency_program:
+            for category, field, value in when:
+                if updated.get(category, {}).get(field) != value:
+                    break
+            else:
+                applied.append((name, then))
+                for category, field, then_value in then:
+                    # 写入前复制该类别，避免修改调用方的intent
+                    section = dict(updated.get(category, {}))
+                    section[field] = then_value
+                    updated[category] = section
+
+        return updated, applied
+
+    # ========== 验证 ==========
+
+    def validate(self, intent: Dict, check_values: bool = False) -> List[Dict]:
+        """
+        验证intent（必选字段、一致性检查，可选字段取值检查）
+
+        参数:
+            intent: intent
+            check_values: 是否检查枚举取值和字段类型
+
+        返回:
+            问题列表
+        """
+        issues = []
+
+        for category, field, error_message in self.required_fields:
+            if category not in intent or field not in intent[category]:
+                issues.append({
+                    'type': 'missing_required',
+                    'field': f"{category}.{field}",
+                    'severity': 'error',
+                    'message': error_message
+                })
+
+        for conditions, issue in self.consistency_checks:
+            for category, field, contains in conditions:
+                if contains(intent.get(category, {}).get(field)):
+                    issues.append(dict(issue))
+
+        if check_values:
+            for category, fields in self.field_validators:
+                section = intent.get(category)
+                if not isinstance(section, dict):
+                    continue
+                for field, validate in fields:
+                    if field in section:
+                        issue = validate(section[field])
+                        if issue is not None:
+                            issues.append(issue)
+
+        return issues
+
+    def run(self, intent: Dict, check_values: bool = True) -> Tuple[Dict, List[Dict]]:
+        """补全 + 验证（返回 (补全后的intent, 问题列表)）"""
+        complete_intent, _ = self.apply_dependencies(intent)
+        return complete_intent, self.validate(complete_intent, check_values)
+
+    # ========== 批量 ==========
+
+    def validate_batch(self, intents: Iterable[Dict], check_values: bool = True,
+                       keep_results: bool = False) -> Dict:
+        """
+        批量补全并验证
+
+        参数:
+            intents: intent序列
+            check_values: 是否检查枚举取值和字段类型
+            keep_results: 是否在结果中保留每个intent的问题列表
+
+        返回:
+            {
+                'total', 'valid', 'invalid', 'elapsed_ms',
+                'issue_counts': {问题类型或检查名: 数量},
+                'results': [{'index', 'issues'}]（仅keep_results时，只含有问题的intent）
+            }
+        """
+        start = time.perf_counter()
+        total = invalid = 0
+        issue_counts: Dict[str, int] = {}
+        results = []
+
+        for index, intent in enumerate(intents):
+            total += 1
+            if not isinstance(intent, dict):
+                issues = [{'type': 'invalid_intent', 'severity': 'error',
+                           'message': f"intent 应该是对象，实际为 {type(intent).__name__}"}]
+            else:
+                _, issues = self.run(intent, check_values)
+
+            if issues:
+                invalid += 1
+                for issue in issues:
+                    key = issue.get('name') or issue['type']
+                    issue_counts[key] = issue_counts.get(key, 0) + 1
+                if keep_results:
+                    results.append({'index': index, 'issues': issues})
+
+        report = {
+            'total': total,
+            'valid': total - invalid,
+            'invalid': invalid,
+            'elapsed_ms': (time.perf_counter() - start) * 1000,
+            'issue_counts': issue_counts,
+        }
+        if keep_results:
+            report['results'] = results
+        return report
+
+    def validate_jsonl(self, path: str, check_values: bool = True,
+                       keep_results: bool = False) -> Dict:
+        """
+        批量验证JSONL语料（每行一个intent，或带 'intent' 键的对象；空行跳过）
+
+        无法解析的行按 invalid_intent 计入。
+        """
+        def records():
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        yield None
+                        continue
+                    if isinstance(record, dict) and isinstance(record.get('intent'), dict):
+                        record = record['intent']
+                    yield record
+
+        return self.validate_batch(records(), check_values, keep_results)
+
+
+if __name__ == '__main__':
+    from .constants import DEFAULT_FRAMEWORK_PATH
+    from .framework_plan import load_plan
+
+    if len(sys.argv) < 2:
+        print("用法: python -m skill_library.intent_validator corpus.jsonl [framework_path]")
+        sys.exit(1)
+
+    framework_path = sys.argv[2] if len(sys.argv) > 2 else DEFAULT_FRAMEWORK_PATH
+    report = load_plan(framework_path).validator.validate_jsonl(sys.argv[1])
+
+    print(f"✅ 验证 {report['total']} 个intent，耗时 {report['elapsed_ms']:.1f}ms")
+    print(f"  通过: {report['valid']}  有问题: {report['invalid']}")
+    for key, count in sorted(report['issue_counts'].items(), key=lambda kv: -kv[1]):
+        print(f"  - {key}: {count}")
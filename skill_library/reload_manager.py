@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+框架/知识库热加载
+Hot reload of the compiled framework plan and knowledge tables
+
+修改 prompt_framework.yaml 或知识库原本需要重启MCP服务器，连接和缓存都会丢失。
+ReloadManager 在后台线程中轮询文件 mtime，变化时重新编译框架计划和一致性规则，
+组成新的 PlanSnapshot 后整体替换（单次引用赋值）。正在执行的请求持有旧快照的
+引用，会在旧计划上执行完；之后的请求读取到新快照。
+
+知识库覆盖文件（可选，YAML）的顶层键与 default_knowledge() 相同：
+字典类型的表按键合并，其他类型整体替换。新的颜色/服装/光影词会追加到规则
+引擎的特征词表；编译后的规则逐词自检（RuleEngine.verify），有不起作用的词时
+拒绝这次加载，继续使用旧快照。
+"""
+
+import hashlib
+import os
+import sys
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+import yaml
+
+from .constants import DEFAULT_FRAMEWORK_PATH, DEFAULT_KNOWLEDGE_PATH
+from .framework_plan import FrameworkPlan, load_plan
+from .intelligent_generator import default_knowledge
+
+try:
+    from yaml import CSafeLoader as _YamlLoader
+except ImportError:
+    from yaml import SafeLoader as _YamlLoader
+
+
+DEFAULT_POLL_INTERVAL = 2.0
+
+_knowledge_cache: Dict[str, Tuple[Optional[Tuple[int, int]], str, Dict]] = {}
+_knowledge_lock = threading.Lock()
+
+
+def _file_stamp(path: Optional[str]) -> Optional[Tuple[int, int]]:
+    """文件的 (mtime, size)；不存在时为None"""
+    try:
+        stat = os.stat(path)
+    except (OSError, TypeError):
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def merge_knowledge(base: Dict, overrides: Dict) -> Dict:
+    """把覆盖表合并到知识库（字典按键合并，集合类型保持为集合）"""
+    merged = dict(base)
+    for key, value in (overrides or {}).items():
+        current = merged.get(key)
+        if isinstance(current, dict) and isinstance(value, dict):
+            merged[key] = {**current, **value}
+        elif isinstance(current, set):
+            merged[key] = set(value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def load_knowledge_file(path: Optional[str] = DEFAULT_KNOWLEDGE_PATH) -> Tuple[Dict, str]:
+    """
+    加载知识库（内置表 + 可选的覆盖文件），按文件 (mtime, size) 缓存
+
+    返回:
+        (知识库, 指纹)；没有覆盖文件时指纹为 'builtin'
+    """
+    stamp = _file_stamp(path)
+    key = os.path.abspath(path) if path else ''
+
+    cached = _knowledge_cache.get(key)
+    if cached is not None and cached[0] == stamp:
+        return cached[2], cached[1]
+
+    with _knowledge_lock:
+        if stamp is None:
+            knowledge, fingerprint = default_knowledge(), 'builtin'
+        else:
+            with open(path, 'rb') as f:
+                content = f.read()
+            overrides = yaml.load(content.decode('utf-8'), Loader=_YamlLoader) or {}
+            knowledge = merge_knowledge(default_knowledge(), overrides)
+            fingerprint = hashlib.sha1(content).hexdigest()[:16]
+
+        _knowledge_cache[key] = (stamp, fingerprint, knowledge)
+        return knowledge, fingerprint
+
+
+class PlanSnapshot:
+    """一次加载得到的框架计划 + 知识库 + 规则引擎（整体替换，不会部分更新）"""
+
+    __slots__ = ('version', 'framework_plan', 'knowledge', 'knowledge_fingerprint',
+                 'rule_engine', 'loaded_at')
+
+    def __init__(self, version: int, framework_plan: FrameworkPlan, knowledge: Dict,
+                 knowledge_fingerprint: str):
+        from .consistency_rules import RuleEngine
+
+        self.version = version
+        self.framework_plan = framework_plan
+        self.knowledge = knowledge
+        self.knowledge_fingerprint = knowledge_fingerprint
+        self.rule_engine = RuleEngine(knowledge)
+        self.loaded_at = time.time()
+
+        # 知识库中的每个词都必须能触发对应规则（否则拒绝这次加载）
+        problems = self.rule_engine.verify()
+        if problems:
+            raise ValueError("知识库规则不起作用: " + "; ".join(problems))
+
+    @property
+    def tag(self) -> str:
+        """可读的计划版本标识"""
+        return f"{self.version}:{self.framework_plan.fingerprint}:{self.knowledge_fingerprint}"
+
+
+class ReloadManager:
+    """轮询框架/知识库文件，变化时在后台重新编译并原子替换快照"""
+
+    def __init__(self, framework_path: str = DEFAULT_FRAMEWORK_PATH,
+                 knowledge_path: Optional[str] = DEFAULT_KNOWLEDGE_PATH,
+                 interval: float = DEFAULT_POLL_INTERVAL):
+        """
+        参数:
+            framework_path: 框架配置文件路径
+            knowledge_path: 知识库覆盖文件路径（不存在时使用内置知识库）
+            interval: 轮询间隔（秒）
+        """
+        self.framework_path = framework_path
+        self.knowledge_path = knowledge_path
+        self.interval = interval
+
+        self.reloads = 0
+        self.last_error: Optional[str] = None
+        self.last_checked: Optional[float] = None
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self._stamps = self._current_stamps()
+        self._snapshot = self._build(version=1)
+
+    # ========== 快照 ==========
+
+    @property
+    def snapshot(self) -> PlanSnapshot:
+        """当前快照（调用方在一次请求内应只读取一次并持有引用）"""
+        return self._snapshot
+
+    def _current_stamps(self) -> Tuple:
+        return _file_stamp(self.framework_path), _file_stamp(self.knowledge_path)
+
+    def _build(self, version: int) -> PlanSnapshot:
+        plan = load_plan(self.framework_path)
+        knowledge, fingerprint = load_knowledge_file(self.knowledge_path)
+        return PlanSnapshot(version, plan, knowledge, fingerprint)
+
+    def check(self) -> bool:
+        """
+        检查文件是否变化，变化时重新编译并替换快照
+
+        编译失败时保留旧快照并记录错误。
+
+        返回:
+            是否替换了快照
+        """
+        with self._lock:
+            self.last_checked = time.time()
+            stamps = self._current_stamps()
+            if stamps == self._stamps:
+                return False
+
+            try:
+                snapshot = self._build(version=self._snapshot.version + 1)
+            except Exception as e:
+                self.last_error = f"{type(e).__name__}: {e}"
+                print(f"⚠️ 重新加载框架/知识库失败，继续使用版本 {self._snapshot.version}: {self.last_error}",
+                      file=sys.stderr)
+                # 文件再次变化前不重复尝试
+                self._stamps = stamps
+                return False
+
+            self._stamps = stamps
+            self._snapshot = snapshot
+            self.reloads += 1
+            self.last_error = None
+            print(f"✓ 已重新加载框架/知识库（版本 {snapshot.tag}）", file=sys.stderr)
+            added = snapshot.rule_engine.vocabulary.added
+            if added:
+                print(f"  知识库新增特征词: {added}（重新构建特征表前按需提取）", file=sys.stderr)
+            return True
+
+    # ========== 后台轮询 ==========
+
+    def start(self):
+        """启动后台轮询线程（重复调用无效）"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._poll, name='reload-manager', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止后台轮询"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 1)
+            self._thread = None
+
+    def _poll(self):
+        while not self._stop.wait(self.interval):
+            self.check()
+
+    def stats(self) -> Dict:
+        """当前计划版本和重新加载统计"""
+        snapshot = self._snapshot
+        return {
+            'version': snapshot.version,
+            'tag': snapshot.tag,
+            'framework_version': snapshot.framework_plan.framework_version,
+            'framework_fingerprint': snapshot.framework_plan.fingerprint,
+            'knowledge_fingerprint': snapshot.knowledge_fingerprint,
+            'loaded_at': snapshot.loaded_at,
+            'reloads': self.reloads,
+            'polling': self._thread is not None and self._thread.is_alive(),
+            'last_error': self.last_error,
+        }
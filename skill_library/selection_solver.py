@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+一致性约束下的元素选择求解器
+Constraint-aware element selection (bounded beam search)
+
+逐字段独立选择最优元素时，跨字段冲突（人种 vs 眼睛/发色、
+时代 vs 服装/光影）要事后检查再修补。这里把一致性规则作为约束，在各字段
+候选列表上做带剪枝的束搜索，一次得到全局一致的组合。框架驱动生成
+（FrameworkDrivenGenerator.query_by_framework）默认通过它选择，
+ElementSelector.select_from_candidates_dict 在 use_solver=True 时使用它：
+
+- 目标：总匹配分最大（违反约束按惩罚扣分，硬约束惩罚远大于任何匹配分）
+- 时间预算：超时后把束中的部分解贪心补全，返回目前为止最好的结果
+"""
+
+import time
+from typing import Dict, List, Optional, Tuple
+
+from .consistency_rules import ETHNICITY_NAMES, CompatibilityMatrix
+from .intelligent_generator import default_knowledge
+
+
+# 违反约束的惩罚分（匹配分范围是0-100）
+HARD_PENALTY = 1000.0
+SOFT_PENALTY = 30.0
+
+# 规则 → 惩罚分（未列出的规则按硬约束处理）
+RULE_PENALTIES = {
+    'ethnicity_hair_mismatch': SOFT_PENALTY,
+}
+
+# 框架字段 → 数据库类别（元素本身没有category时使用）
+FIELD_CATEGORIES = {
+    'facial.eyes': 'eye_types',
+    'styling.hair_color': 'hair_colors',
+    'styling.clothing': 'clothing_styles',
+    'lighting.lighting_type': 'lighting_techniques',
+    'subject.ethnicity': 'ethnicity',
+}
+
+
+class SelectionSolver:
+    """在各字段候选上求解满足一致性约束的最优组合"""
+
+    def __init__(self, intent: Dict, knowledge: Optional[Dict] = None,
+                 beam_width: int = 8, max_candidates: int = 24,
+                 time_budget: float = 0.05,
+                 compatibility: Optional[CompatibilityMatrix] = None):
+        """
+        参数:
+            intent: 用户意图（支持框架格式 scene.era 和旧格式 era）
+            knowledge: 常识知识库（默认使用内置知识库），规则通过特征位测试判断
+            beam_width: 束宽
+            max_candidates: 每个字段参与搜索的候选数上限（按局部得分截断）
+            time_budget: 搜索时间预算（秒）
+            compatibility: 可选，复用已有的兼容性位图（如生成器已加载的特征表）
+        """
+        self.knowledge = knowledge or default_knowledge()
+        self.compatibility = compatibility or CompatibilityMatrix(self.knowledge)
+        self.beam_width = max(1, beam_width)
+        self.max_candidates = max(1, max_candidates)
+        self.time_budget = time_budget
+
+        self.ethnicity = intent.get('subject', {}).get('ethnicity')
+        scene = intent.get('scene', {})
+        self.era = scene.get('era') if isinstance(scene, dict) and scene.get('era') else intent.get('era')
+
+    # ========== 约束 ==========
+
+    @staticmethod
+    def _category(field: str, element: Dict) -> str:
+        return element.get('category') or FIELD_CATEGORIES.get(field, field)
+
+    def _violations(self, category: str, element: Dict, ethnicity: Optional[str],
+                    era: Optional[str]) -> List[Tuple[str, float]]:
+        rule = self.compatibility.element_conflict(element, ethnicity, era, category)
+        if rule is None:
+            return []
+        return [(rule, RULE_PENALTIES.get(rule, HARD_PENALTY))]
+
+    def unary_violations(self, field: str, element: Dict) -> List[Tuple[str, float]]:
+        """单个元素相对于intent违反的约束 [(规则名, 惩罚分)]"""
+        return self._violations(self._category(field, element), element, self.ethnicity, self.era)
+
+    def pair_violations(self, field_a: str, elem_a: Dict,
+                        field_b: str, elem_b: Dict) -> List[Tuple[str, float]]:
+        """两个已选元素之间的冲突 [(规则名, 惩罚分)]"""
+        violations = []
+
+        if elem_a.get('element_id') and elem_a.get('element_id') == elem_b.get('element_id'):
+            violations.append(('duplicate', HARD_PENALTY))
+
+        # intent未指定人种时，用已选的人种元素约束眼睛/发色
+        if not self.ethnicity:
+            for eth_field, eth_elem, other_field, other_elem in (
+                (field_a, elem_a, field_b, elem_b),
+                (field_b, elem_b, field_a, elem_a),
+            ):
+                if self._category(eth_field, eth_elem) == 'ethnicity':
+                    ethnicity = ETHNICITY_NAMES.get((eth_elem.get('name') or '').lower())
+                    if ethnicity:
+                        violations.extend(self._violations(
+                            self._category(other_field, other_elem), other_elem, ethnicity, None
+                        ))
+
+        return violations
+
+    def _pair_penalty(self, field: str, element: Dict, picks: Tuple) -> float:
+        return sum(penalty
+                   for other_field, other_elem in picks
+                   for _, penalty in self.pair_violations(field, element, other_field, other_elem))
+
+    # ========== 搜索 ==========
+
+    def solve(self, scored_candidates: Dict[str, List[Tuple[Dict, float]]]) -> Dict:
+        """
+        求解
+
+        参数:
+            scored_candidates: {field: [(元素, 匹配分), ...]}
+
+        返回:
+            {
+                'selected': {field: 元素}（按 scored_candidates 的字段顺序）,
+                'score': 匹配分总和,
+                'violations': [{'field', 'element_id', 'rule'}, ...],
+                'complete': 是否在时间预算内完成搜索,
+                'expanded': 扩展的状态数,
+                'elapsed': 耗时（秒）
+            }
+        """
+        start = time.perf_counter()
+        deadline = start + self.time_budget if self.time_budget is not None else None
+
+        # 局部得分 = 匹配分 - 单元素约束惩罚；每字段按局部得分截断候选
+        local = {}
+        for field, candidates in scored_candidates.items():
+            ranked = [
+                (elem, score, score - sum(p for _, p in self.unary_violations(field, elem)))
+                for elem, score in candidates
+            ]
+            ranked.sort(key=lambda item: item[2], reverse=True)
+            if ranked:
+                local[field] = ranked[:self.max_candidates]
+
+        # 候选少的字段先搜索（约束更紧）
+        fields = sorted(local, key=lambda f: len(local[f]))
+
+        # 剩余字段的局部得分上界，用于剪枝
+        remaining_bound = [0.0] * (len(fields) + 1)
+        for i in range(len(fields) - 1, -1, -1):
+            remaining_bound[i] = remaining_bound[i + 1] + local[fields[i]][0][2]
+
+        # 贪心解作为初始的最好结果（任何时刻都有可返回的解）
+        best_value, best_picks = self._complete(0.0, (), fields, 0, local)
+        expanded = 0
+        complete = True
+
+        beam = [(0.0, ())]
+        for depth, field in enumerate(fields):
+            if deadline is not None and time.perf_counter() > deadline:
+                complete = False
+                break
+
+            next_beam = []
+            for value, picks in beam:
+                for elem, _, local_score in local[field]:
+                    expanded += 1
+                    new_value = value + local_score - self._pair_penalty(field, elem, picks)
+
+                    # 上界不超过当前最好结果的分支直接剪掉
+                    if new_value + remaining_bound[depth + 1] <= best_value:
+                        continue
+                    next_beam.append((new_value, picks + ((field, elem),)))
+
+            if not next_beam:
+                beam = []
+                break
+
+            next_beam.sort(key=lambda item: item[0], reverse=True)
+            beam = next_beam[:self.beam_width]
+
+        # 完整解直接比较；超时的部分解贪心补全
+        for value, picks in beam:
+            if len(picks) < len(fields):
+                value, picks = self._complete(value, picks, fields, len(picks), local)
+            if value > best_value:
+                best_value, best_picks = value, picks
+
+        return self._build_result(list(scored_candidates), best_picks, local, complete, expanded, start)
+
+    def _complete(self, value: float, picks: Tuple, fields: List[str],
+                  depth: int, local: Dict) -> Tuple[float, Tuple]:
+        """从depth开始逐字段贪心补全部分解"""
+        for field in fields[depth:]:
+            best = None
+            for elem, _, local_score in local[field]:
+                candidate_value = value + local_score - self._pair_penalty(field, elem, picks)
+                if best is None or candidate_value > best[0]:
+                    best = (candidate_value, elem)
+            value = best[0]
+            picks = picks + ((field, best[1]),)
+        return value, picks
+
+    def _build_result(self, field_order: List[str], picks: Tuple, local: Dict, complete: bool,
+                      expanded: int, start: float) -> Dict:
+        picked = dict(picks)
+        # 搜索按候选数排序字段，结果恢复调用方的字段顺序
+        selected = {field: picked[field] for field in field_order if field in picked}
+        score = 0.0
+        violations = []
+
+        for i, (field, elem) in enumerate(picks):
+            score += next(s for e, s, _ in local[field] if e is elem)
+
+            rules = [rule for rule, _ in self.unary_violations(field, elem)]
+            for other_field, other_elem in picks[:i]:
+                rules.extend(rule for rule, _ in self.pair_violations(field, elem, other_field, other_elem))
+
+            for rule in rules:
+                violations.append({'field': field, 'element_id': elem.get('element_id'), 'rule': rule})
+
+        return {
+            'selected': selected,
+            'score': score,
+            'violations': violations,
+            'complete': complete,
+            'expanded': expanded,
+            'elapsed': time.perf_counter() - start
+        }